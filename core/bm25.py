@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Letters/digits runs, lowercased; keeps acronyms and codes like "PL2630" or "ODS" intact.
+_RE_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased index terms; drops 1-char tokens and short numbers (list markers, page refs)."""
+    return [
+        t for t in _RE_TERM.findall((text or "").lower())
+        if len(t) >= 2 and (len(t) >= 4 or not t.isdigit())
+    ]
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    postings maps term -> (doc indices, term frequencies) as NumPy arrays, so a query
+    costs one vectorized update per query term instead of a pass over every document.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = float(k1)
+        self.b = float(b)
+
+        lengths: List[int] = []
+        acc: Dict[str, Tuple[List[int], List[int]]] = {}
+        for i, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                docs, tfs = acc.setdefault(term, ([], []))
+                docs.append(i)
+                tfs.append(tf)
+
+        self.n_docs = len(lengths)
+        self.doc_len = np.asarray(lengths, dtype=np.float32)
+        self.avgdl = float(self.doc_len.mean()) if self.n_docs else 0.0
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            t: (np.asarray(d, dtype=np.int32), np.asarray(f, dtype=np.float32)) for t, (d, f) in acc.items()
+        }
+        # Length normalization is per document; precompute it once.
+        self._norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-9))
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings[term][0]) if term in self.postings else 0
+        return math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros((self.n_docs,), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tf = posting
+            out[docs] += self.idf(term) * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+        return out
+
+    def scores_in_range(self, query: str, start: int, end: int) -> np.ndarray:
+        """scores() for rows [start, end) only; postings are clipped to the range, rows outside aren't touched."""
+        out = np.zeros((max(0, end - start),), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tf = posting
+            # Postings are in row order, so the range is one contiguous slice.
+            lo, hi = np.searchsorted(docs, (start, end))
+            if lo == hi:
+                continue
+            docs, tf = docs[lo:hi], tf[lo:hi]
+            out[docs - start] += self.idf(term) * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+        return out
+
+    def search(
+        self, query: str, k: int, ranges: Optional[Sequence[Tuple[int, int]]] = None
+    ) -> List[Tuple[int, float]]:
+        """Return (row_index, bm25_score) for the top-k documents with a positive score.
+
+        ranges, if given, restricts scoring to those half-open row ranges (IDF stays corpus-wide).
+        """
+        if self.n_docs == 0:
+            return []
+        if ranges is None:
+            s = self.scores(query)
+            hits = np.flatnonzero(s > 0)
+            scores = s[hits]
+        else:
+            parts = [(self.scores_in_range(query, a, b), a) for a, b in ranges]
+            hit_parts = [np.flatnonzero(r > 0) for r, _ in parts]
+            hits = np.concatenate([h + a for h, (_, a) in zip(hit_parts, parts)] or [np.zeros((0,), np.int64)])
+            scores = np.concatenate([r[h] for h, (r, _) in zip(hit_parts, parts)] or [np.zeros((0,), np.float32)])
+        if hits.size == 0:
+            return []
+        k = min(int(max(1, k)), hits.size)
+        order = np.argpartition(-scores, kth=k - 1)[:k]
+        order = order[np.argsort(-scores[order])]
+        return [(int(hits[i]), float(scores[i])) for i in order]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked lists of ids: score(id) = sum_i w_i / (k + rank_i(id)), best first."""
+    fused: Dict[Hashable, float] = {}
+    for n, ranking in enumerate(rankings):
+        w = float(weights[n]) if weights is not None else 1.0
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + w / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def _hit_key(h: Dict) -> Hashable:
+    if h.get("id") is not None:
+        return str(h["id"])
+    return (str(h.get("document_id")), h.get("path"), (h.get("content") or "")[:200])
+
+
+def fuse_hits(ranked_hits: Sequence[Sequence[Dict]], limit: int, k: int = 60) -> List[Dict]:
+    """RRF over RPC result lists (dicts keyed by section id); keeps the first copy of each row
+    and records the fused score as `rrf_score`."""
+    rows: Dict[Hashable, Dict] = {}
+    rankings: List[List[Hashable]] = []
+    for hits in ranked_hits:
+        keys: List[Hashable] = []
+        for h in hits or []:
+            if not isinstance(h, dict):
+                continue
+            key = _hit_key(h)
+            rows.setdefault(key, h)
+            keys.append(key)
+        rankings.append(keys)
+    fused = reciprocal_rank_fusion(rankings, k=k)[: int(limit)]
+    return [{**rows[key], "rrf_score": score} for key, score in fused]
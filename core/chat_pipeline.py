@@ -0,0 +1,648 @@
+"""The chat answer path, independent of Streamlit.
+
+run_chat() takes one user message through validation, rate limiting, retrieval (vector +
+lexical, rerank, MMR, token packing) and generation, saves both messages and returns a
+ChatResult. Progress is reported through an optional `emit(kind, data)` callback so a UI,
+an HTTP stream or a load generator can follow along:
+
+    accepted    {"lang": ...}              checks passed, the user message is saved
+    generating  {"sources": n}             retrieval done, Claude is being called
+    delta       "text"                     streamed answer text (only when stream=True)
+    reset       None                       discard streamed text (model fallback after a partial answer)
+    done        ChatResult                 always last
+
+Clients are passed in (ChatClients), so the OpenAI/Anthropic endpoints can be swapped;
+Supabase access goes through core.supabase_client.
+
+Identical questions asked at the same time (same normalized prompt, language, settings,
+recent history and document filter) share one retrieval + generation run (core.singleflight);
+followers replay the leader's generating/delta/reset events and get their own accepted/done.
+Set CHAT_COALESCE=0 to disable.
+"""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .bm25 import fuse_hits
+from .context_packer import ContextPack, pack_context
+from .env_validator import get_required_env
+from .llm import (
+    add_usage,
+    chat_system_prompt,
+    detect_user_language,
+    is_language_mismatch,
+    lexical_overlap_count_tokens,
+    overlap_tokens,
+    system_blocks,
+    usage_dict,
+)
+from .mmr import diversify_hits
+from .model_settings import DEFAULTS, get_model_settings
+from .rate_limiter import check_rate_limit
+from .rerank import rerank_hits
+from .singleflight import SingleFlight
+from .supabase_client import create_event, rpc_match_sections, rpc_match_sections_lexical, svc
+from .tracing import finish_trace, set_trace_attrs, span, start_trace, traced
+
+log = logging.getLogger(__name__)
+
+MAX_PROMPT_LENGTH = 4000
+MAX_MESSAGE_HISTORY_CHARS = 500
+MIN_PROMPT_LENGTH_FOR_OVERLAP = 40
+MIN_LEXICAL_OVERLAP = 2
+MIN_LEXICAL_OVERLAP_SHORT = 1
+MAX_TITLE_LENGTH = 50
+RECENT_USER_MESSAGES = 2
+RECENT_ASSISTANT_MESSAGES = 1
+RATE_LIMIT_MESSAGES_PER_MINUTE = 10
+RATE_LIMIT_WINDOW_SECONDS = 60
+CHAT_COALESCE = os.environ.get("CHAT_COALESCE", "1").strip().lower() not in ("0", "false", "no")
+
+Emit = Callable[[str, Any], None]
+
+_WEB_SEARCH_RE = re.compile(
+    r"\b(busca\s+na\s+web|pesquis(a|ar)\s+na\s+web|buscar\s+na\s+internet|pesquis(a|ar)\s+na\s+internet|web\s+search|browse\s+the\s+web|buscar\s+en\s+la\s+web|buscar\s+en\s+internet|búsqueda\s+en\s+la\s+web)\b",
+    re.IGNORECASE,
+)
+
+# --- Response mode switching (narrative-first vs structured summary) ---
+_STRUCTURED_TRIGGERS = re.compile(
+    r"\b(checklist|bullet|bullets|framework|tl;dr|tldr|summary|summarize|key points|in points)\b",
+    re.IGNORECASE,
+)
+
+_WEB_SEARCH_ANSWERS = {
+    "pt": (
+        "Consigo te ajudar a formular a busca, mas este chat (no app) não faz navegação na web em tempo real. "
+        "Se você me disser o que quer encontrar, eu monto as melhores consultas, fontes recomendadas e critérios de verificação — "
+        "ou posso responder com base nos documentos que você enviou."
+    ),
+    "es": (
+        "Puedo ayudarte a formular la búsqueda, pero este chat (en la app) no navega la web en tiempo real. "
+        "Si me dices qué quieres encontrar, preparo las mejores consultas, fuentes recomendadas y criterios de verificación — "
+        "o puedo responder basándome en los documentos que subiste."
+    ),
+    "en": (
+        "I can help you craft the web search, but this in-app chat doesn't browse the web in real time. "
+        "Tell me what you want to find and I’ll propose the best queries, sources to check, and verification steps — "
+        "or I can answer based on the documents you uploaded."
+    ),
+}
+
+_NO_SOURCES_ANSWERS = {
+    "pt": (
+        "Não encontrei informações relevantes nos documentos enviados para responder a isso. "
+        "Tente reformular a pergunta ou envie um documento que trate desse tema."
+    ),
+    "es": (
+        "No encontré información relevante en los documentos cargados para responder eso. "
+        "Intenta reformular tu pregunta o sube un documento que cubra este tema."
+    ),
+    "en": (
+        "I couldn’t find relevant information in the uploaded documents to answer that. "
+        "Try rephrasing your question or upload a document that covers this topic."
+    ),
+}
+
+
+@dataclass
+class ChatClients:
+    oai: Any  # openai.OpenAI-compatible: embeddings.create
+    claude: Any  # anthropic.Anthropic-compatible: messages.create / messages.stream
+
+    @classmethod
+    def from_env(cls) -> "ChatClients":
+        from anthropic import Anthropic
+        from openai import OpenAI
+
+        return cls(
+            oai=OpenAI(api_key=get_required_env("OPENAI_API_KEY", "OpenAI API key for embeddings")),
+            claude=Anthropic(api_key=get_required_env("ANTHROPIC_API_KEY", "Anthropic API key for Claude")),
+        )
+
+
+@dataclass
+class ChatRequest:
+    user_id: str
+    conversation_id: str
+    prompt: str
+    # Earlier messages of the conversation ({"role", "content"}), oldest first
+    history: Sequence[Dict[str, Any]] = ()
+    # Language the conversation settled on so far (sticky PT/ES)
+    prev_lang: Optional[str] = None
+    filter_document_ids: Optional[List[str]] = None
+
+
+@dataclass
+class ChatResult:
+    # ok | rejected | rate_limited | canned | no_sources
+    status: str
+    answer: str = ""
+    lang: str = "en"
+    error: Optional[str] = None
+    # Seconds until the rate limit window frees up (rate_limited only)
+    retry_after: Optional[int] = None
+    sources: List[str] = field(default_factory=list)
+    packed: Optional[ContextPack] = None
+    model: Optional[str] = None
+    prompt_version: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe form for HTTP responses."""
+        packed = self.packed
+        return {
+            "status": self.status,
+            "answer": self.answer,
+            "lang": self.lang,
+            "error": self.error,
+            "retry_after": self.retry_after,
+            "sources": self.sources,
+            "model": self.model,
+            "prompt_version": self.prompt_version,
+            "usage": self.usage,
+            "context_tokens": packed.tokens_used if packed else 0,
+        }
+
+
+class GenerationError(RuntimeError):
+    """Every configured Claude model failed."""
+
+
+def _noop(kind: str, data: Any) -> None:
+    return None
+
+
+_flights: SingleFlight = SingleFlight()
+
+
+# ---------------- Helpers ----------------
+
+def mode_hint(user_text: str) -> str:
+    if _STRUCTURED_TRIGGERS.search(user_text or ""):
+        return (
+            "[MODE: STRUCTURED_SUMMARY]\n"
+            "Use headings and bullet points. Keep it concise and scannable.\n\n"
+        )
+    return (
+        "[MODE: NARRATIVE_FIRST]\n"
+        "Write in connected paragraphs with context and reasoning. "
+        "Avoid bullet points unless explicitly requested.\n\n"
+    )
+
+
+def recent_history_block(msgs: Sequence[Dict[str, Any]]) -> str:
+    """
+    A tiny tail of recent turns to preserve local coherence without resurfacing early-topic
+    assistant content: last N user messages + last M assistant messages, each capped.
+    """
+    recent_turns: List[str] = []
+    user_kept = 0
+    assistant_kept = 0
+
+    for m in reversed(msgs or []):
+        role = (m.get("role") or "").strip().lower()
+        content = (m.get("content") or "").strip()
+        if not content or role not in ("user", "assistant"):
+            continue
+
+        if role == "user":
+            if user_kept >= RECENT_USER_MESSAGES:
+                continue
+            user_kept += 1
+        else:
+            if assistant_kept >= RECENT_ASSISTANT_MESSAGES:
+                continue
+            assistant_kept += 1
+
+        if len(content) > MAX_MESSAGE_HISTORY_CHARS:
+            content = content[:MAX_MESSAGE_HISTORY_CHARS - 3].rstrip() + "…"
+        recent_turns.append(f"{role.upper()}: {content}")
+
+        if user_kept >= RECENT_USER_MESSAGES and assistant_kept >= RECENT_ASSISTANT_MESSAGES:
+            break
+
+    return "\n".join(reversed(recent_turns))
+
+
+def answer_language(prompt: str, prev_lang: Optional[str]) -> str:
+    # Sticky language: if we previously established PT/ES and the detector falls back to EN
+    # on a short prompt, keep the previous language unless the user clearly switches.
+    detected = detect_user_language(prompt)
+    if prev_lang in ("pt", "es") and detected == "en":
+        return prev_lang
+    return detected
+
+
+def truncate_title(s: str, max_len: int = MAX_TITLE_LENGTH) -> str:
+    s = " ".join((s or "").strip().split())
+    if not s:
+        return "Chat"
+    if len(s) <= max_len:
+        return s
+    return s[: max_len - 1].rstrip() + "…"
+
+
+def maybe_autotitle_conversation(conversation_id: str, prompt: str) -> None:
+    """If the conversation title is still the default ('Chat'), use the first user prompt."""
+    try:
+        row = svc.table("conversations").select("title").eq("id", conversation_id).limit(1).execute().data
+        if not row:
+            return
+        if (row[0].get("title") or "").strip().lower() != "chat":
+            return  # already titled
+        new_title = truncate_title(prompt, MAX_TITLE_LENGTH)
+        if new_title.lower() == "chat":
+            return
+        svc.table("conversations").update({"title": new_title}).eq("id", conversation_id).execute()
+    except Exception:
+        # Never block chat if titling fails
+        return
+
+
+@traced("openai.embed_query")
+def embed_query(oai: Any, q: str, embed_model: str) -> List[float]:
+    resp = oai.embeddings.create(model=embed_model, input=q)
+    return resp.data[0].embedding
+
+
+@traced("supabase.save_message")
+def save_message(conversation_id: str, role: str, content: str) -> None:
+    svc.table("messages").insert({
+        "conversation_id": conversation_id,
+        "role": role,
+        "content": content,
+    }).execute()
+
+
+# ---------------- Stages ----------------
+
+def retrieve_context(
+    clients: ChatClients,
+    settings: Dict[str, Any],
+    prompt: str,
+    filter_document_ids: Optional[List[str]] = None,
+) -> ContextPack:
+    """Vector + lexical hits → rerank → MMR → overlap filter → token-budgeted context."""
+    top_k = int(settings["top_k"])
+    # With a reranker, pull a larger pool and let it pick the top_k.
+    n_candidates = top_k if settings["rerank_method"] == "none" else max(top_k, int(settings["rerank_candidates"]))
+    q_emb = embed_query(clients.oai, prompt, settings["embedding_model"])
+    hits = rpc_match_sections(q_emb, k=n_candidates, filter_document_ids=filter_document_ids)
+
+    # Similarity threshold
+    if isinstance(hits, list) and settings.get("min_score", 0.0) > 0:
+        ms = float(settings["min_score"])
+        filtered = []
+        for h in hits:
+            if not isinstance(h, dict):
+                continue
+            sim = h.get("similarity")
+            try:
+                if sim is None or float(sim) >= ms:
+                    filtered.append(h)
+            except Exception:
+                filtered.append(h)
+        hits = filtered
+
+    # Hybrid retrieval: full-text hits catch exact terms (acronyms, program names) that the
+    # embedding misses; both rankings are merged with reciprocal rank fusion.
+    try:
+        lexical_hits = rpc_match_sections_lexical(prompt, k=n_candidates, filter_document_ids=filter_document_ids)
+    except Exception as e:
+        # Answer from the dense hits alone, but visibly: logged and on the trace.
+        log.warning("match_sections_lexical failed, using dense hits only: %s", e)
+        set_trace_attrs(lexical_error=f"{type(e).__name__}: {e}")
+        lexical_hits = []
+    if lexical_hits:
+        hits = fuse_hits([hits or [], lexical_hits], limit=n_candidates)
+
+    with span("rerank", method=settings["rerank_method"]) as sp:
+        hits, rerank_info = rerank_hits(
+            prompt,
+            [h for h in hits or [] if isinstance(h, dict)],
+            settings["rerank_method"],
+            limit=n_candidates,
+            budget_ms=int(settings["rerank_budget_ms"]),
+        )
+        sp.update(candidates=rerank_info["candidates"], over_budget=rerank_info["over_budget"])
+    # Spend the context budget on diverse evidence: MMR + near-duplicate drop.
+    with span("mmr"):
+        hits = diversify_hits(hits, q_emb, limit=top_k, lambda_=float(settings["mmr_lambda"]))
+
+    candidates = []
+    prompt_tokens = overlap_tokens(prompt)
+    # For very short prompts, allow small overlap; otherwise require more.
+    min_overlap = MIN_LEXICAL_OVERLAP_SHORT if len(prompt.strip()) < MIN_PROMPT_LENGTH_FOR_OVERLAP else MIN_LEXICAL_OVERLAP
+
+    for i, h in enumerate(hits or [], start=1):
+        txt = (h.get("content") or h.get("text") or "").strip()
+        if not txt:
+            continue
+        # Cheap relevance filter to prevent unrelated chunks from dominating.
+        # This helps avoid the model "bringing back" old topics.
+        if lexical_overlap_count_tokens(prompt_tokens, txt, h.get("tokens")) < min_overlap:
+            continue
+
+        path = (h.get("path") or h.get("section_path") or h.get("filename") or "Source").strip()
+        doc_id = h.get("document_id") or h.get("doc_id")
+        header = f"[{i}] {path}"
+        if doc_id:
+            header += f" (doc {str(doc_id)[:8]})"
+        candidates.append((header, txt))
+
+    # Token-budgeted fill: skip what doesn't fit, trim to sentences when there's room left.
+    with span("pack_context") as sp:
+        packed = pack_context(candidates, int(settings.get("max_context_tokens", DEFAULTS["max_context_tokens"])))
+        sp.update(tokens=packed.tokens_used, sources=len(packed.sources))
+    return packed
+
+
+def _complete(clients: ChatClients, stream: bool, emit: Emit, **kwargs: Any) -> Tuple[str, Dict[str, int]]:
+    """One Messages API call; streams text deltas through emit when stream=True."""
+    if not stream:
+        resp = clients.claude.messages.create(**kwargs)
+        return (resp.content[0].text if resp.content else ""), usage_dict(resp)
+    parts: List[str] = []
+    with clients.claude.messages.stream(**kwargs) as s:
+        for text in s.text_stream:
+            parts.append(text)
+            emit("delta", text)
+        final = s.get_final_message()
+    return "".join(parts), usage_dict(final)
+
+
+def generate_answer(
+    clients: ChatClients,
+    settings: Dict[str, Any],
+    prompt: str,
+    lang: str,
+    sources: List[str],
+    history_block: str = "",
+    stream: bool = False,
+    emit: Emit = _noop,
+) -> ChatResult:
+    """Claude over the packed context, with model fallbacks and a PT/ES rewrite pass."""
+    # Interned per (language, style, admin prompt); the hash tags telemetry.
+    sys_prompt, prompt_version = chat_system_prompt(
+        lang, settings.get("answer_style", "concise"), settings["system_prompt"]
+    )
+    ctx = "\n\n".join(sources)
+    user_msg = (
+        mode_hint(prompt)
+        + ("RECENT CHAT (for resolving references only; ignore if unrelated):\n" + history_block + "\n\n" if history_block else "")
+        + f"QUESTION:\n{prompt}\n\n"
+        + "CONTEXT (reference only; do not mirror its formatting):\n"
+        + f"{ctx}\n\n"
+        + "Use the context above as evidence for any factual claims. "
+        + "If the context is insufficient, say what is missing and ask 1 clarifying question."
+    )
+
+    models = settings.get("claude_models") or [
+        DEFAULTS["claude_model_primary"],
+        *DEFAULTS["claude_model_fallbacks"],
+    ]
+
+    # The system prompt only varies by language/style/admin prompt: cache it.
+    system = system_blocks(sys_prompt)
+    usage: Dict[str, int] = {}
+    answer_model = None
+    answer = ""
+    last_err: Optional[Exception] = None
+    streamed = [False]
+
+    def tracking_emit(kind: str, data: Any) -> None:
+        streamed[0] = True
+        emit(kind, data)
+
+    for model in models:
+        try:
+            with span("claude.generate", model=model):
+                answer, u = _complete(
+                    clients,
+                    stream,
+                    tracking_emit,
+                    model=model,
+                    max_tokens=int(settings["claude_max_tokens"]),
+                    temperature=float(settings["claude_temperature"]),
+                    system=system,
+                    messages=[{"role": "user", "content": user_msg}],
+                )
+            usage = add_usage(usage, u)
+            if answer:
+                answer_model = model
+                break
+        except Exception as e:
+            last_err = e
+        if streamed[0]:
+            emit("reset", None)
+            streamed[0] = False
+
+    if not answer:
+        raise GenerationError(f"Claude call failed for models={models}. Last error: {last_err}")
+
+    # If the model drifted into English for PT/ES, do a single rewrite pass.
+    if is_language_mismatch(lang, answer):
+        rewrite_lang = "PT-BR" if lang == "pt" else "ES"
+        rewrite_user = (
+            f"Rewrite the following answer entirely in {rewrite_lang}. "
+            "Do not add new facts. Do not mention protocols or internal rules.\n\n"
+            f"ANSWER TO REWRITE:\n{answer}"
+        )
+        try:
+            with span("claude.rewrite", model=models[0]):
+                resp2 = clients.claude.messages.create(
+                    model=models[0],
+                    max_tokens=int(settings["claude_max_tokens"]),
+                    temperature=0.0,
+                    system=system,
+                    messages=[{"role": "user", "content": rewrite_user}],
+                )
+            usage = add_usage(usage, usage_dict(resp2))
+            rewritten = resp2.content[0].text if resp2.content else ""
+            if rewritten:
+                answer = rewritten
+        except Exception:
+            # If rewrite fails, keep original answer (do not break chat)
+            pass
+
+    return ChatResult(
+        status="ok",
+        answer=answer,
+        lang=lang,
+        sources=list(sources),
+        model=answer_model,
+        prompt_version=prompt_version,
+        usage=usage,
+    )
+
+
+def _answer(
+    clients: ChatClients,
+    settings: Dict[str, Any],
+    prompt: str,
+    lang: str,
+    history_block: str,
+    filter_document_ids: Optional[List[str]],
+    stream: bool,
+    emit: Emit,
+) -> Tuple[ContextPack, Optional[ChatResult]]:
+    """The shareable part of a request: retrieval and generation (None result = no sources)."""
+    packed = retrieve_context(clients, settings, prompt, filter_document_ids)
+    if not packed.sources:
+        return packed, None
+    emit("generating", {"sources": len(packed.sources)})
+    result = generate_answer(clients, settings, prompt, lang, packed.sources, history_block, stream=stream, emit=emit)
+    result.packed = packed
+    return packed, result
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, width and whitespace folded; surrounding punctuation dropped."""
+    t = unicodedata.normalize("NFKC", prompt or "").casefold()
+    return " ".join(t.split()).strip(" .?!¿¡…")
+
+
+def coalesce_key(
+    prompt: str,
+    lang: str,
+    settings: Dict[str, Any],
+    history_block: str = "",
+    filter_document_ids: Optional[List[str]] = None,
+) -> str:
+    """Requests with equal keys get the same answer and can share one execution."""
+    raw = json.dumps(
+        [
+            normalize_prompt(prompt),
+            lang,
+            settings,
+            history_block,
+            sorted(filter_document_ids) if filter_document_ids else None,
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ---------------- Entry point ----------------
+
+def run_chat(
+    clients: ChatClients,
+    request: ChatRequest,
+    settings: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+    emit: Optional[Emit] = None,
+) -> ChatResult:
+    """Answer one message end to end (see module docstring). Raises if every Claude model fails."""
+    emit = emit or _noop
+    settings = settings or get_model_settings()
+    prompt = request.prompt
+    user_id = request.user_id
+    cid = request.conversation_id
+
+    # Per-message timing breakdown (core/tracing.py); stages below add spans to it.
+    start_trace("chat.request", user_id=user_id, conversation_id=cid, prompt_chars=len(prompt))
+
+    def done(result: ChatResult, **attrs: Any) -> ChatResult:
+        finish_trace(status=result.status, lang=result.lang, **attrs)
+        emit("done", result)
+        return result
+
+    if len(prompt) > MAX_PROMPT_LENGTH:
+        return done(ChatResult(
+            status="rejected",
+            lang=request.prev_lang or "en",
+            error=f"Message too long. Please limit your message to {MAX_PROMPT_LENGTH} characters.",
+        ))
+
+    allowed, wait_time = check_rate_limit(
+        user_id=user_id,
+        action="chat_message",
+        max_requests=RATE_LIMIT_MESSAGES_PER_MINUTE,
+        window_seconds=RATE_LIMIT_WINDOW_SECONDS,
+    )
+    if not allowed:
+        return done(ChatResult(
+            status="rate_limited",
+            lang=request.prev_lang or "en",
+            retry_after=wait_time,
+            error=(
+                f"Too many messages. Please wait {wait_time} seconds before sending more messages. "
+                f"(Limit: {RATE_LIMIT_MESSAGES_PER_MINUTE} messages per {RATE_LIMIT_WINDOW_SECONDS} seconds)"
+            ),
+        ))
+
+    lang = answer_language(prompt, request.prev_lang)
+    maybe_autotitle_conversation(cid, prompt)
+    save_message(cid, "user", prompt)
+    emit("accepted", {"lang": lang})
+
+    # Deterministic handling: this app does not do live web browsing.
+    if _WEB_SEARCH_RE.search(prompt):
+        answer = _WEB_SEARCH_ANSWERS.get(lang, _WEB_SEARCH_ANSWERS["en"])
+        save_message(cid, "assistant", answer)
+        return done(ChatResult(status="canned", answer=answer, lang=lang))
+
+    history_block = recent_history_block(request.history)
+    try:
+        if CHAT_COALESCE:
+            key = coalesce_key(prompt, lang, settings, history_block, request.filter_document_ids)
+            (packed, shared_result), coalesced = _flights.do(
+                key,
+                lambda publish: _answer(
+                    clients, settings, prompt, lang, history_block, request.filter_document_ids, stream, publish
+                ),
+                emit,
+            )
+        else:
+            packed, shared_result = _answer(
+                clients, settings, prompt, lang, history_block, request.filter_document_ids, stream, emit
+            )
+            coalesced = False
+    except GenerationError:
+        finish_trace(status="error: claude", lang=lang)
+        raise
+    except Exception as e:
+        finish_trace(status=f"error: {type(e).__name__}", lang=lang)
+        raise
+    if coalesced:
+        set_trace_attrs(coalesced=True)
+
+    if shared_result is None:
+        answer = _NO_SOURCES_ANSWERS.get(lang, _NO_SOURCES_ANSWERS["en"])
+        save_message(cid, "assistant", answer)
+        return done(ChatResult(status="no_sources", answer=answer, lang=lang, packed=packed))
+
+    # Followers get their own copy, and no token usage: the leader already accounted for it.
+    result = dataclasses.replace(shared_result, sources=list(shared_result.sources), usage={} if coalesced else dict(shared_result.usage))
+    save_message(cid, "assistant", result.answer)
+
+    try:
+        create_event(user_id, "chat_answer", None, {
+            "model": result.model,
+            "prompt_version": result.prompt_version,
+            "context_tokens": packed.tokens_used,
+            "sources": len(packed.sources),
+            "coalesced": coalesced,
+            **result.usage,
+        })
+    except Exception:
+        # Usage telemetry must never break chat
+        pass
+    return done(
+        result,
+        model=result.model,
+        prompt_version=result.prompt_version,
+        context_tokens=packed.tokens_used,
+        **result.usage,
+    )
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Iterator, List, Optional
+
+from .pdf_extract import Section
+from .tokens import estimate_tokens
+
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# text-embedding-3-* accepts up to 8191 input tokens.
+MAX_EMBEDDING_TOKENS = 8000
+
+
+def _heading_title(path: str) -> str:
+    return path.rsplit(" > ", 1)[-1].strip()
+
+
+def _split_units(text: str, max_tokens: int) -> List[str]:
+    """Break text into units that each fit the budget: paragraphs, then sentences, then words."""
+    units: List[str] = []
+    for para in _PARAGRAPH_SPLIT_RE.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        if estimate_tokens(para) <= max_tokens:
+            units.append(para)
+            continue
+        for sent in _SENTENCE_SPLIT_RE.split(para):
+            sent = sent.strip()
+            if not sent:
+                continue
+            if estimate_tokens(sent) <= max_tokens:
+                units.append(sent)
+                continue
+            # Last resort: fixed word windows
+            words = sent.split()
+            window: List[str] = []
+            window_tokens = 0
+            for w in words:
+                wt = estimate_tokens(w) + 1
+                if window and window_tokens + wt > max_tokens:
+                    units.append(" ".join(window))
+                    window, window_tokens = [], 0
+                window.append(w)
+                window_tokens += wt
+            if window:
+                units.append(" ".join(window))
+    return units
+
+
+def _tail(text: str, budget: int) -> str:
+    """Trailing sentences of text within budget tokens; trailing words if no sentence fits."""
+    if budget <= 0:
+        return ""
+    for pieces, sep in ((_SENTENCE_SPLIT_RE.split(text.strip()), " "), (text.split(), " ")):
+        kept: List[str] = []
+        for piece in reversed(pieces):
+            if estimate_tokens(sep.join([piece] + kept)) > budget:
+                break
+            kept.insert(0, piece)
+        if kept:
+            return sep.join(kept)
+    return ""
+
+
+def _split_section(section: Section, max_tokens: int, overlap_tokens: int) -> Iterator[Section]:
+    if estimate_tokens(section.text) <= max_tokens:
+        yield section
+        return
+
+    chunk: List[str] = []
+    chunk_tokens: List[int] = []
+
+    def emit() -> Section:
+        return Section(
+            path=section.path,
+            level=section.level,
+            page_start=section.page_start,
+            page_end=section.page_end,
+            text="\n\n".join(chunk),
+        )
+
+    for unit in _split_units(section.text, max_tokens):
+        t = estimate_tokens(unit)
+        if chunk and sum(chunk_tokens) + t > max_tokens:
+            yield emit()
+            # Carry trailing context of the previous chunk as overlap: whole units while they
+            # fit, then the tail (sentences, else words) of the first unit that doesn't.
+            carry: List[str] = []
+            carry_tokens: List[int] = []
+            for piece, pt in zip(reversed(chunk), reversed(chunk_tokens)):
+                room = overlap_tokens - sum(carry_tokens)
+                if pt > room:
+                    tail = _tail(piece, room)
+                    if tail:
+                        carry.insert(0, tail)
+                        carry_tokens.insert(0, estimate_tokens(tail))
+                    break
+                carry.insert(0, piece)
+                carry_tokens.insert(0, pt)
+            if sum(carry_tokens) + t > max_tokens:
+                carry, carry_tokens = [], []
+            chunk, chunk_tokens = carry, carry_tokens
+        chunk.append(unit)
+        chunk_tokens.append(t)
+
+    if chunk:
+        yield emit()
+
+
+def _merge(a: Section, b: Section) -> Section:
+    text = b.text
+    if b.path != a.path:
+        # keep the absorbed section's heading visible in the merged text
+        text = f"{_heading_title(b.path)}\n{text}"
+    return Section(
+        path=a.path,
+        level=min(a.level, b.level),
+        page_start=min(a.page_start, b.page_start),
+        page_end=max(a.page_end, b.page_end),
+        text=f"{a.text}\n\n{text}",
+    )
+
+
+def chunk_sections(
+    sections: Iterable[Section],
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    min_tokens: int = 48,
+) -> Iterator[Section]:
+    """
+    Re-cut extracted sections to a token budget.
+
+    - Sections over max_tokens are split on paragraph, then sentence, then word boundaries,
+      with up to overlap_tokens of trailing context repeated at the start of the next chunk.
+    - Adjacent sections under min_tokens are merged while the result fits max_tokens.
+
+    Every chunk keeps the path/level/page_start/page_end of the section it came from.
+    Works as a stream, so it can sit directly on iter_sections_from_pdf.
+    """
+    max_tokens = max(16, min(int(max_tokens), MAX_EMBEDDING_TOKENS))
+    overlap_tokens = max(0, min(int(overlap_tokens), max_tokens // 2))
+    min_tokens = max(0, min(int(min_tokens), max_tokens))
+
+    pending: Optional[Section] = None
+    pending_tokens = 0
+
+    for section in sections:
+        if not (section.text or "").strip():
+            continue
+        for chunk in _split_section(section, max_tokens, overlap_tokens):
+            tokens = estimate_tokens(chunk.text)
+            if pending is not None:
+                if (pending_tokens < min_tokens or tokens < min_tokens) and pending_tokens + tokens <= max_tokens:
+                    merged = _merge(pending, chunk)
+                    merged_tokens = estimate_tokens(merged.text)
+                    if merged_tokens <= max_tokens:
+                        pending, pending_tokens = merged, merged_tokens
+                        continue
+                yield pending
+            pending, pending_tokens = chunk, tokens
+
+    if pending is not None:
+        yield pending
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Sequence, Tuple
+
+from .tokens import estimate_tokens
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# "\n\n" between sources
+SEPARATOR_TOKENS = 1
+
+
+@dataclass
+class ContextPack:
+    sources: List[str] = field(default_factory=list)
+    tokens_used: int = 0
+    skipped: int = 0
+    trimmed: int = 0
+
+
+def _trim_to_sentences(text: str, budget: int) -> str:
+    """Longest prefix of whole sentences that fits the token budget ("" if none does)."""
+    out: List[str] = []
+    used = 0
+    for sent in _SENTENCE_END_RE.split(text):
+        t = estimate_tokens(sent) + (1 if out else 0)
+        if used + t > budget:
+            break
+        out.append(sent)
+        used += t
+    return " ".join(out).strip()
+
+
+def pack_context(
+    items: Sequence[Tuple[str, str]],
+    max_tokens: int,
+    min_trim_tokens: int = 64,
+) -> ContextPack:
+    """
+    Fill a token budget with (header, text) sources in rank order.
+
+    Sources that don't fit are skipped rather than ending the fill, so smaller lower-ranked
+    sources can still use the remaining budget. A source that doesn't fit while at least
+    min_trim_tokens remain is cut to whole sentences instead of being skipped.
+    Token counts use core.tokens.estimate_tokens.
+    """
+    pack = ContextPack()
+    budget = int(max_tokens)
+    for header, text in items:
+        remaining = budget - pack.tokens_used - (SEPARATOR_TOKENS if pack.sources else 0)
+        if remaining <= 0:
+            pack.skipped += 1
+            continue
+        header_tokens = estimate_tokens(header) + 1
+        chunk_tokens = header_tokens + estimate_tokens(text)
+        if chunk_tokens <= remaining:
+            pack.sources.append(f"{header}\n{text}")
+            pack.tokens_used += chunk_tokens + (SEPARATOR_TOKENS if len(pack.sources) > 1 else 0)
+            continue
+        if remaining - header_tokens >= min_trim_tokens:
+            cut = _trim_to_sentences(text, remaining - header_tokens)
+            cut_tokens = header_tokens + estimate_tokens(cut)
+            if cut and cut_tokens <= remaining:
+                pack.sources.append(f"{header}\n{cut}")
+                pack.tokens_used += cut_tokens + (SEPARATOR_TOKENS if len(pack.sources) > 1 else 0)
+                pack.trimmed += 1
+                continue
+        pack.skipped += 1
+    return pack
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl  # POSIX: the spill file is shared with other processes (app, worker)
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+Row = Dict[str, Any]
+
+
+class EventSink:
+    """
+    Buffers rows in memory and writes them in bulk from a background thread.
+
+    - emit() never blocks: when the queue is full the row is spilled to a local JSONL file
+      (or dropped and counted when no spill path is set).
+    - A batch is written when it reaches max_batch rows or flush_seconds after its first row.
+    - Failed writes are spilled as well; spilled rows are replayed after the next
+      successful write. Several processes may share one spill file: appends and the
+      replay hand-off hold an flock on "<spill_path>.lock".
+    - close() (registered with atexit by the caller) drains what is left.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Row]], None],
+        max_batch: int = 50,
+        flush_seconds: float = 2.0,
+        max_queue: int = 5000,
+        spill_path: Optional[str] = None,
+    ) -> None:
+        self._write = write
+        self.max_batch = max(1, int(max_batch))
+        self.flush_seconds = float(flush_seconds)
+        self.spill_path = spill_path
+        self.dropped = 0
+        self.spilled = 0
+        self._queue: "queue.Queue[Optional[Row]]" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._spill_lock = threading.Lock()
+        # Rows emitted but not yet written or spilled; flush() waits for 0.
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self._thread.start()
+
+    # ---------------- Producer side ----------------
+
+    def emit(self, row: Row) -> None:
+        if self._closed:
+            self._spill([row])
+            return
+        with self._pending_cond:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spill([row])
+            self._settled(1)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything emitted so far has been written (or spilled)."""
+        try:
+            self._queue.put(None, timeout=timeout)  # wake-up marker: forces the current batch out
+        except queue.Full:
+            return False
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending <= 0, timeout)
+
+    def _settled(self, n: int) -> None:
+        with self._pending_cond:
+            self._pending -= n
+            if self._pending <= 0:
+                self._pending_cond.notify_all()
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+
+    # ---------------- Writer thread ----------------
+
+    def _run(self) -> None:
+        batch: List[Row] = []
+        first_at = 0.0
+        while True:
+            wait = self.flush_seconds - (time.monotonic() - first_at) if batch else None
+            try:
+                item = self._queue.get(timeout=max(0.0, wait) if wait is not None else None)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                if not batch:
+                    first_at = time.monotonic()
+                batch.append(item)
+                if len(batch) < self.max_batch and not self._queue.empty():
+                    continue
+            due = batch and (
+                item is None or len(batch) >= self.max_batch or time.monotonic() - first_at >= self.flush_seconds
+            )
+            if due:
+                self._send(batch)
+                self._settled(len(batch))
+                batch = []
+
+    def _send(self, batch: List[Row]) -> None:
+        try:
+            self._write(batch)
+        except Exception:
+            self._spill(batch)
+            return
+        self._replay_spill()
+
+    # ---------------- Spill file ----------------
+
+    @contextmanager
+    def _locked_spill(self) -> Iterator[None]:
+        """Serializes spill file access across threads and, where flock exists, processes."""
+        assert self.spill_path
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.spill_path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, rows: List[Row]) -> None:
+        if not self.spill_path:
+            self.dropped += len(rows)
+            return
+        try:
+            with self._locked_spill():
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+            self.spilled += len(rows)
+        except Exception:
+            self.dropped += len(rows)
+
+    def _replay_spill(self) -> None:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        # A name of our own: another process replaying at the same time takes a different file.
+        replay = f"{self.spill_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.replay"
+        try:
+            with self._locked_spill():
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay)
+        except OSError:
+            return
+        rows: List[Row] = []
+        try:
+            with open(replay, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            rows.append(json.loads(line))
+                        except ValueError:
+                            continue
+            os.remove(replay)
+        except OSError:
+            return
+        for i in range(0, len(rows), self.max_batch):
+            chunk = rows[i:i + self.max_batch]
+            try:
+                self._write(chunk)
+            except Exception:
+                # Still failing: put the rest back and try again after the next success.
+                self._spill(rows[i:])
+                return
@@ -12,6 +12,8 @@ from openai import OpenAI
 from .paths import get_data_dir, structured_dir as structured_root
 from .utils import ensure_dirs, utc_now_iso
 from .pdf_extract import Section
+from .bm25 import BM25Index
+from .llm import overlap_tokens
 
 
 def _embed_texts(model: str, texts: List[str]) -> np.ndarray:
@@ -45,6 +47,7 @@ def store_structured_index(doc_id: str, filename: str, sections: List[Section],
         for i, s in enumerate(sections):
             obj = asdict(s)
             obj["section_id"] = f"{doc_id}::s{i:04d}"
+            obj["tokens"] = sorted(overlap_tokens(s.text))
             f.write(json.dumps(obj, ensure_ascii=False) + "\n")
 
     # embeddings
@@ -60,6 +63,7 @@ def load_structured_index(embedding_model: str) -> Tuple[List[Dict[str, Any]], n
     """Loads all structured indexes from disk into memory.
 
     Returns (sections, embeddings) where sections is a list of dicts containing section metadata and text.
+    Each document's rows are contiguous (see load_doc_partitions).
     """
     data_dir = get_data_dir()
     ensure_dirs(data_dir)
@@ -90,7 +94,9 @@ def load_structured_index(embedding_model: str) -> Tuple[List[Dict[str, Any]], n
                     line = line.strip()
                     if not line:
                         continue
-                    secs.append(json.loads(line))
+                    sec = json.loads(line)
+                    sec.setdefault("doc_id", doc_id)
+                    secs.append(sec)
         except Exception:
             continue
 
@@ -106,5 +112,23 @@ def load_structured_index(embedding_model: str) -> Tuple[List[Dict[str, Any]], n
     return all_sections, np.vstack(all_embs)
 
 
+@st.cache_resource(show_spinner=False)
+def load_bm25_index(embedding_model: str) -> BM25Index:
+    """Inverted index over the same rows as load_structured_index (row i == section i)."""
+    sections, _ = load_structured_index(embedding_model)
+    return BM25Index(f"{s.get('path') or ''}\n{s.get('text') or ''}" for s in sections)
+
+
+@st.cache_resource(show_spinner=False)
+def load_doc_partitions(embedding_model: str) -> Dict[str, List[Tuple[int, int]]]:
+    """doc_id -> row ranges of load_structured_index, for document-scoped retrieval."""
+    from .retrieval import doc_partitions
+
+    sections, _ = load_structured_index(embedding_model)
+    return doc_partitions(sections)
+
+
 def clear_index_cache() -> None:
     load_structured_index.clear()
+    load_bm25_index.clear()
+    load_doc_partitions.clear()
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Dict, List, Tuple, Any
+import hashlib
 import re
+import sys
 
 from anthropic import Anthropic
 
+from .tracing import traced
+
 
 
 _RE_WORD = re.compile(r"[a-zA-ZÀ-ÿ]+", re.UNICODE)
 
 
 # --- Lexical overlap helpers for cheap relevance filtering ---
-def _tokenize_for_overlap(text: str) -> set[str]:
-    """Tokenize to a small normalized set for cheap lexical overlap checks."""
+def overlap_tokens(text: str) -> set[str]:
+    """Tokenize to a small normalized set for cheap lexical overlap checks.
+
+    The worker stores this set per section at ingest (sections.tokens), so it must stay stable.
+    """
     tl = (text or "").lower()
     toks = _RE_WORD.findall(tl)
     # Keep short stopwords out to reduce noise; keep accented words.
@@ -21,13 +29,26 @@ def _tokenize_for_overlap(text: str) -> set[str]:
 
 def lexical_overlap_count(query: str, passage: str) -> int:
     """Count of shared tokens between query and passage (simple relevance heuristic)."""
-    q = _tokenize_for_overlap(query)
+    q = overlap_tokens(query)
     if not q:
         return 0
-    p = _tokenize_for_overlap(passage)
+    p = overlap_tokens(passage)
     return len(q.intersection(p))
 
 
+def lexical_overlap_count_tokens(query_tokens: set[str], passage: str, passage_tokens: Any = None) -> int:
+    """lexical_overlap_count with the query tokenized once per request.
+
+    Uses the section's ingest-time token list when available and only re-tokenizes
+    the passage for rows stored before tokens were computed.
+    """
+    if not query_tokens:
+        return 0
+    if passage_tokens is None:
+        passage_tokens = overlap_tokens(passage)
+    return len(query_tokens.intersection(passage_tokens))
+
+
 def detect_user_language(text: str) -> str:
     """Heuristic detection focused on Portuguese (pt) vs Spanish (es) vs English (en).
 
@@ -111,6 +132,7 @@ def is_language_mismatch(expected_lang: str, text: str) -> bool:
     return guessed != expected
 
 
+@lru_cache(maxsize=None)
 def language_instruction(lang_code: str) -> str:
     if lang_code == "es":
         return (
@@ -140,6 +162,7 @@ def language_instruction(lang_code: str) -> str:
 
 
 # --- Enforced rules header helper ---
+@lru_cache(maxsize=None)
 def enforced_rules_header(lang_code: str) -> str:
     """High-priority rules written in the target language to avoid English drift."""
     lc = (lang_code or "").strip().lower()
@@ -180,6 +203,7 @@ def enforced_rules_header(lang_code: str) -> str:
     )
 
 # --- Conversational instruction block ---
+@lru_cache(maxsize=None)
 def conversational_instruction(lang_code: str) -> str:
     """Instruction block to make responses feel more conversational (without adding extra calls)."""
     if lang_code == "pt":
@@ -217,6 +241,66 @@ def conversational_instruction(lang_code: str) -> str:
     )
 
 
+@lru_cache(maxsize=None)
+def style_instruction(style: str) -> str:
+    """Additional runtime style hint layered on top of the admin system prompt.
+
+    IMPORTANT: Default to narrative prose. Use bullets only for a short recap when explicitly requested.
+    """
+    style = (style or "").strip().lower()
+    if style == "detailed":
+        return (
+            "Default to narrative prose with context and reasoning. "
+            "Aim for 4–8 short paragraphs. "
+            "Only use headings/bullets if the user explicitly asks for a checklist/summary."
+        )
+    if style == "balanced":
+        return (
+            "Default to narrative prose with context and reasoning. "
+            "Aim for 3–5 short paragraphs. "
+            "Avoid bullet points unless explicitly requested."
+        )
+    return (
+        "Default to narrative prose with context and reasoning. "
+        "Aim for 2–4 short paragraphs. "
+        "Avoid bullet points unless explicitly requested."
+    )
+
+
+# --- Prompt registry ---
+@lru_cache(maxsize=128)
+def chat_system_prompt(lang_code: str, style: str, system_prompt: str) -> Tuple[str, str]:
+    """Chat system prompt for (language, answer style, admin prompt), built once and interned.
+
+    Returns (text, version). version is a sha256 prefix of the text, stable across processes,
+    so it can tag telemetry and cache keys. A changed admin prompt is simply a new key;
+    clear_prompt_cache() drops the old entries.
+    """
+    text = (
+        enforced_rules_header(lang_code)
+        + language_instruction(lang_code)
+        + "\n\n"
+        + "Cheque final antes de responder:\n"
+        + "- Garanta que toda a resposta está no idioma exigido.\n"
+        + "- Se alguma frase estiver em outro idioma, reescreva tudo no idioma exigido.\n\n"
+        + conversational_instruction(lang_code)
+        + "\n\n"
+        + style_instruction(style)
+        + "\n\n"
+        + ((system_prompt or "").strip() or "")
+    )
+    return sys.intern(text), prompt_version(text)
+
+
+def prompt_version(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def clear_prompt_cache() -> None:
+    chat_system_prompt.cache_clear()
+
+
+@lru_cache(maxsize=None)
 def build_system_prompt(answer_lang: str) -> str:
     return (
         "You are the Democracia+ assistant.\n"
@@ -281,13 +365,40 @@ def build_user_turn(query: str, retrieved: List[Tuple[Dict[str, Any], float]], p
     )
 
 
+# --- Anthropic prompt caching ---
+_USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+def system_blocks(stable: str, volatile: str = "") -> List[Dict[str, Any]]:
+    """`system` content blocks with a cache breakpoint after the stable prefix.
+
+    Everything up to the breakpoint is reused across requests with the same text. Prefixes
+    shorter than the model's minimum (1024 tokens on Sonnet, 2048 on Haiku) are just not cached.
+    """
+    blocks: List[Dict[str, Any]] = [{"type": "text", "text": stable, "cache_control": {"type": "ephemeral"}}]
+    if volatile:
+        blocks.append({"type": "text", "text": volatile})
+    return blocks
+
+
+def usage_dict(resp: Any) -> Dict[str, int]:
+    """Token usage of a Messages API response, including prompt-cache reads/writes (0 if absent)."""
+    usage = getattr(resp, "usage", None)
+    return {f: int(getattr(usage, f, 0) or 0) for f in _USAGE_FIELDS}
+
+
+def add_usage(total: Dict[str, int], usage: Dict[str, int]) -> Dict[str, int]:
+    return {f: int(total.get(f, 0)) + int(usage.get(f, 0)) for f in _USAGE_FIELDS}
+
+
+@traced("claude.call")
 def call_claude(api_key: str, model: str, temperature: float, max_tokens: int, system_prompt: str, messages: List[Dict[str, str]]) -> str:
     client = Anthropic(api_key=api_key)
     resp = client.messages.create(
         model=model,
         temperature=temperature,
         max_tokens=max_tokens,
-        system=system_prompt,
+        system=system_blocks(system_prompt),
         messages=messages,
     )
     return "".join([b.text for b in resp.content if getattr(b, 'type', None) == 'text'])
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .vector_codec import decode_embedding
+
+# Candidates at least this similar to an already selected section are dropped outright
+# (same handbook uploaded twice, repeated boilerplate).
+MMR_DUPLICATE_SIMILARITY = 0.97
+
+
+def _unit_rows(m: np.ndarray) -> np.ndarray:
+    m = np.nan_to_num(np.asarray(m, dtype=np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(norms, 1e-8)
+
+
+def mmr_select(
+    doc_vecs: np.ndarray,
+    relevance: np.ndarray,
+    k: int,
+    lambda_: float = 0.75,
+    duplicate_threshold: float = MMR_DUPLICATE_SIMILARITY,
+) -> List[int]:
+    """
+    Maximal marginal relevance: repeatedly pick argmax(lambda * rel - (1 - lambda) * max_sim_to_picked).
+
+    doc_vecs is (n, d); relevance is (n,). Keeps a running max-similarity vector, so the cost
+    is one (n, d) @ (d,) product per pick. Rows with cosine >= duplicate_threshold to a
+    picked row are never picked. Returns row indices in pick order.
+    """
+    n = int(doc_vecs.shape[0]) if doc_vecs is not None else 0
+    if n == 0:
+        return []
+    D = _unit_rows(doc_vecs)
+    rel = np.asarray(relevance, dtype=np.float32)
+    lam = float(min(1.0, max(0.0, lambda_)))
+
+    max_sim = np.zeros((n,), dtype=np.float32)
+    available = np.ones((n,), dtype=bool)
+    picked: List[int] = []
+    for _ in range(min(int(k), n)):
+        if not available.any():
+            break
+        score = lam * rel - (1.0 - lam) * max_sim
+        score = np.where(available, score, -np.inf)
+        j = int(np.argmax(score))
+        picked.append(j)
+        available[j] = False
+        sims = D @ D[j]
+        np.maximum(max_sim, sims, out=max_sim)
+        available &= sims < duplicate_threshold
+    return picked
+
+
+def diversify_hits(
+    hits: Sequence[Dict[str, Any]],
+    query_embedding: Optional[Sequence[float]],
+    limit: int,
+    lambda_: float = 0.75,
+    duplicate_threshold: float = MMR_DUPLICATE_SIMILARITY,
+) -> List[Dict[str, Any]]:
+    """
+    MMR over RPC hits using their `embedding` field (pgvector text or list).
+
+    Relevance keeps the incoming order (fusion/rerank already decided it): the hits' query
+    cosines are sorted and assigned by rank, so the scale matches the redundancy term.
+    Hits without an embedding are ranked after the rest. Returns hits unchanged (truncated)
+    when fewer than two embeddings or no query embedding are available.
+    """
+    hits = list(hits)
+    vecs = [decode_embedding(h.get("embedding")) for h in hits]
+    dims = {v.shape[0] for v in vecs if v is not None}
+    if query_embedding is None or len(dims) != 1 or sum(v is not None for v in vecs) < 2:
+        return hits[: int(limit)]
+
+    d = dims.pop()
+    q = np.asarray(query_embedding, dtype=np.float32)
+    if q.shape[0] != d:
+        return hits[: int(limit)]
+    D = np.zeros((len(hits), d), dtype=np.float32)
+    has = np.zeros((len(hits),), dtype=bool)
+    for i, v in enumerate(vecs):
+        if v is not None:
+            D[i] = v
+            has[i] = True
+
+    cos = _unit_rows(D) @ (q / max(float(np.linalg.norm(q)), 1e-8))
+    relevance = np.full((len(hits),), -1.0, dtype=np.float32)
+    relevance[has] = np.sort(cos[has])[::-1]
+
+    order = mmr_select(D, relevance, limit, lambda_, duplicate_threshold)
+    return [hits[i] for i in order]
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .rerank import available_rerankers, warm_rerankers
+from .supabase_client import svc
+
+# Environment defaults (Admin → Model can override at runtime)
+ENV_EMBED_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small").strip()
+ENV_CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "").strip()
+
+DEFAULTS = {
+    # Embeddings / retrieval
+    "embedding_model": ENV_EMBED_MODEL,
+    "top_k": 8,
+    "min_score": 0.0,
+    "max_context_chars": 18000,
+    "max_context_tokens": 4500,
+    # Reranking of a larger candidate pool (core/rerank.py)
+    "rerank_method": "none",
+    "rerank_candidates": 24,
+    "rerank_budget_ms": 150,
+    # MMR diversity over the returned embeddings (1.0 = relevance only, near-duplicates still dropped)
+    "mmr_lambda": 0.75,
+    # LLM
+    "claude_model_primary": ENV_CLAUDE_MODEL or "claude-3-5-sonnet-latest",
+    "claude_model_fallbacks": ["claude-3-5-haiku-latest"],
+    "claude_max_tokens": 900,
+    "claude_temperature": 0.2,
+    # Prompt / UX
+    "system_prompt": (
+        "You are Democracia+’s assistant. Answer using ONLY the provided sources when possible. "
+        "If the sources don’t contain the answer, say what’s missing and suggest what document would help."
+    ),
+    "answer_style": "balanced",  # concise|balanced|detailed
+    "include_citations": True,
+}
+
+# Context budget bounds (estimated tokens), shared by the clamp below and the Admin → Model input.
+MIN_CONTEXT_TOKENS = 500
+MAX_CONTEXT_TOKENS = 25000
+
+# The cached row is re-validated against model_settings.updated_at at most this often; a full
+# re-fetch only happens when it changed. Without an updated_at value, fall back to a max age.
+SETTINGS_VERSION_CHECK_SECONDS = 5
+SETTINGS_MAX_AGE_SECONDS = 300
+
+_lock = threading.Lock()
+_cache: Dict[str, Any] = {"settings": None, "version": None, "loaded_at": 0.0, "checked_at": 0.0}
+
+
+def _fetch_row() -> Optional[Dict[str, Any]]:
+    """The global row, or None if there is none. Query errors propagate."""
+    rows = (
+        svc.table("model_settings")
+        .select("*")
+        .eq("scope", "global")
+        .limit(1)
+        .execute()
+        .data
+        or []
+    )
+    return (rows[0] or {}) if rows else None
+
+
+def _fetch_version() -> Optional[str]:
+    """updated_at of the global row: one tiny query. None if missing; query errors propagate."""
+    rows = (
+        svc.table("model_settings")
+        .select("updated_at")
+        .eq("scope", "global")
+        .limit(1)
+        .execute()
+        .data
+        or []
+    )
+    return str(rows[0].get("updated_at")) if rows and rows[0].get("updated_at") else None
+
+
+def parse_model_settings(s: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate/clamp a model_settings row into the dict the Chat page uses."""
+    primary = (s.get("claude_model_primary") or s.get("claude_model") or DEFAULTS["claude_model_primary"]).strip()
+
+    fallbacks = DEFAULTS["claude_model_fallbacks"]
+    raw = s.get("claude_model_fallbacks_json")
+    if raw:
+        try:
+            parsed = json.loads(raw)
+            if isinstance(parsed, list) and all(isinstance(x, str) for x in parsed):
+                fallbacks = parsed
+        except Exception:
+            pass
+
+    embed_model = (s.get("embedding_model") or DEFAULTS["embedding_model"]).strip()
+
+    try:
+        top_k = int(s.get("top_k") or DEFAULTS["top_k"])
+    except (ValueError, TypeError):
+        top_k = DEFAULTS["top_k"]
+
+    try:
+        min_score = float(s.get("min_score") or DEFAULTS["min_score"])
+    except (ValueError, TypeError):
+        min_score = DEFAULTS["min_score"]
+
+    try:
+        max_context_chars = int(s.get("max_context_chars") or DEFAULTS["max_context_chars"])
+    except (ValueError, TypeError):
+        max_context_chars = DEFAULTS["max_context_chars"]
+
+    try:
+        # Older rows only have the character cap; ~4 chars per token.
+        max_context_tokens = int(s.get("max_context_tokens") or (max_context_chars // 4))
+    except (ValueError, TypeError):
+        max_context_tokens = DEFAULTS["max_context_tokens"]
+
+    rerank_method = str(s.get("rerank_method") or DEFAULTS["rerank_method"]).strip().lower()
+    if rerank_method not in available_rerankers():
+        rerank_method = DEFAULTS["rerank_method"]
+
+    try:
+        rerank_candidates = int(s.get("rerank_candidates") or DEFAULTS["rerank_candidates"])
+    except (ValueError, TypeError):
+        rerank_candidates = DEFAULTS["rerank_candidates"]
+
+    try:
+        rerank_budget_ms = int(s.get("rerank_budget_ms") or DEFAULTS["rerank_budget_ms"])
+    except (ValueError, TypeError):
+        rerank_budget_ms = DEFAULTS["rerank_budget_ms"]
+
+    try:
+        mmr_lambda = float(s.get("mmr_lambda") if s.get("mmr_lambda") is not None else DEFAULTS["mmr_lambda"])
+    except (ValueError, TypeError):
+        mmr_lambda = DEFAULTS["mmr_lambda"]
+
+    try:
+        max_tokens = int(s.get("claude_max_tokens") or DEFAULTS["claude_max_tokens"])
+    except (ValueError, TypeError):
+        max_tokens = DEFAULTS["claude_max_tokens"]
+
+    try:
+        temperature = float(
+            s.get("claude_temperature") if s.get("claude_temperature") is not None else DEFAULTS["claude_temperature"]
+        )
+    except (ValueError, TypeError):
+        temperature = DEFAULTS["claude_temperature"]
+
+    system_prompt = s.get("system_prompt") or DEFAULTS["system_prompt"]
+    answer_style = str(s.get("answer_style") or DEFAULTS["answer_style"])
+    include_citations = bool(
+        s.get("include_citations") if s.get("include_citations") is not None else DEFAULTS["include_citations"]
+    )
+
+    return {
+        "embedding_model": embed_model,
+        "top_k": max(1, min(50, top_k)),
+        "min_score": max(0.0, min(1.0, min_score)),
+        "max_context_chars": max(2000, min(100000, max_context_chars)),
+        "max_context_tokens": max(MIN_CONTEXT_TOKENS, min(MAX_CONTEXT_TOKENS, max_context_tokens)),
+        "rerank_method": rerank_method,
+        "rerank_candidates": max(1, min(100, rerank_candidates)),
+        "rerank_budget_ms": max(10, min(5000, rerank_budget_ms)),
+        "mmr_lambda": max(0.0, min(1.0, mmr_lambda)),
+        "claude_models": [m for m in [primary, *fallbacks] if m],
+        "claude_max_tokens": max(128, min(4000, max_tokens)),
+        "claude_temperature": max(0.0, min(1.0, temperature)),
+        "system_prompt": system_prompt,
+        "answer_style": answer_style,
+        "include_citations": include_citations,
+    }
+
+
+def load_model_settings() -> Tuple[Dict[str, Any], Optional[str]]:
+    """Load global model settings from Supabase. Defaults if there is no global row.
+
+    Returns (settings, version) where version is the row's updated_at (or None). Raises if the
+    query fails, so callers can tell an outage from an unconfigured project.
+    """
+    row = _fetch_row()
+    if row is None:
+        return dict(DEFAULTS), None
+    version = str(row.get("updated_at")) if row.get("updated_at") else None
+    settings = parse_model_settings(row)
+    # Model-backed rerankers load in the background now rather than inside a chat request.
+    warm_rerankers(settings["rerank_method"])
+    return settings, version
+
+
+def get_model_settings() -> Dict[str, Any]:
+    """
+    Process-wide model settings shared by all sessions.
+
+    Concurrent callers wait on one fetch. A cached copy is served as is for
+    SETTINGS_VERSION_CHECK_SECONDS, then confirmed with a one-column updated_at query; rows
+    without updated_at are re-fetched every SETTINGS_MAX_AGE_SECONDS.
+
+    If Supabase can't be reached the last good settings keep being served (DEFAULTS only when
+    nothing has loaded yet), and the next check happens SETTINGS_VERSION_CHECK_SECONDS later.
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _cache["settings"]
+        if cached is not None:
+            if now - _cache["checked_at"] < SETTINGS_VERSION_CHECK_SECONDS:
+                return dict(cached)
+            try:
+                version = _fetch_version()
+            except Exception:
+                _cache["checked_at"] = now
+                return dict(cached)
+            fresh = (
+                version == _cache["version"]
+                if version is not None
+                else _cache["version"] is None and now - _cache["loaded_at"] < SETTINGS_MAX_AGE_SECONDS
+            )
+            if fresh:
+                _cache["checked_at"] = now
+                return dict(cached)
+
+        try:
+            settings, version = load_model_settings()
+        except Exception:
+            if cached is None:
+                # Nothing loaded yet: serve defaults, but as already stale (loaded_at=0) so the
+                # next check after the back-off loads the real row.
+                _cache.update(settings=dict(DEFAULTS), version=None, loaded_at=0.0, checked_at=now)
+                return dict(DEFAULTS)
+            _cache["checked_at"] = now
+            return dict(cached)
+        _cache.update(settings=settings, version=version, loaded_at=now, checked_at=now)
+        return dict(settings)
+
+
+def invalidate_model_settings() -> None:
+    """Drop the cached settings in this process (call after saving model_settings)."""
+    with _lock:
+        _cache.update(settings=None, version=None, loaded_at=0.0, checked_at=0.0)
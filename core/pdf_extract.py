@@ -3,8 +3,9 @@ from __future__ import annotations
 import logging
 import re
 import unicodedata
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 from pypdf import PdfReader
 
@@ -39,6 +40,23 @@ _NUM_HEADING_RE = re.compile(r"^\s*(\d+(?:\.\d+){0,6})\s+(.{2,200})\s*$")
 # A “heading-ish” line tends to be short and not end with punctuation.
 _HEADING_END_PUNCT = re.compile(r"[.!?;:,]\s*$")
 
+# Header/footer fingerprints fold page numbers only, so "Page 12 of 80" matches "Page 13 of 80"
+# while numeric rows (tables, figures) that merely share a layout still differ.
+_PAGE_LABEL_RE = re.compile(
+    r"\b(?:page|p[aá]g(?:ina)?\.?|p\.)\s*\d{1,4}(?:\s*(?:of|de|/)\s*\d{1,4})?\b", re.IGNORECASE
+)
+_PAGE_NUMBER_LINE_RE = re.compile(r"^[-–—(\[]?\s*\d{1,4}(?:\s*/\s*\d{1,4})?\s*[-–—)\]]?$")
+_LEADING_PAGE_NUMBER_RE = re.compile(r"^\d{1,4}\s+(?=\S)")
+_TRAILING_PAGE_NUMBER_RE = re.compile(r"(?<=\S)\s+\d{1,4}$")
+_LETTER_RE = re.compile(r"[^\W\d_]")
+
+# Normalizer patterns (see _normalize_preserve_lines). They start with a literal so the regex
+# engine can skip ahead instead of trying a character class at every position.
+_HYPHEN_BREAK_RE = re.compile(r"-\n(?=\w)")
+_WORD_CHAR_RE = re.compile(r"\w")
+_MULTI_SPACE_RE = re.compile(r"  +")
+_MULTI_NEWLINE_RE = re.compile(r"\n\n\n+")
+
 
 def extract_text_by_page(pdf_path: str) -> Tuple[List[str], ExtractionReport]:
     """
@@ -88,8 +106,22 @@ def extract_text_by_page(pdf_path: str) -> Tuple[List[str], ExtractionReport]:
 
 def _fix_hyphenation_keep_lines(t: str) -> str:
     # demo-\ncracy -> democracy (keep paragraph breaks)
-    t = re.sub(r"(\w)-\n(\w)", r"\1\2", t)
-    return t
+    # Same result as re.sub(r"(\w)-\n(\w)", r"\1\2", t), but only the "-\n" hits are visited.
+    out: List[str] = []
+    last = 0
+    prev_end = 0
+    for m in _HYPHEN_BREAK_RE.finditer(t):
+        i = m.start()
+        # the preceding word char must not already belong to the previous join
+        if i - 1 < prev_end or not _WORD_CHAR_RE.match(t, i - 1):
+            continue
+        out.append(t[last:i])
+        last = i + 2
+        prev_end = i + 3
+    if not out:
+        return t
+    out.append(t[last:])
+    return "".join(out)
 
 
 def _normalize_preserve_lines(t: str) -> str:
@@ -98,114 +130,162 @@ def _normalize_preserve_lines(t: str) -> str:
     - Keep newlines
     - Collapse weird whitespace
     - Preserve blank lines (paragraph boundaries)
+
+    Each pass is skipped when a cheap check shows it has nothing to do (NFKC on pure-ASCII
+    pages, CR handling without CRs, ...); the output is identical to running all of them.
     """
-    t = t.replace("\x00", "")
-    t = unicodedata.normalize("NFKC", t)
-    t = _fix_hyphenation_keep_lines(t)
+    if "\x00" in t:
+        t = t.replace("\x00", "")
+    if not t.isascii():
+        t = unicodedata.normalize("NFKC", t)
+    if "-\n" in t:
+        t = _fix_hyphenation_keep_lines(t)
 
     # Normalize line endings
-    t = t.replace("\r\n", "\n").replace("\r", "\n")
+    if "\r" in t:
+        t = t.replace("\r\n", "\n").replace("\r", "\n")
 
     # Trim trailing spaces per line
     t = "\n".join([line.strip() for line in t.split("\n")])
 
-    # Collapse internal spaces
-    t = re.sub(r"[ \t\u00a0]+", " ", t)
+    # Collapse internal spaces (NBSP is already a plain space after NFKC)
+    if "\t" in t:
+        t = t.replace("\t", " ")
+    if "  " in t:
+        t = _MULTI_SPACE_RE.sub(" ", t)
 
     # Collapse too many blank lines
-    t = re.sub(r"\n{3,}", "\n\n", t)
+    if "\n\n\n" in t:
+        t = _MULTI_NEWLINE_RE.sub("\n\n", t)
 
     return t.strip()
 
 
-def _strip_repeated_headers_footers(raw_pages: List[str], n_lines: int = 2) -> List[str]:
+def _fold_page_number(line: str) -> str:
     """
-    Improved heuristic: look at first/last N non-empty lines per page and remove the most frequent
-    header/footer blocks if they appear on >= 40% of pages.
+    Replace the page number of a header/footer line with "#": a "Page N [of M]" label, a line
+    that is only a number ("12", "- 12 -", "12/80"), or a lone number at the end (else the
+    start) of a line that also has words. Other digits are kept.
     """
-    def top_block(lines: List[str], take_first: bool) -> Optional[str]:
-        # Build a canonical block string of first/last n_lines non-empty lines
-        cleaned = [l.strip() for l in lines if l.strip()]
-        if not cleaned:
-            return None
-        block_lines = cleaned[:n_lines] if take_first else cleaned[-n_lines:]
-        # Avoid removing tiny blocks
-        block = " | ".join(block_lines).strip()
-        if len(block) < 6:
-            return None
-        return block
-
-    first_blocks: List[str] = []
-    last_blocks: List[str] = []
-
-    per_page_first: List[Optional[str]] = []
-    per_page_last: List[Optional[str]] = []
-
-    for p in raw_pages:
-        lines = p.splitlines()
-        fb = top_block(lines, take_first=True)
-        lb = top_block(lines, take_first=False)
-        per_page_first.append(fb)
-        per_page_last.append(lb)
-        if fb:
-            first_blocks.append(fb)
-        if lb:
-            last_blocks.append(lb)
-
-    def most_common(blocks: List[str]) -> Tuple[Optional[str], int]:
-        if not blocks:
-            return None, 0
-        freq: dict[str, int] = {}
-        for b in blocks:
-            freq[b] = freq.get(b, 0) + 1
-        best = max(freq.items(), key=lambda kv: kv[1])
-        return best[0], best[1]
-
-    first, fcount = most_common(first_blocks)
-    last, lcount = most_common(last_blocks)
+    line = _PAGE_LABEL_RE.sub("#", line)
+    if _PAGE_NUMBER_LINE_RE.match(line):
+        return "#"
+    if not _LETTER_RE.search(line):
+        return line
+    folded = _TRAILING_PAGE_NUMBER_RE.sub(" #", line)
+    if folded != line:
+        return folded
+    return _LEADING_PAGE_NUMBER_RE.sub("# ", line)
+
+
+def _block_fingerprint(block_lines: List[str]) -> Optional[int]:
+    # Canonical block string of the first/last n_lines non-empty lines
+    block = " | ".join(block_lines).strip()
+    # Avoid removing tiny blocks
+    if len(block) < 6:
+        return None
+    return hash(" | ".join(_fold_page_number(line) for line in block_lines))
+
+
+def _page_fingerprints(page: str, n_lines: int) -> Tuple[Optional[int], Optional[int]]:
+    """Fingerprints of the first and last n_lines non-empty lines of a page (single split)."""
+    lines = page.splitlines()
+
+    head: List[str] = []
+    for line in lines:
+        s = line.strip()
+        if s:
+            head.append(s)
+            if len(head) >= n_lines:
+                break
+    if not head:
+        return None, None
+
+    tail: List[str] = []
+    for line in reversed(lines):
+        s = line.strip()
+        if s:
+            tail.append(s)
+            if len(tail) >= n_lines:
+                break
+    tail.reverse()
+
+    return _block_fingerprint(head), _block_fingerprint(tail)
+
+
+def _detect_repeated_headers_footers(raw_pages: List[str], n_lines: int = 2) -> List[Tuple[bool, bool]]:
+    """
+    Lightweight first pass: fingerprint the first/last N non-empty lines of every page once and
+    flag, per page, whether its header/footer block is the most frequent one and appears on
+    >= 40% of pages. Returns [(strip_header, strip_footer), ...] aligned with raw_pages.
+    """
+    fingerprints = [_page_fingerprints(p, n_lines) for p in raw_pages]
+
+    first_counts = Counter(fb for fb, _ in fingerprints if fb is not None)
+    last_counts = Counter(lb for _, lb in fingerprints if lb is not None)
 
     n_pages = max(1, len(raw_pages))
-    remove_first = first if first and (fcount / n_pages) >= 0.4 else None
-    remove_last = last if last and (lcount / n_pages) >= 0.4 else None
-
-    cleaned_pages: List[str] = []
-
-    for p in raw_pages:
-        lines = [l.rstrip() for l in p.splitlines()]
-        non_empty = [l.strip() for l in lines if l.strip()]
-
-        # Determine actual first/last block on this page
-        fb = top_block(lines, take_first=True)
-        lb = top_block(lines, take_first=False)
-
-        # Remove first block lines if match
-        out_lines = lines[:]
-        if remove_first and fb == remove_first:
-            # remove first n_lines non-empty lines (preserving intervening empties)
-            removed = 0
-            new_out = []
-            for line in out_lines:
-                if removed < n_lines and line.strip():
-                    removed += 1
-                    continue
-                new_out.append(line)
-            out_lines = new_out
-
-        # Remove last block lines if match
-        if remove_last and lb == remove_last:
-            removed = 0
-            new_out = []
-            # remove last n_lines non-empty lines from the end
-            for line in reversed(out_lines):
-                if removed < n_lines and line.strip():
-                    removed += 1
-                    continue
-                new_out.append(line)
-            out_lines = list(reversed(new_out))
-
-        cleaned_pages.append("\n".join(out_lines))
-
-    return cleaned_pages
+
+    def repeated(counts: Counter) -> Optional[int]:
+        if not counts:
+            return None
+        fp, count = counts.most_common(1)[0]
+        return fp if (count / n_pages) >= 0.4 else None
+
+    remove_first = repeated(first_counts)
+    remove_last = repeated(last_counts)
+
+    return [
+        (remove_first is not None and fb == remove_first, remove_last is not None and lb == remove_last)
+        for fb, lb in fingerprints
+    ]
+
+
+def _strip_page_header_footer(page: str, strip_first: bool, strip_last: bool, n_lines: int = 2) -> str:
+    lines = [l.rstrip() for l in page.splitlines()]
+    if not (strip_first or strip_last):
+        return "\n".join(lines)
+
+    # Only the head/tail regions are walked; the body is sliced through untouched.
+    start, end = 0, len(lines)
+    head_keep: List[str] = []
+    tail_keep: List[str] = []
+
+    if strip_first:
+        # remove first n_lines non-empty lines (preserving intervening empties)
+        found = 0
+        while start < end and found < n_lines:
+            if lines[start].strip():
+                found += 1
+            else:
+                head_keep.append(lines[start])
+            start += 1
+
+    if strip_last:
+        # remove last n_lines non-empty lines from what is left
+        found = 0
+        while end > start and found < n_lines:
+            end -= 1
+            if lines[end].strip():
+                found += 1
+            else:
+                tail_keep.append(lines[end])
+        tail_keep.reverse()
+
+    return "\n".join(head_keep + lines[start:end] + tail_keep)
+
+
+def _strip_repeated_headers_footers(raw_pages: List[str], n_lines: int = 2) -> List[str]:
+    """
+    Look at first/last N non-empty lines per page and remove the most frequent header/footer
+    blocks if they appear on >= 40% of pages. Page numbers inside the blocks are ignored when
+    matching, so numbered footers ("Page 12 of 80") are detected too.
+    """
+    flags = _detect_repeated_headers_footers(raw_pages, n_lines=n_lines)
+    return [
+        _strip_page_header_footer(p, strip_first, strip_last, n_lines=n_lines)
+        for p, (strip_first, strip_last) in zip(raw_pages, flags)
+    ]
 
 
 def _looks_like_heading(line: str) -> Tuple[bool, Optional[str], int]:
@@ -253,78 +333,90 @@ def _is_bullet(line: str) -> Tuple[bool, str]:
     return False, ""
 
 
-def build_sections_from_pdf(pdf_path: str, filename: str) -> List[Section]:
-    raw_pages, _report = extract_text_by_page(pdf_path)
+def _make_section(buf: List[str], title: str, level: int, page_start: int, page_end: int) -> Optional[Section]:
+    text = "\n".join(buf).strip()
 
-    # Remove repeated headers/footers before normalization
-    raw_pages = _strip_repeated_headers_footers(raw_pages, n_lines=2)
+    # Clean extra blank lines
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
 
-    # Normalize but keep line breaks
-    pages = [_normalize_preserve_lines(p) for p in raw_pages]
+    if not text:
+        return None
+    return Section(path=title, level=level, page_start=page_start, page_end=page_end, text=text)
 
-    # Build a stream of (page_no, line)
-    all_lines: List[Tuple[int, str]] = []
-    for page_no, page_text in enumerate(pages, start=1):
-        if not page_text.strip():
-            continue
-        for line in page_text.split("\n"):
-            # Keep blank lines as separators (we'll use them to separate paragraphs)
-            all_lines.append((page_no, line))
 
-    if not all_lines:
-        return []
+def iter_sections_from_pdf(pdf_path: str, filename: str) -> Iterator[Section]:
+    """
+    Streaming variant of build_sections_from_pdf: yields each Section as soon as the next heading
+    (or the end of the document) closes it.
+
+    Header/footer detection needs every page, so pages are extracted once up front; after that each
+    page is stripped, normalized and segmented on its own and its raw text released, so only one
+    copy of the document text is alive instead of raw + cleaned + normalized + a line stream.
+    """
+    raw_pages, _report = extract_text_by_page(pdf_path)
+
+    # Remove repeated headers/footers before normalization
+    strip_flags = _detect_repeated_headers_footers(raw_pages, n_lines=2)
 
-    sections: List[Section] = []
     current_title = f"{filename}"
     current_level = 1
-    current_start = all_lines[0][0]
+    current_start: Optional[int] = None
+    last_page: Optional[int] = None
     buf: List[str] = []
 
-    def flush(end_page: int) -> None:
-        nonlocal buf, current_title, current_level, current_start
-        text = "\n".join(buf).strip()
-
-        # Clean extra blank lines
-        text = re.sub(r"\n{3,}", "\n\n", text).strip()
-
-        if text:
-            sections.append(
-                Section(
-                    path=current_title,
-                    level=current_level,
-                    page_start=current_start,
-                    page_end=end_page,
-                    text=text,
-                )
-            )
-        buf = []
-
-    for page_no, line in all_lines:
-        s = line.strip()
+    for page_no in range(1, len(raw_pages) + 1):
+        raw = raw_pages[page_no - 1]
+        raw_pages[page_no - 1] = ""  # release as we go
+        strip_first, strip_last = strip_flags[page_no - 1]
 
-        # treat blank line as paragraph separator
-        if not s:
-            # only keep one blank line
-            if buf and buf[-1] != "":
-                buf.append("")
+        # Normalize but keep line breaks
+        page_text = _normalize_preserve_lines(
+            _strip_page_header_footer(raw, strip_first, strip_last, n_lines=2)
+        )
+        if not page_text.strip():
             continue
 
-        # headings
-        is_head, head_title, head_level = _looks_like_heading(s)
-        if is_head and head_title:
-            # start new section
-            flush(page_no)
-            current_title = f"{filename} > {head_title}"
-            current_level = head_level
+        if current_start is None:
             current_start = page_no
-            continue
+        last_page = page_no
 
-        # bullets
-        is_bul, bul_text = _is_bullet(s)
-        if is_bul and bul_text:
-            buf.append(f"• {bul_text}")
-        else:
-            buf.append(s)
+        for line in page_text.split("\n"):
+            s = line.strip()
+
+            # treat blank line as paragraph separator
+            if not s:
+                # only keep one blank line
+                if buf and buf[-1] != "":
+                    buf.append("")
+                continue
+
+            # headings
+            is_head, head_title, head_level = _looks_like_heading(s)
+            if is_head and head_title:
+                # start new section
+                section = _make_section(buf, current_title, current_level, current_start, page_no)
+                if section:
+                    yield section
+                buf = []
+                current_title = f"{filename} > {head_title}"
+                current_level = head_level
+                current_start = page_no
+                continue
+
+            # bullets
+            is_bul, bul_text = _is_bullet(s)
+            if is_bul and bul_text:
+                buf.append(f"• {bul_text}")
+            else:
+                buf.append(s)
+
+    if current_start is None or last_page is None:
+        return
+
+    section = _make_section(buf, current_title, current_level, current_start, last_page)
+    if section:
+        yield section
 
-    flush(all_lines[-1][0])
-    return sections
\ No newline at end of file
+
+def build_sections_from_pdf(pdf_path: str, filename: str) -> List[Section]:
+    return list(iter_sections_from_pdf(pdf_path, filename))
@@ -9,8 +9,10 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 from .supabase_client import svc
+from .tracing import traced
 
 
+@traced("supabase.rate_limit")
 def check_rate_limit(
     user_id: str,
     action: str = "chat_message",
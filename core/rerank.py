@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .bm25 import BM25Index, reciprocal_rank_fusion
+
+# A reranker reorders candidate hits (rows from match_sections) for a query, best first.
+# It receives a time.perf_counter() deadline and should return what it has once it passes;
+# hits it did not get to keep their incoming order after the scored ones.
+Reranker = Callable[[str, List[Dict[str, Any]], float], List[Dict[str, Any]]]
+
+_RERANKERS: Dict[str, Reranker] = {}
+
+# Multilingual (PT/ES/EN) MiniLM cross-encoder; offered only if sentence-transformers imports.
+# The model loads in a background thread; until it is ready, requests skip cross-encoding.
+CROSS_ENCODER_MODEL = os.environ.get("RERANK_CROSS_ENCODER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1").strip()
+CROSS_ENCODER_BATCH = 8
+
+
+def register_reranker(name: str) -> Callable[[Reranker], Reranker]:
+    def deco(fn: Reranker) -> Reranker:
+        _RERANKERS[name] = fn
+        return fn
+    return deco
+
+
+def available_rerankers() -> List[str]:
+    return ["none", *sorted(_RERANKERS)]
+
+
+def rerank_hits(
+    query: str,
+    hits: List[Dict[str, Any]],
+    method: str,
+    limit: int,
+    budget_ms: int,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Run the named reranker over the candidate pool and keep the best `limit` hits.
+
+    Returns (hits, info) where info = {"method", "candidates", "ms", "over_budget"}.
+    Unknown methods and reranker errors leave the incoming order untouched.
+    """
+    fn = _RERANKERS.get((method or "none").strip().lower())
+    info: Dict[str, Any] = {"method": "none", "candidates": len(hits), "ms": 0.0, "over_budget": False}
+    if fn is None or len(hits) <= 1:
+        return hits[: int(limit)], info
+
+    t0 = time.perf_counter()
+    try:
+        ranked = fn(query, list(hits), t0 + max(0, int(budget_ms)) / 1000.0)
+        info["method"] = method
+    except Exception:
+        # Never break chat because of reranking
+        ranked = hits
+    info["ms"] = (time.perf_counter() - t0) * 1000.0
+    info["over_budget"] = info["ms"] > budget_ms
+    return ranked[: int(limit)], info
+
+
+@register_reranker("lexical")
+def _lexical_rerank(query: str, hits: List[Dict[str, Any]], deadline: float) -> List[Dict[str, Any]]:
+    """BM25 over the candidate pool, fused with the incoming (vector/hybrid) order.
+
+    The pool is scored in one go, so once the deadline has passed (checked before and after
+    indexing) the incoming order is returned as is.
+    """
+    if time.perf_counter() >= deadline:
+        return hits
+    index = BM25Index(f"{h.get('path') or ''}\n{h.get('content') or ''}" for h in hits)
+    if time.perf_counter() >= deadline:
+        return hits
+    lexical = [i for i, _ in index.search(query, len(hits))]
+    fused = reciprocal_rank_fusion([list(range(len(hits))), lexical])
+    return [hits[i] for i, _ in fused]
+
+
+class _CrossEncoderLoader:
+    """Loads (and on first use downloads) the model once, in a background thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.model: Any = None
+        self.error: Optional[BaseException] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="cross-encoder-load", daemon=True)
+                self._thread.start()
+
+    def _load(self) -> None:
+        try:
+            self.model = CrossEncoder(CROSS_ENCODER_MODEL)
+        except Exception as e:
+            # Not retried: a bad model name or a missing download won't fix itself per request.
+            self.error = e
+
+    def get(self) -> Any:
+        """The model, or None while it is still loading (or failed to load)."""
+        self.start()
+        return self.model
+
+
+try:
+    from sentence_transformers import CrossEncoder  # optional dependency
+except Exception:
+    CrossEncoder = None
+
+_cross_encoder = _CrossEncoderLoader()
+
+
+def _cross_encoder_rerank(query: str, hits: List[Dict[str, Any]], deadline: float) -> List[Dict[str, Any]]:
+    """Score (query, passage) pairs in small batches until the deadline."""
+    model = _cross_encoder.get()
+    if model is None:
+        # rerank_hits keeps the incoming order and reports method "none"
+        raise RuntimeError(f"cross-encoder not available: {_cross_encoder.error or 'still loading'}")
+    scores: List[float] = []
+    for i in range(0, len(hits), CROSS_ENCODER_BATCH):
+        if scores and time.perf_counter() >= deadline:
+            break
+        batch = hits[i:i + CROSS_ENCODER_BATCH]
+        scores.extend(float(x) for x in model.predict([(query, h.get("content") or "") for h in batch]))
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    return [hits[i] for i in order] + hits[len(scores):]
+
+
+if CrossEncoder is not None:
+    register_reranker("cross_encoder")(_cross_encoder_rerank)
+
+
+def warm_rerankers(method: str) -> None:
+    """Start loading a reranker's model in the background (no-op for methods without one)."""
+    if (method or "").strip().lower() == "cross_encoder" and CrossEncoder is not None:
+        _cross_encoder.start()
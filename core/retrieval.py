@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 
+from .bm25 import BM25Index, reciprocal_rank_fusion
 from .index_store import _embed_texts
 
+# doc_id -> [(start, end), ...] half-open row ranges of the loaded index
+Partitions = Dict[str, List[Tuple[int, int]]]
+
 
 def cosine_top_k(embeddings: np.ndarray, query_vec: np.ndarray, k: int) -> List[Tuple[int, float]]:
     """Return (row_index, cosine_similarity) for top-k rows.
@@ -43,17 +47,112 @@ def cosine_top_k(embeddings: np.ndarray, query_vec: np.ndarray, k: int) -> List[
     return [(int(i), float(sims[i])) for i in idx]
 
 
+def section_doc_id(section: Dict[str, Any]) -> str:
+    return str(section.get("doc_id") or str(section.get("section_id") or "").split("::", 1)[0])
+
+
+def doc_partitions(sections: List[Dict[str, Any]]) -> Partitions:
+    """Row ranges per document. load_structured_index appends documents whole, so each has one range."""
+    parts: Partitions = {}
+    prev: Optional[str] = None
+    for i, s in enumerate(sections):
+        doc = section_doc_id(s)
+        ranges = parts.setdefault(doc, [])
+        if doc == prev:
+            ranges[-1] = (ranges[-1][0], i + 1)
+        else:
+            ranges.append((i, i + 1))
+        prev = doc
+    return parts
+
+
+def scope_ranges(partitions: Partitions, doc_ids: Iterable[str]) -> List[Tuple[int, int]]:
+    """Sorted row ranges covering doc_ids; unknown ids contribute nothing."""
+    return sorted(r for d in set(doc_ids) for r in partitions.get(str(d), []))
+
+
+def cosine_top_k_ranges(
+    embeddings: np.ndarray, query_vec: np.ndarray, k: int, ranges: List[Tuple[int, int]]
+) -> List[Tuple[int, float]]:
+    """cosine_top_k restricted to row ranges; only those rows are scored (slices are views, not copies)."""
+    hits: List[Tuple[int, float]] = []
+    for start, end in ranges:
+        hits.extend((start + i, score) for i, score in cosine_top_k(embeddings[start:end], query_vec, k))
+    hits.sort(key=lambda h: -h[1])
+    return hits[: int(max(1, k))]
+
+
+def _scoped(
+    sections: List[Dict[str, Any]],
+    doc_ids: Optional[Iterable[str]],
+    partitions: Optional[Partitions],
+) -> Optional[List[Tuple[int, int]]]:
+    if doc_ids is None:
+        return None
+    return scope_ranges(partitions if partitions is not None else doc_partitions(sections), doc_ids)
+
+
 def retrieve_sections(
     sections: List[Dict[str, Any]],
     embeddings: np.ndarray,
     query: str,
     embedding_model: str,
     top_k: int,
+    query_vec: Optional[np.ndarray] = None,
+    doc_ids: Optional[Iterable[str]] = None,
+    partitions: Optional[Partitions] = None,
 ) -> List[Tuple[Dict[str, Any], float]]:
-    """Embed query and return top-k (section, score) using cosine similarity."""
+    """Embed query (unless query_vec is given) and return top-k (section, score) using cosine similarity.
+
+    doc_ids limits the search to those documents' partitions (pass load_doc_partitions() to avoid
+    recomputing them); an empty or unknown selection returns [].
+    """
     if not sections or embeddings is None or embeddings.size == 0:
         return []
+    ranges = _scoped(sections, doc_ids, partitions)
+    if ranges is not None and not ranges:
+        return []
 
-    q_vec = _embed_texts(embedding_model, [query])[0]
-    ranked = cosine_top_k(embeddings, q_vec, int(top_k))
+    q_vec = query_vec if query_vec is not None else _embed_texts(embedding_model, [query])[0]
+    if ranges is None:
+        ranked = cosine_top_k(embeddings, q_vec, int(top_k))
+    else:
+        ranked = cosine_top_k_ranges(embeddings, q_vec, int(top_k), ranges)
     return [(sections[i], score) for i, score in ranked]
+
+
+def hybrid_retrieve_sections(
+    sections: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    bm25: BM25Index,
+    query: str,
+    embedding_model: str,
+    top_k: int,
+    candidates: int = 50,
+    query_vec: Optional[np.ndarray] = None,
+    doc_ids: Optional[Iterable[str]] = None,
+    partitions: Optional[Partitions] = None,
+) -> List[Tuple[Dict[str, Any], float]]:
+    """Cosine and BM25 top candidates fused with reciprocal rank fusion; returns (section, rrf_score).
+
+    doc_ids scopes both rankings as in retrieve_sections.
+    """
+    if not sections or embeddings is None or embeddings.size == 0:
+        return []
+    ranges = _scoped(sections, doc_ids, partitions)
+    if ranges is not None and not ranges:
+        return []
+
+    n = max(int(top_k), int(candidates))
+    q_vec = query_vec if query_vec is not None else _embed_texts(embedding_model, [query])[0]
+    if ranges is None:
+        dense = [i for i, _ in cosine_top_k(embeddings, q_vec, n)]
+    else:
+        dense = [i for i, _ in cosine_top_k_ranges(embeddings, q_vec, n, ranges)]
+    lexical = (
+        [i for i, _ in bm25.search(query, n, ranges=ranges)]
+        if bm25 is not None and bm25.n_docs == len(sections)
+        else []
+    )
+    fused = reciprocal_rank_fusion([dense, lexical])[: int(top_k)]
+    return [(sections[i], score) for i, score in fused]
@@ -67,6 +67,7 @@ def render_sidebar(app_title="D+ Agora"):
         nav_item("people", "Admin — Users", "pages/2_Admin_Users.py")
         nav_item("folder2-open", "Admin — Data", "pages/3_Admin_Data.py")
         nav_item("cpu", "Admin — Model", "pages/4_Admin_Model.py")
+        nav_item("speedometer2", "Admin — Performance", "pages/4_Admin_Performance.py")
     else:
         st.sidebar.caption("Admin pages are available to admins only.")
 
@@ -0,0 +1,112 @@
+"""Request coalescing: concurrent calls with the same key share one execution.
+
+The first caller for a key (the leader) runs the function; callers arriving while it is in
+flight (followers) wait for its result instead of repeating the work. Events the leader
+publishes while running (e.g. streamed answer deltas) are recorded and replayed to every
+follower in the follower's own thread, including events published before it joined, so a
+late joiner still sees the whole stream. Streamlit can only draw from the script thread
+that owns the session, which is why events are never delivered across threads.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+Emit = Callable[[str, Any], None]
+
+
+class _Call(Generic[T]):
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.events: List[Tuple[str, Any]] = []
+        self.finished = False
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+    def publish(self, kind: str, data: Any) -> None:
+        with self.cond:
+            self.events.append((kind, data))
+            self.cond.notify_all()
+
+    def finish(self) -> None:
+        with self.cond:
+            self.finished = True
+            self.cond.notify_all()
+
+    def follow(self, emit: Emit) -> None:
+        """Replay and then tail the leader's events until it finishes."""
+        seen = 0
+        while True:
+            with self.cond:
+                while seen >= len(self.events) and not self.finished:
+                    self.cond.wait()
+                batch = self.events[seen:]
+                seen = len(self.events)
+                done = self.finished
+            for kind, data in batch:
+                emit(kind, data)
+            if done and seen >= len(self.events):
+                return
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call[T]] = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[Emit], T], emit: Emit) -> Tuple[T, bool]:
+        """
+        Run fn(publish) once per key among concurrent callers; returns (result, shared).
+
+        The leader's events go to its own emit directly and are recorded for followers.
+        shared is True for followers. fn's exception is re-raised in every caller; an exception
+        (any BaseException) from the leader's own emit doesn't stop fn and is raised to the
+        leader alone afterwards.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.followers += 1
+
+        if not leader:
+            call.follow(emit)
+            if call.error is not None:
+                raise call.error
+            return call.result, True  # type: ignore[return-value]
+
+        emit_error: List[BaseException] = []
+
+        def publish(kind: str, data: Any) -> None:
+            call.publish(kind, data)
+            if emit_error:
+                return
+            try:
+                emit(kind, data)
+            except BaseException as e:
+                # The leader's session went away (Streamlit's RerunException/StopException are
+                # BaseExceptions); keep the shared run going and never hand this to followers.
+                emit_error.append(e)
+
+        try:
+            call.result = fn(publish)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Unregister before waking followers: a request arriving now starts a fresh call.
+            with self._lock:
+                self._calls.pop(key, None)
+            call.finish()
+        if emit_error:
+            raise emit_error[0]
+        return call.result, False
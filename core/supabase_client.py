@@ -1,7 +1,14 @@
+import atexit
+import logging
 import os
+import struct
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
 
 import streamlit as st
 
@@ -13,6 +20,12 @@ import extra_streamlit_components as stx
 from supabase import create_client, Client
 
 from .env_validator import get_required_env, validate_supabase_url
+from .event_sink import EventSink
+from .paths import get_data_dir
+from .tracing import traced
+from .vector_codec import to_pgvector_text
+
+log = logging.getLogger(__name__)
 
 SUPABASE_URL = validate_supabase_url(get_required_env("SUPABASE_URL", "Supabase project URL"))
 SUPABASE_ANON_KEY = get_required_env("SUPABASE_ANON_KEY", "Supabase anonymous key")
@@ -310,13 +323,75 @@ def ensure_profile(user_id: str, email: str) -> Dict[str, Any]:
     return get_profile(user_id) or {"id": user_id, "email": email, "role": "user"}
 
 
+# Audit/trace events are written in bulk off the request path (see core.event_sink).
+EVENTS_BATCH_SIZE = int(os.environ.get("EVENTS_BATCH_SIZE", "50"))
+EVENTS_FLUSH_SECONDS = float(os.environ.get("EVENTS_FLUSH_SECONDS", "2"))
+EVENTS_QUEUE_MAX = int(os.environ.get("EVENTS_QUEUE_MAX", "5000"))
+
+_event_sink: Optional[EventSink] = None
+_event_sink_lock = threading.Lock()
+
+
+def _write_events(rows: List[Dict[str, Any]]) -> None:
+    svc.table("events").insert(rows, returning="minimal").execute()
+
+
+def event_sink() -> EventSink:
+    """Process-wide sink for the events table; drained at interpreter exit."""
+    global _event_sink
+    if _event_sink is None:
+        with _event_sink_lock:
+            if _event_sink is None:
+                spill = os.environ.get("EVENTS_SPILL_PATH", "").strip() or os.path.join(
+                    get_data_dir(), "events_spill.jsonl"
+                )
+                sink = EventSink(
+                    _write_events,
+                    max_batch=EVENTS_BATCH_SIZE,
+                    flush_seconds=EVENTS_FLUSH_SECONDS,
+                    max_queue=EVENTS_QUEUE_MAX,
+                    spill_path=spill,
+                )
+                atexit.register(sink.close)
+                _event_sink = sink
+    return _event_sink
+
+
 def create_event(user_id: Optional[str], action: str, document_id: Optional[str] = None, details: Optional[Dict[str, Any]] = None) -> None:
-    svc.table("events").insert({
+    """Queue an events row; the insert happens in a background batch."""
+    event_sink().emit({
+        # Stamped now, not at insert: batched or spilled rows may be written much later.
+        "created_at": datetime.now(timezone.utc).isoformat(),
         "user_id": user_id,
         "action": action,
         "document_id": document_id,
         "details": details or {},
-    }).execute()
+    })
+
+
+DOCUMENT_STATUSES = ["uploaded", "processing", "ready", "failed"]
+
+
+def count_documents_by_status() -> Dict[str, int]:
+    """Row counts per status (HEAD requests with an exact count; no rows transferred)."""
+    counts: Dict[str, int] = {}
+    for status in DOCUMENT_STATUSES:
+        r = svc.table("documents").select("id", count="exact", head=True).eq("status", status).execute()
+        counts[status] = int(r.count or 0)
+    return counts
+
+
+def list_perf_rollups(since_iso: str) -> List[Dict[str, Any]]:
+    """Pre-aggregated metrics from perf_rollups (see Admin → Performance for the SQL)."""
+    r = (
+        svc.table("perf_rollups")
+        .select("*")
+        .gte("bucket_start", since_iso)
+        .order("bucket_start", desc=False)
+        .limit(5000)
+        .execute()
+    )
+    return r.data or []
 
 
 def list_documents(admin: bool, user_id: str) -> List[Dict[str, Any]]:
@@ -369,29 +444,395 @@ def delete_document(doc_id: str) -> None:
     update_document_status(doc_id, "deleted")
 
 
+# ---------------- Section bulk writes ----------------
+
+# Batches are sized by estimated request bytes rather than row count: a 3072-dim embedding
+# alone is ~60 KB of JSON. Several batches are posted concurrently.
+SECTIONS_BATCH_MAX_BYTES = int(os.environ.get("SECTIONS_BATCH_MAX_BYTES", "2000000"))
+SECTIONS_BATCH_MAX_ROWS = 500
+SECTIONS_INSERT_CONCURRENCY = int(os.environ.get("SECTIONS_INSERT_CONCURRENCY", "4"))
+
+# Optional direct Postgres connection (Supabase "Connection string", session pooler) used for
+# binary COPY. Requires `pip install "psycopg[binary]"`; without it the REST path is used.
+SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL", "").strip()
+
+# Staged section writes (SQL):
+# alter table public.sections add column if not exists pending_batch uuid;
+# create index if not exists sections_pending_batch_idx
+#   on public.sections (document_id, pending_batch) where pending_batch is not null;
+# -- match_sections must skip staged rows: add `and s.pending_batch is null` to its where clause.
+#
+# create or replace function public.swap_document_sections(
+#   p_document_id uuid,
+#   p_batch uuid,
+#   p_delete_ids text[] default '{}',
+#   p_delete_all boolean default false
+# ) returns void
+# language sql
+# as $$
+#   delete from public.sections
+#    where document_id = p_document_id
+#      and pending_batch is distinct from p_batch
+#      and (p_delete_all
+#           or id::text = any(p_delete_ids)
+#           or pending_batch is not null);  -- leftovers from interrupted runs
+#   update public.sections set pending_batch = null
+#    where document_id = p_document_id and pending_batch = p_batch;
+# $$;
+#
+# Ingest-time overlap tokens (SQL):
+# alter table public.sections add column if not exists tokens text[];
+# -- return s.tokens from match_sections / match_sections_lexical so the chat page can skip
+# -- re-tokenizing each hit.
+#
+# The COPY path assumes: document_id uuid, path text, page_start int4, page_end int4,
+# content text, embedding vector, content_hash text, tokens text[].
+
+_SECTION_COPY_COLUMNS = ["document_id", "path", "page_start", "page_end", "content", "embedding"]
+
+
+def _section_row(doc_id: str, s: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "document_id": doc_id,
+        "path": s.get("path"),
+        "page_start": s.get("page_start"),
+        "page_end": s.get("page_end"),
+        "content": s["content"],
+        "embedding": s.get("embedding"),
+        # only sent when the worker computed it (requires the content_hash column)
+        **({"content_hash": s["content_hash"]} if s.get("content_hash") else {}),
+        **({"tokens": list(s["tokens"])} if s.get("tokens") is not None and _sections_has_column("tokens") else {}),
+    }
+
+
+def _row_wire_bytes(row: Dict[str, Any]) -> int:
+    # Cheap upper-ish estimate of the JSON size; embeddings are pgvector text by now.
+    text = len((row.get("content") or "").encode("utf-8")) + len((row.get("path") or "").encode("utf-8"))
+    tokens = sum(len(t) + 3 for t in row.get("tokens") or [])
+    return 256 + 2 * text + tokens + len(row.get("embedding") or "")
+
+
+def _plan_section_batches(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    batches: List[List[Dict[str, Any]]] = []
+    cur: List[Dict[str, Any]] = []
+    cur_bytes = 0
+    for row in rows:
+        b = _row_wire_bytes(row)
+        if cur and (cur_bytes + b > SECTIONS_BATCH_MAX_BYTES or len(cur) >= SECTIONS_BATCH_MAX_ROWS):
+            batches.append(cur)
+            cur, cur_bytes = [], 0
+        cur.append(row)
+        cur_bytes += b
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _insert_section_rows(
+    rows: List[Dict[str, Any]], post: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+) -> None:
+    """Insert rows in size-capped batches, SECTIONS_INSERT_CONCURRENCY at a time.
+
+    post sends one batch; the default is a PostgREST insert (scripts/bench_ingest.py passes a
+    local one to time the same batching).
+    """
+    def rest_post(batch: List[Dict[str, Any]]) -> None:
+        # return=minimal: don't echo the embeddings back
+        svc.table("sections").insert(batch, returning="minimal").execute()
+
+    post = post or rest_post
+
+    # pgvector text is about half the size of a JSON float list
+    rows = [{**r, "embedding": to_pgvector_text(r.get("embedding"))} for r in rows]
+    batches = _plan_section_batches(rows)
+    if len(batches) <= 1 or SECTIONS_INSERT_CONCURRENCY <= 1:
+        for batch in batches:
+            post(batch)
+        return
+    with ThreadPoolExecutor(max_workers=min(SECTIONS_INSERT_CONCURRENCY, len(batches))) as pool:
+        # list() re-raises the first failed batch
+        list(pool.map(post, batches))
+
+
 def insert_sections_with_embeddings(doc_id: str, sections: List[Dict[str, Any]]) -> None:
-    # sections: list of {path,page_start,page_end,content,embedding}
-    # Insert in batches to avoid payload limits.
-    batch_size = 50
-    for i in range(0, len(sections), batch_size):
-        svc.table("sections").insert([
-            {
-                "document_id": doc_id,
-                "path": s.get("path"),
-                "page_start": s.get("page_start"),
-                "page_end": s.get("page_end"),
-                "content": s["content"],
-                "embedding": s.get("embedding"),
-            }
-            for s in sections[i:i+batch_size]
-        ]).execute()
+    # sections: list of {path,page_start,page_end,content,embedding[,content_hash,tokens]}
+    _insert_section_rows([_section_row(doc_id, s) for s in sections])
+
 
+def _error_code(e: BaseException) -> str:
+    """SQLSTATE / PostgREST code of a postgrest APIError ("" for anything else)."""
+    code = getattr(e, "code", None)
+    if code is None and e.args and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return str(code or "")
 
+
+def _is_missing_function(e: BaseException) -> bool:
+    # PGRST202: not in PostgREST's schema cache; 42883: undefined_function
+    return _error_code(e) in ("PGRST202", "42883")
+
+
+def _is_missing_column(e: BaseException) -> bool:
+    # 42703: undefined_column; PGRST204: not in PostgREST's schema cache
+    return _error_code(e) in ("42703", "PGRST204")
+
+
+@lru_cache(maxsize=None)
+def _sections_has_column(column: str) -> bool:
+    """Whether an optional sections column has been migrated (checked once per process)."""
+    try:
+        svc.table("sections").select(column).limit(1).execute()
+        return True
+    except Exception as e:
+        if _is_missing_column(e):
+            return False
+        raise  # transient: not cached, asked again next time
+
+
+def _sections_staging_supported() -> bool:
+    return _sections_has_column("pending_batch")
+
+
+def _pg_copy_field(value: Any, kind: str) -> bytes:
+    if value is None:
+        return struct.pack("!i", -1)
+    if kind == "uuid":
+        data = uuid.UUID(str(value)).bytes
+    elif kind == "int4":
+        data = struct.pack("!i", int(value))
+    elif kind == "vector":
+        # pgvector binary format: int16 dim, int16 unused, dim x float4
+        data = struct.pack(f"!hh{len(value)}f", len(value), 0, *value)
+    elif kind == "text[]":
+        # array header: ndim, has-nulls flag, element type oid (25 = text), then dim size + lower bound
+        items = [str(x).encode("utf-8") for x in value]
+        if not items:
+            data = struct.pack("!iii", 0, 0, 25)
+        else:
+            data = struct.pack("!iiiii", 1, 0, 25, len(items), 1)
+            data += b"".join(struct.pack("!i", len(b)) + b for b in items)
+    else:
+        data = str(value).encode("utf-8")
+    return struct.pack("!i", len(data)) + data
+
+
+def _pg_copy_binary(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    kinds = {"document_id": "uuid", "page_start": "int4", "page_end": "int4", "embedding": "vector", "tokens": "text[]"}
+    out = [b"PGCOPY\n\xff\r\n\x00", struct.pack("!ii", 0, 0)]
+    head = struct.pack("!h", len(columns))
+    for row in rows:
+        out.append(head)
+        out.extend(_pg_copy_field(row.get(c), kinds.get(c, "text")) for c in columns)
+    out.append(struct.pack("!h", -1))
+    return b"".join(out)
+
+
+def _write_sections_copy(
+    doc_id: str, rows: List[Dict[str, Any]], delete_ids: List[str], delete_all: bool
+) -> None:
+    import psycopg  # optional dependency
+
+    columns = list(_SECTION_COPY_COLUMNS)
+    if any(r.get("content_hash") for r in rows):
+        columns.append("content_hash")
+    if any(r.get("tokens") is not None for r in rows):
+        columns.append("tokens")
+
+    # One transaction: readers see the old rows until commit, then the new ones.
+    with psycopg.connect(SUPABASE_DB_URL) as conn:
+        with conn.cursor() as cur:
+            if delete_all:
+                cur.execute("delete from public.sections where document_id = %s", (doc_id,))
+            elif delete_ids:
+                cur.execute(
+                    "delete from public.sections where document_id = %s and id::text = any(%s)",
+                    (doc_id, [str(i) for i in delete_ids]),
+                )
+            if rows:
+                sql = f"copy public.sections ({', '.join(columns)}) from stdin (format binary)"
+                with cur.copy(sql) as copy:
+                    copy.write(_pg_copy_binary(rows, columns))
+
+
+def write_document_sections(
+    doc_id: str,
+    sections: List[Dict[str, Any]],
+    delete_ids: Optional[List[str]] = None,
+    delete_all: bool = False,
+) -> None:
+    """
+    Insert new sections for a document and drop the ones they replace (listed ids, or all
+    existing rows with delete_all) without exposing a half-written document to match_sections.
+
+    Uses a single COPY transaction when SUPABASE_DB_URL is set, else stages rows under a
+    pending_batch id and publishes them with the swap_document_sections RPC. Older schemas
+    without pending_batch get the previous non-atomic insert/delete sequence.
+    """
+    rows = [_section_row(doc_id, s) for s in sections]
+    delete_ids = list(delete_ids or [])
+
+    if SUPABASE_DB_URL:
+        try:
+            _write_sections_copy(doc_id, rows, delete_ids, delete_all)
+            return
+        except Exception as e:
+            # Nothing was committed; retry over REST.
+            log.warning("COPY into sections failed, falling back to REST: %s", e)
+
+    if not _sections_staging_supported():
+        if delete_all:
+            svc.table("sections").delete().eq("document_id", doc_id).execute()
+        _insert_section_rows(rows)
+        delete_sections_by_ids(delete_ids)
+        return
+
+    batch = str(uuid.uuid4())
+    try:
+        _insert_section_rows([{**r, "pending_batch": batch} for r in rows])
+        svc.rpc("swap_document_sections", {
+            "p_document_id": doc_id,
+            "p_batch": batch,
+            "p_delete_ids": [str(i) for i in delete_ids],
+            "p_delete_all": bool(delete_all),
+        }).execute()
+        return
+    except Exception as e:
+        if not _is_missing_function(e):
+            # Drop whatever was staged. If the swap did commit (lost response), its rows no
+            # longer carry the batch id, so this can't touch them.
+            try:
+                svc.table("sections").delete().eq("document_id", doc_id).eq("pending_batch", batch).execute()
+            except Exception:
+                pass
+            raise
+
+    # RPC not installed: drop the old rows, then publish the staged ones (brief gap, never a mix).
+    if delete_all:
+        svc.table("sections").delete().eq("document_id", doc_id).is_("pending_batch", "null").execute()
+    else:
+        delete_sections_by_ids(delete_ids)
+    svc.table("sections").update({"pending_batch": None}).eq("document_id", doc_id).eq("pending_batch", batch).execute()
+
+
+# Incremental re-ingestion (SQL):
+# alter table public.sections add column if not exists content_hash text;
+# create index if not exists sections_document_id_content_hash_idx
+#   on public.sections (document_id, content_hash);
+
+
+def list_section_hashes(doc_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Return [{id, content_hash}] for a document's sections, or None if the column is missing.
+
+    Other errors propagate: treating them as "no column" would re-embed the whole document.
+    """
+    page_size = 1000
+    rows: List[Dict[str, Any]] = []
+    staged = _sections_staging_supported()
+    try:
+        while True:
+            q = svc.table("sections").select("id,content_hash").eq("document_id", doc_id)
+            if staged:
+                q = q.is_("pending_batch", "null")  # rows of an unfinished write don't count
+            r = q.order("id").range(len(rows), len(rows) + page_size - 1).execute()
+            page = r.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+    except Exception as e:
+        if _is_missing_column(e):
+            return None
+        raise
+
+
+def delete_sections_by_ids(ids: List[str]) -> None:
+    # Keep the `in` filter short enough for the request URL.
+    batch_size = 100
+    for i in range(0, len(ids), batch_size):
+        svc.table("sections").delete().in_("id", ids[i:i+batch_size]).execute()
+
+
+# Vector retrieval (SQL). Returning the embedding lets the chat page run MMR (core/mmr.py);
+# changing the return type needs `drop function public.match_sections(vector, int, uuid[]);` first.
+# Run the pending_batch and tokens migrations above before this one; the function reads both
+# columns. On a schema without them, drop `s.tokens` (and `tokens text[]` from the return type)
+# and the `s.pending_batch is null` condition.
+# create or replace function public.match_sections(
+#   query_embedding vector(1536),
+#   match_count int default 8,
+#   filter_document_ids uuid[] default null
+# ) returns table (id uuid, document_id uuid, path text, page_start int, page_end int, content text,
+#                  tokens text[], embedding vector, similarity double precision)
+# language sql stable
+# as $$
+#   select s.id, s.document_id, s.path, s.page_start, s.page_end, s.content, s.tokens, s.embedding,
+#          1 - (s.embedding <=> query_embedding) as similarity
+#     from public.sections s
+#    where s.pending_batch is null
+#      and (filter_document_ids is null or s.document_id = any(filter_document_ids))
+#    order by s.embedding <=> query_embedding
+#    limit match_count;
+# $$;
+#
+# Document-scoped calls (filter_document_ids) read only those documents' rows through the
+# leading document_id column of sections_document_id_content_hash_idx; without that index:
+# create index if not exists sections_document_id_idx on public.sections (document_id);
+
+
+@traced("supabase.rpc_match_sections")
 def rpc_match_sections(query_embedding: List[float], k: int = 8, filter_document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     payload = {
-        "query_embedding": query_embedding,
+        "query_embedding": to_pgvector_text(query_embedding),
         "match_count": int(k),
         "filter_document_ids": filter_document_ids,
     }
     r = svc.rpc("match_sections", payload).execute()
     return r.data or []
+
+
+# Lexical (full-text) retrieval (SQL). Same prerequisites as match_sections: the pending_batch
+# and tokens columns must exist (or drop their references below).
+# alter table public.sections add column if not exists fts tsvector
+#   generated always as (to_tsvector('simple', coalesce(path, '') || ' ' || coalesce(content, ''))) stored;
+# create index if not exists sections_fts_idx on public.sections using gin (fts);
+#
+# create or replace function public.match_sections_lexical(
+#   query_text text,
+#   match_count int default 8,
+#   filter_document_ids uuid[] default null
+# ) returns table (id uuid, document_id uuid, path text, page_start int, page_end int, content text,
+#                  tokens text[], embedding vector, rank real)
+# language sql stable
+# as $$
+#   -- OR the query terms (plainto_tsquery ANDs them) so long questions still match.
+#   with q as (
+#     select nullif(replace(plainto_tsquery('simple', query_text)::text, '&', '|'), '')::tsquery as tsq
+#   )
+#   select s.id, s.document_id, s.path, s.page_start, s.page_end, s.content, s.tokens, s.embedding,
+#          ts_rank_cd(s.fts, q.tsq, 32) as rank
+#     from public.sections s, q
+#    where q.tsq is not null
+#      and s.fts @@ q.tsq
+#      and s.pending_batch is null
+#      and (filter_document_ids is null or s.document_id = any(filter_document_ids))
+#    order by rank desc
+#    limit match_count;
+# $$;
+
+
+@traced("supabase.rpc_match_sections_lexical")
+def rpc_match_sections_lexical(query_text: str, k: int = 8, filter_document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Full-text hits for hybrid retrieval; [] if match_sections_lexical isn't installed (other errors raise)."""
+    if not (query_text or "").strip():
+        return []
+    payload = {
+        "query_text": query_text,
+        "match_count": int(k),
+        "filter_document_ids": filter_document_ids,
+    }
+    try:
+        r = svc.rpc("match_sections_lexical", payload).execute()
+    except Exception as e:
+        if _is_missing_function(e):
+            return []
+        raise
+    return r.data or []
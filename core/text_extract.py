@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import io
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .pdf_extract import Section, _looks_like_heading
+
+# Markdown structure
+_ATX_HEADING_RE = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$")
+_SETEXT_UNDERLINE_RE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+
+def iter_text_lines(file_bytes: bytes) -> Iterator[str]:
+    """Decode uploaded bytes lazily, one line at a time (universal newlines, no trailing \\n)."""
+    stream = io.TextIOWrapper(io.BytesIO(file_bytes), encoding="utf-8", errors="replace", newline=None)
+    for line in stream:
+        yield line.rstrip("\n").replace("\x00", "")
+
+
+class _SectionBuffer:
+    """Accumulates body lines for the current heading; keeps at most one blank line in a row."""
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.stack: List[Tuple[int, str]] = []  # (level, title)
+        self.lines: List[str] = []
+
+    def path(self) -> str:
+        return " > ".join([self.filename, *[t for _, t in self.stack]])
+
+    def level(self) -> int:
+        return self.stack[-1][0] if self.stack else 1
+
+    def add(self, line: str) -> None:
+        if not line.strip():
+            if self.lines and self.lines[-1] != "":
+                self.lines.append("")
+            return
+        self.lines.append(line.rstrip())
+
+    def flush(self) -> Optional[Section]:
+        text = "\n".join(self.lines).strip()
+        self.lines = []
+        if not text:
+            return None
+        return Section(path=self.path(), level=self.level(), page_start=1, page_end=1, text=text)
+
+    def push_heading(self, level: int, title: str) -> None:
+        while self.stack and self.stack[-1][0] >= level:
+            self.stack.pop()
+        self.stack.append((level, title))
+
+
+def iter_sections_from_markdown(lines: Iterable[str], filename: str) -> Iterator[Section]:
+    """
+    Stream Markdown into Sections, one per heading block.
+
+    ATX (# .. ######) and setext (=== / ---) headings build a hierarchical
+    "filename > Heading > Subheading" path; content before the first heading goes under
+    "filename". Blank-line paragraph breaks are kept so the chunker can split on them.
+    Headings inside fenced code blocks are ignored. Single pass, linear in the input size.
+    """
+    buf = _SectionBuffer(filename)
+    fence: Optional[str] = None
+
+    for line in lines:
+        if fence is not None:
+            buf.add(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+
+        m = _FENCE_RE.match(line)
+        if m:
+            fence = m.group(1)[0] * 3
+            buf.add(line)
+            continue
+
+        m = _ATX_HEADING_RE.match(line)
+        if m:
+            title = (m.group(2) or "").strip()
+            if title:
+                section = buf.flush()
+                if section:
+                    yield section
+                buf.push_heading(len(m.group(1)), title)
+            continue
+
+        # Setext heading: a single-line paragraph underlined with === or ---
+        m = _SETEXT_UNDERLINE_RE.match(line)
+        if m and buf.lines and buf.lines[-1] and (len(buf.lines) == 1 or buf.lines[-2] == ""):
+            title = buf.lines.pop().strip()
+            section = buf.flush()
+            if section:
+                yield section
+            buf.push_heading(1 if m.group(1)[0] == "=" else 2, title)
+            continue
+
+        buf.add(line)
+
+    section = buf.flush()
+    if section:
+        yield section
+
+
+def iter_sections_from_text(lines: Iterable[str], filename: str) -> Iterator[Section]:
+    """
+    Stream plain text into Sections. Paragraphs are separated by blank lines; a paragraph that
+    is a single heading-like line (same heuristic as PDFs) starts a new "filename > heading"
+    section, matching build_sections_from_pdf's paths.
+    """
+    buf = _SectionBuffer(filename)
+    para: List[str] = []
+
+    def end_paragraph() -> Iterator[Section]:
+        if len(para) == 1:
+            is_head, head_title, head_level = _looks_like_heading(para[0])
+            if is_head and head_title:
+                section = buf.flush()
+                if section:
+                    yield section
+                # PDF-style paths are flat: filename > heading
+                buf.stack = [(head_level, head_title)]
+                para.clear()
+                return
+        for line in para:
+            buf.add(line)
+        buf.add("")
+        para.clear()
+
+    for line in lines:
+        if line.strip():
+            para.append(line.strip())
+        elif para:
+            yield from end_paragraph()
+
+    if para:
+        yield from end_paragraph()
+
+    section = buf.flush()
+    if section:
+        yield section
@@ -0,0 +1,227 @@
+"""Lightweight request tracing.
+
+A trace is one unit of work (e.g. answering a chat message); spans are timed stages inside
+it. The active trace/span live in contextvars, so `span()` calls deep inside core modules
+attach to whatever request is running without passing anything around, and are no-ops
+when nothing is being traced.
+
+Finished traces go to an in-process ring buffer (recent_traces) and are queued on the
+shared events sink (action "trace", see core.event_sink). If OTEL_EXPORTER_OTLP_ENDPOINT is set and the
+opentelemetry SDK is installed, they are also exported over OTLP.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+TRACE_BUFFER_SIZE = 500
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "").strip()
+
+
+class Trace:
+    def __init__(self, name: str, attrs: Dict[str, Any]) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = dict(attrs)
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.status = "ok"
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    def to_dict(self, total_ms: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": self.ts,
+            "total_ms": round(total_ms, 2),
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("dplus_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("dplus_span", default=None)
+
+_lock = threading.Lock()
+_recent: Deque[Dict[str, Any]] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+# ---------------- Recording ----------------
+
+def start_trace(name: str, **attrs: Any) -> Trace:
+    """Begin a trace in the current context (replaces any unfinished one)."""
+    t = Trace(name, attrs)
+    _current_trace.set(t)
+    _current_span.set(None)
+    return t
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def set_trace_attrs(**attrs: Any) -> None:
+    t = _current_trace.get()
+    if t is not None:
+        t.attrs.update(attrs)
+
+
+def finish_trace(status: str = "ok", **attrs: Any) -> Optional[Dict[str, Any]]:
+    """End the current trace, record it and return its dict (None if no trace is active)."""
+    t = _current_trace.get()
+    if t is None:
+        return None
+    _current_trace.set(None)
+    _current_span.set(None)
+    t.status = status
+    t.attrs.update(attrs)
+    record = t.to_dict(t.elapsed_ms())
+    _record(record)
+    return record
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    t = start_trace(name, **attrs)
+    try:
+        yield t
+    except BaseException as e:
+        finish_trace(status=f"error: {type(e).__name__}")
+        raise
+    else:
+        finish_trace()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time a stage of the active trace. Yields a dict for attributes known only at the end."""
+    t = _current_trace.get()
+    if t is None:
+        yield {}
+        return
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    rec: Dict[str, Any] = {"name": name, "parent": parent, "start_ms": round(t.elapsed_ms(), 2)}
+    extra: Dict[str, Any] = dict(attrs)
+    start = time.perf_counter()
+    try:
+        yield extra
+    except BaseException as e:
+        rec["error"] = type(e).__name__
+        raise
+    finally:
+        rec["ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+        if extra:
+            rec["attrs"] = extra
+        _current_span.reset(token)
+        t.spans.append(rec)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator form of span(); defaults to the function's qualified name."""
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ---------------- Sinks ----------------
+
+def recent_traces(limit: int = 100) -> List[Dict[str, Any]]:
+    """Most recent finished traces in this process, newest first."""
+    with _lock:
+        items = list(_recent)
+    return items[::-1][: int(limit)]
+
+
+def _record(record: Dict[str, Any]) -> None:
+    with _lock:
+        _recent.append(record)
+    _emit_event(record)
+    if OTLP_ENDPOINT:
+        _export_otlp(record)
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Block until queued trace rows have been written (or spilled)."""
+    try:
+        from .supabase_client import event_sink  # lazy: supabase_client imports this module
+
+        event_sink().flush(timeout)
+    except Exception:
+        pass
+
+
+def _emit_event(record: Dict[str, Any]) -> None:
+    try:
+        from .supabase_client import event_sink
+
+        event_sink().emit({
+            "user_id": record["attrs"].get("user_id"),
+            "action": "trace",
+            "document_id": None,
+            "details": record,
+        })
+    except Exception:
+        # Tracing must never break the app
+        pass
+
+
+_otel_tracer: Any = None
+
+
+def _export_otlp(record: Dict[str, Any]) -> None:
+    global _otel_tracer
+    try:
+        if _otel_tracer is None:
+            # optional dependency: opentelemetry-sdk + opentelemetry-exporter-otlp
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            provider = TracerProvider(resource=Resource.create({"service.name": "dplus-agora"}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            _otel_tracer = provider.get_tracer("core.tracing")
+
+        from opentelemetry import trace as otel_trace
+
+        t0_ns = int(record["ts"] * 1e9)
+        root = _otel_tracer.start_span(record["name"], start_time=t0_ns, attributes=_otel_attrs(record["attrs"]))
+        parents = {None: root}
+        for s in sorted(record["spans"], key=lambda s: s["start_ms"]):
+            parent = parents.get(s.get("parent"), root)
+            start_ns = t0_ns + int(s["start_ms"] * 1e6)
+            child = _otel_tracer.start_span(
+                s["name"],
+                context=otel_trace.set_span_in_context(parent),
+                start_time=start_ns,
+                attributes=_otel_attrs(s.get("attrs") or {}),
+            )
+            child.end(end_time=start_ns + int(s["ms"] * 1e6))
+            parents[s["name"]] = child
+        root.end(end_time=t0_ns + int(record["total_ms"] * 1e6))
+    except Exception:
+        pass
+
+
+def _otel_attrs(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in attrs.items() if v is not None}
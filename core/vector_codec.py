@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+Vector = Union[Sequence[float], np.ndarray]
+
+# Significant digits kept in pgvector text. Embedding components are ~1e-1..1e-4, so 6 digits
+# keep cosine scores stable to ~1e-6 while shipping ~10 bytes/float instead of ~20 for JSON.
+PGVECTOR_PRECISION = 6
+
+
+def to_pgvector_text(vec: Optional[Vector], precision: int = PGVECTOR_PRECISION) -> Optional[str]:
+    """Encode a vector as pgvector text input, e.g. "[0.0123,-0.0456]".
+
+    PostgREST casts a JSON string to a vector column/parameter, so this can replace the JSON
+    float list in inserts and RPC payloads.
+    """
+    if vec is None:
+        return None
+    if isinstance(vec, str):
+        return vec  # already encoded
+    values = tuple(float(x) for x in vec) if isinstance(vec, np.ndarray) else tuple(vec)
+    if not values:
+        return "[]"
+    fmt = f"%.{int(precision)}g,"
+    return "[" + (fmt * len(values) % values)[:-1] + "]"
+
+
+def from_pgvector_text(text: Optional[str]) -> Optional[List[float]]:
+    """Decode pgvector text ("[1,2,3]") into a list of floats. Lists pass through unchanged."""
+    if text is None:
+        return None
+    if not isinstance(text, str):
+        return [float(x) for x in text]
+    body = text.strip()[1:-1].strip()
+    if not body:
+        return []
+    return [float(x) for x in body.split(",")]
+
+
+def decode_embedding(value) -> Optional[np.ndarray]:
+    """Best-effort decode of an embedding as returned by PostgREST (pgvector text or JSON list)."""
+    if value is None:
+        return None
+    vals = from_pgvector_text(value)
+    if not vals:
+        return None
+    return np.asarray(vals, dtype=np.float32)
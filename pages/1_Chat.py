@@ -1,11 +1,7 @@
 import os
-import json
-import re
 from datetime import datetime
 
 import streamlit as st
-from anthropic import Anthropic
-from openai import OpenAI
 from supabase_auth.errors import AuthApiError
 
 from core.sidebar_ui import bi, ensure_bootstrap_icons, render_sidebar
@@ -14,55 +10,13 @@ from core.supabase_client import (
     ensure_profile,
     list_documents,
     restore_supabase_session,
-    rpc_match_sections,
     svc,
 )
 from core.ui import apply_ui
-from core.llm import detect_user_language, language_instruction, conversational_instruction, lexical_overlap_count, is_language_mismatch, enforced_rules_header
-from core.env_validator import get_required_env
-from core.rate_limiter import check_rate_limit
-
-OPENAI_API_KEY = get_required_env("OPENAI_API_KEY", "OpenAI API key for embeddings")
-ANTHROPIC_API_KEY = get_required_env("ANTHROPIC_API_KEY", "Anthropic API key for Claude")
-
-# Environment defaults (Admin → Model can override at runtime)
-ENV_EMBED_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small").strip()
-ENV_CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "").strip()
-
-# Constants
-MAX_PROMPT_LENGTH = 4000
-MAX_MESSAGE_HISTORY_CHARS = 500
-MIN_PROMPT_LENGTH_FOR_OVERLAP = 40
-MIN_LEXICAL_OVERLAP = 2
-MIN_LEXICAL_OVERLAP_SHORT = 1
-MAX_TITLE_LENGTH = 50
-RECENT_USER_MESSAGES = 2
-RECENT_ASSISTANT_MESSAGES = 1
-RATE_LIMIT_MESSAGES_PER_MINUTE = 10
-RATE_LIMIT_WINDOW_SECONDS = 60
-
-DEFAULTS = {
-    # Embeddings / retrieval
-    "embedding_model": ENV_EMBED_MODEL,
-    "top_k": 8,
-    "min_score": 0.0,
-    "max_context_chars": 18000,
-    # LLM
-    "claude_model_primary": ENV_CLAUDE_MODEL or "claude-3-5-sonnet-latest",
-    "claude_model_fallbacks": ["claude-3-5-haiku-latest"],
-    "claude_max_tokens": 900,
-    "claude_temperature": 0.2,
-    # Prompt / UX
-    "system_prompt": (
-        "You are Democracia+’s assistant. Answer using ONLY the provided sources when possible. "
-        "If the sources don’t contain the answer, say what’s missing and suggest what document would help."
-    ),
-    "answer_style": "balanced",  # concise|balanced|detailed
-    "include_citations": True,
-}
-
-oai = OpenAI(api_key=OPENAI_API_KEY)
-claude = Anthropic(api_key=ANTHROPIC_API_KEY)
+from core.chat_pipeline import ChatClients, ChatRequest, run_chat
+from core.model_settings import ENV_EMBED_MODEL, get_model_settings
+
+clients = ChatClients.from_env()
 
 st.set_page_config(page_title="D+ Agora — Chat", page_icon="./static/logo-dmas.svg", layout="wide")
 ensure_bootstrap_icons()
@@ -80,55 +34,6 @@ def _user_email(u) -> str:
     return getattr(u, "email", None) or getattr(u, "id", None) or "unknown"
 
 
-def _style_instruction(style: str) -> str:
-    """Additional runtime style hint layered on top of the admin system prompt.
-
-    IMPORTANT: Default to narrative prose. Use bullets only for a short recap when explicitly requested.
-    """
-    style = (style or "").strip().lower()
-    if style == "detailed":
-        return (
-            "Default to narrative prose with context and reasoning. "
-            "Aim for 4–8 short paragraphs. "
-            "Only use headings/bullets if the user explicitly asks for a checklist/summary."
-        )
-    if style == "balanced":
-        return (
-            "Default to narrative prose with context and reasoning. "
-            "Aim for 3–5 short paragraphs. "
-            "Avoid bullet points unless explicitly requested."
-        )
-    return (
-        "Default to narrative prose with context and reasoning. "
-        "Aim for 2–4 short paragraphs. "
-        "Avoid bullet points unless explicitly requested."
-    )
-
-# --- Response mode switching (narrative-first vs structured summary) ---
-_STRUCTURED_TRIGGERS = re.compile(
-    r"\b(checklist|bullet|bullets|framework|tl;dr|tldr|summary|summarize|key points|in points)\b",
-    re.IGNORECASE,
-)
-
-
-def _pick_mode(user_text: str) -> str:
-    return "STRUCTURED_SUMMARY" if _STRUCTURED_TRIGGERS.search(user_text or "") else "NARRATIVE_FIRST"
-
-
-def _mode_hint(user_text: str) -> str:
-    mode = _pick_mode(user_text)
-    if mode == "STRUCTURED_SUMMARY":
-        return (
-            "[MODE: STRUCTURED_SUMMARY]\n"
-            "Use headings and bullet points. Keep it concise and scannable.\n\n"
-        )
-    return (
-        "[MODE: NARRATIVE_FIRST]\n"
-        "Write in connected paragraphs with context and reasoning. "
-        "Avoid bullet points unless explicitly requested.\n\n"
-    )
-
-
 def _safe_dt_label(iso_ts: str | None) -> str:
     if not iso_ts:
         return ""
@@ -139,88 +44,6 @@ def _safe_dt_label(iso_ts: str | None) -> str:
         return iso_ts[:16]
 
 
-def _load_model_settings() -> dict:
-    """Load global model settings from Supabase. Falls back to safe defaults."""
-    try:
-        rows = (
-            svc.table("model_settings")
-            .select("*")
-            .eq("scope", "global")
-            .limit(1)
-            .execute()
-            .data
-            or []
-        )
-    except Exception:
-        rows = []
-
-    if not rows:
-        return dict(DEFAULTS)
-
-    s = rows[0] or {}
-
-    primary = (s.get("claude_model_primary") or s.get("claude_model") or DEFAULTS["claude_model_primary"]).strip()
-
-    fallbacks = DEFAULTS["claude_model_fallbacks"]
-    raw = s.get("claude_model_fallbacks_json")
-    if raw:
-        try:
-            parsed = json.loads(raw)
-            if isinstance(parsed, list) and all(isinstance(x, str) for x in parsed):
-                fallbacks = parsed
-        except Exception:
-            pass
-
-    embed_model = (s.get("embedding_model") or DEFAULTS["embedding_model"]).strip()
-
-    try:
-        top_k = int(s.get("top_k") or DEFAULTS["top_k"])
-    except (ValueError, TypeError):
-        top_k = DEFAULTS["top_k"]
-
-    try:
-        min_score = float(s.get("min_score") or DEFAULTS["min_score"])
-    except (ValueError, TypeError):
-        min_score = DEFAULTS["min_score"]
-
-    try:
-        max_context_chars = int(s.get("max_context_chars") or DEFAULTS["max_context_chars"])
-    except (ValueError, TypeError):
-        max_context_chars = DEFAULTS["max_context_chars"]
-
-    try:
-        max_tokens = int(s.get("claude_max_tokens") or DEFAULTS["claude_max_tokens"])
-    except (ValueError, TypeError):
-        max_tokens = DEFAULTS["claude_max_tokens"]
-
-    try:
-        temperature = float(
-            s.get("claude_temperature") if s.get("claude_temperature") is not None else DEFAULTS["claude_temperature"]
-        )
-    except (ValueError, TypeError):
-        temperature = DEFAULTS["claude_temperature"]
-
-    system_prompt = s.get("system_prompt") or DEFAULTS["system_prompt"]
-    answer_style = str(s.get("answer_style") or DEFAULTS["answer_style"])
-    include_citations = bool(
-        s.get("include_citations") if s.get("include_citations") is not None else DEFAULTS["include_citations"]
-    )
-
-    return {
-        "embedding_model": embed_model,
-        "top_k": max(1, min(50, top_k)),
-        "min_score": max(0.0, min(1.0, min_score)),
-        "max_context_chars": max(2000, min(100000, max_context_chars)),
-        "claude_models": [m for m in [primary, *fallbacks] if m],
-        "claude_max_tokens": max(128, min(4000, max_tokens)),
-        "claude_temperature": max(0.0, min(1.0, temperature)),
-        "system_prompt": system_prompt,
-        "answer_style": answer_style,
-        "include_citations": include_citations,
-    }
-
-
-
 def list_conversations_for_user(user_id: str) -> list[dict]:
     try:
         return (
@@ -261,39 +84,6 @@ def get_or_create_conversation(user_id: str) -> str:
 
     return create_conversation(user_id, title="Chat")
 
-
-def embed_query(q: str, embed_model: str):
-    resp = oai.embeddings.create(model=embed_model, input=q)
-    return resp.data[0].embedding
-
-
-def save_message(conversation_id: str, role: str, content: str) -> None:
-    """Save a message to the database with error handling."""
-    try:
-        svc.table("messages").insert({
-            "conversation_id": conversation_id,
-            "role": role,
-            "content": content
-        }).execute()
-    except Exception as e:
-        st.error(f"Failed to save message: {e}")
-        raise
-
-
-def _check_user_rate_limit(user_id: str) -> tuple[bool, int]:
-    """Check if user has exceeded rate limit using database-backed rate limiter.
-
-    Returns:
-        Tuple of (is_allowed, seconds_until_reset)
-    """
-    return check_rate_limit(
-        user_id=user_id,
-        action="chat_message",
-        max_requests=RATE_LIMIT_MESSAGES_PER_MINUTE,
-        window_seconds=RATE_LIMIT_WINDOW_SECONDS
-    )
-
-
 # ---------- App start ----------
 
  # ------------------------- Auth -------------------------
@@ -311,59 +101,9 @@ user_id = user["id"]
 role = st.session_state.get("role", "user")
 is_admin = role == "admin"
 
-# Cache model settings in session (with TTL of 5 minutes)
-from time import time
-if "cached_settings" not in st.session_state or "settings_cache_time" not in st.session_state:
-    st.session_state["cached_settings"] = _load_model_settings()
-    st.session_state["settings_cache_time"] = time()
-elif time() - st.session_state["settings_cache_time"] > 300:  # 5 minutes
-    st.session_state["cached_settings"] = _load_model_settings()
-    st.session_state["settings_cache_time"] = time()
-
-settings = st.session_state["cached_settings"]
-
-def _truncate_title(s: str, max_len: int = MAX_TITLE_LENGTH) -> str:
-    s = " ".join((s or "").strip().split())
-    if not s:
-        return "Chat"
-    if len(s) <= max_len:
-        return s
-    return s[: max_len - 1].rstrip() + "…"
-
-
-def maybe_autotitle_conversation(conversation_id: str, prompt: str) -> None:
-    """
-    If the conversation title is still the default ('Chat'),
-    update it using the first user prompt.
-    """
-    try:
-        row = (
-            svc.table("conversations")
-            .select("title")
-            .eq("id", conversation_id)
-            .limit(1)
-            .execute()
-            .data
-        )
-        if not row:
-            return
-
-        current_title = (row[0].get("title") or "").strip()
-        if current_title.lower() != "chat":
-            return  # already titled
-
-        new_title = _truncate_title(prompt, MAX_TITLE_LENGTH)
-        if new_title.lower() == "chat":
-            return
+# Shared across sessions; re-fetched only when model_settings.updated_at changes.
+settings = get_model_settings()
 
-        svc.table("conversations").update(
-            {"title": new_title}
-        ).eq("id", conversation_id).execute()
-
-    except Exception:
-        # Never block chat if titling fails
-        return
-    
 
 if is_admin and settings["embedding_model"] != ENV_EMBED_MODEL:
     st.warning(
@@ -413,9 +153,22 @@ with st.sidebar:
                     st.session_state["conversation_id"] = cid
                     st.rerun()
 
-# (No UI filters here; we keep docs available for future admin-only tooling)
 docs = list_documents(admin=is_admin, user_id=user_id)
 
+# Optional scope: answer only from the selected documents (empty = all documents)
+ready_docs = {d["id"]: d.get("filename") or d["id"] for d in docs if d.get("status") == "ready"}
+with st.sidebar:
+    scope = []
+    if ready_docs:
+        st.markdown("---")
+        scope = st.multiselect(
+            "Search in",
+            options=list(ready_docs),
+            format_func=lambda i: ready_docs.get(i, i),
+            key="chat_scope_doc_ids",
+            placeholder="All documents",
+        )
+
 cid = get_or_create_conversation(user_id)
 
 msgs = (
@@ -433,258 +186,58 @@ for m in msgs:
     with st.chat_message(m["role"]):
         st.markdown(m["content"])
 
-# Keep a tiny, safer tail of recent turns to preserve local coherence
-# without resurfacing early-topic assistant content.
-# Strategy: last N USER messages + last M ASSISTANT messages (if present).
-recent_turns = []
-user_kept = 0
-assistant_kept = 0
-
-for m in reversed(msgs or []):
-    role = (m.get("role") or "").strip().lower()
-    content = (m.get("content") or "").strip()
-    if not content or role not in ("user", "assistant"):
-        continue
-
-    if role == "user":
-        if user_kept >= RECENT_USER_MESSAGES:
-            continue
-        user_kept += 1
-    else:
-        if assistant_kept >= RECENT_ASSISTANT_MESSAGES:
-            continue
-        assistant_kept += 1
-
-    # Cap per-message length to keep prompts tight
-    if len(content) > MAX_MESSAGE_HISTORY_CHARS:
-        content = content[:MAX_MESSAGE_HISTORY_CHARS - 3].rstrip() + "…"
-
-    recent_turns.append(f"{role.upper()}: {content}")
-
-    # Stop early once we have enough
-    if user_kept >= RECENT_USER_MESSAGES and assistant_kept >= RECENT_ASSISTANT_MESSAGES:
-        break
-
-# Reverse back to chronological order
-recent_history_block = "\n".join(reversed(recent_turns))
-
-prompt = st.chat_input("Ask a question…") 
+prompt = st.chat_input("Ask a question…")
 
 if prompt:
-    # Validate message length
-    if len(prompt) > MAX_PROMPT_LENGTH:
-        st.error(f"Message too long. Please limit your message to {MAX_PROMPT_LENGTH} characters.")
-        st.stop()
-
-    # Check rate limit
-    allowed, wait_time = _check_user_rate_limit(user_id)
-    if not allowed:
-        st.error(
-            f"Too many messages. Please wait {wait_time} seconds before sending more messages. "
-            f"(Limit: {RATE_LIMIT_MESSAGES_PER_MINUTE} messages per {RATE_LIMIT_WINDOW_SECONDS} seconds)"
-        )
-        st.stop()
-
-    detected_lang = detect_user_language(prompt)
-    prev_lang = st.session_state.get("conversation_lang")
+    # Retrieval + generation live in core/chat_pipeline.py; the page only renders its events.
+    ui: dict = {"text": ""}
+
+    def on_event(kind: str, data) -> None:
+        if kind == "accepted":
+            st.session_state["conversation_lang"] = data["lang"]
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            ui["assistant"] = st.chat_message("assistant")
+            ui["answer"] = ui["assistant"].empty()
+            ui["answer"].markdown("_Searching documents…_")
+        elif kind == "generating":
+            ui["answer"].markdown("_Writing answer…_")
+        elif kind == "delta":
+            ui["text"] += data
+            ui["answer"].markdown(ui["text"] + "▌")
+        elif kind == "reset":
+            ui["text"] = ""
+
+    result = run_chat(
+        clients,
+        ChatRequest(
+            user_id=user_id,
+            conversation_id=cid,
+            prompt=prompt,
+            history=msgs,
+            prev_lang=st.session_state.get("conversation_lang"),
+            filter_document_ids=[i for i in scope if i in ready_docs] or None,
+        ),
+        settings,
+        stream=True,
+        emit=on_event,
+    )
 
-    # Sticky language: if we previously established PT/ES and the detector falls back to EN
-    # on a short prompt, keep the previous language unless the user clearly switches.
-    if prev_lang in ("pt", "es") and detected_lang == "en":
-        answer_lang = prev_lang
-    else:
-        answer_lang = detected_lang
-
-    st.session_state["conversation_lang"] = answer_lang
-    # Auto-title conversation if still default
-    maybe_autotitle_conversation(cid, prompt)
-
-    # Deterministic handling: this app does not do live web browsing.
-    if re.search(r"\b(busca\s+na\s+web|pesquis(a|ar)\s+na\s+web|buscar\s+na\s+internet|pesquis(a|ar)\s+na\s+internet|web\s+search|browse\s+the\s+web|buscar\s+en\s+la\s+web|buscar\s+en\s+internet|búsqueda\s+en\s+la\s+web)\b", prompt, re.IGNORECASE):
-        if answer_lang == "pt":
-            answer = (
-                "Consigo te ajudar a formular a busca, mas este chat (no app) não faz navegação na web em tempo real. "
-                "Se você me disser o que quer encontrar, eu monto as melhores consultas, fontes recomendadas e critérios de verificação — "
-                "ou posso responder com base nos documentos que você enviou."
-            )
-        elif answer_lang == "es":
-            answer = (
-                "Puedo ayudarte a formular la búsqueda, pero este chat (en la app) no navega la web en tiempo real. "
-                "Si me dices qué quieres encontrar, preparo las mejores consultas, fuentes recomendadas y criterios de verificación — "
-                "o puedo responder basándome en los documentos que subiste."
-            )
-        else:
-            answer = (
-                "I can help you craft the web search, but this in-app chat doesn't browse the web in real time. "
-                "Tell me what you want to find and I’ll propose the best queries, sources to check, and verification steps — "
-                "or I can answer based on the documents you uploaded."
-            )
-
-        save_message(cid, "user", prompt)
-        with st.chat_message("user"):
-            st.markdown(prompt)
-
-        with st.chat_message("assistant"):
-            st.markdown(answer)
-
-        save_message(cid, "assistant", answer)
+    if result.status in ("rejected", "rate_limited"):
+        st.error(result.error)
         st.stop()
 
-    save_message(cid, "user", prompt)
-
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    with st.chat_message("assistant"):
-        with st.spinner("Searching documents…"):
-            q_emb = embed_query(prompt, settings["embedding_model"])
-            hits = rpc_match_sections(q_emb, k=int(settings["top_k"]), filter_document_ids=None)
-
-        # Similarity threshold
-        if isinstance(hits, list) and settings.get("min_score", 0.0) > 0:
-            ms = float(settings["min_score"])
-            filtered = []
-            for h in hits:
-                if not isinstance(h, dict):
-                    continue
-                sim = h.get("similarity")
-                if sim is None:
-                    filtered.append(h)
-                else:
-                    try:
-                        if float(sim) >= ms:
-                            filtered.append(h)
-                    except Exception:
-                        filtered.append(h)
-            hits = filtered
-
-        max_chars = int(settings.get("max_context_chars", DEFAULTS["max_context_chars"]))
-        sources = []
-        used_chars = 0
-
-        for i, h in enumerate(hits or [], start=1):
-            if not isinstance(h, dict):
-                continue
-            txt = (h.get("content") or h.get("text") or "").strip()
-            if not txt:
-                continue
-            # Cheap relevance filter to prevent unrelated chunks from dominating.
-            # This helps avoid the model "bringing back" old topics.
-            overlap = lexical_overlap_count(prompt, txt)
-            # For very short prompts, allow small overlap; otherwise require more.
-            min_overlap = MIN_LEXICAL_OVERLAP_SHORT if len(prompt.strip()) < MIN_PROMPT_LENGTH_FOR_OVERLAP else MIN_LEXICAL_OVERLAP
-            if overlap < min_overlap:
-                continue
-
-            path = (h.get("path") or h.get("section_path") or h.get("filename") or "Source").strip()
-            doc_id = h.get("document_id") or h.get("doc_id")
-            header = f"[{i}] {path}"
-            if doc_id:
-                header += f" (doc {str(doc_id)[:8]})"
-
-            chunk = f"{header}\n{txt}"
-            if used_chars + len(chunk) > max_chars:
-                break
-            used_chars += len(chunk) + 2
-            sources.append(chunk)
-
-        if not sources:
-            if answer_lang == "pt":
-                answer = (
-                    "Não encontrei informações relevantes nos documentos enviados para responder a isso. "
-                    "Tente reformular a pergunta ou envie um documento que trate desse tema."
-                )
-            elif answer_lang == "es":
-                answer = (
-                    "No encontré información relevante en los documentos cargados para responder eso. "
-                    "Intenta reformular tu pregunta o sube un documento que cubra este tema."
-                )
-            else:
-                answer = (
-                    "I couldn’t find relevant information in the uploaded documents to answer that. "
-                    "Try rephrasing your question or upload a document that covers this topic."
-                )
-            st.markdown(answer)
-            save_message(cid, "assistant", answer)
-        else:
-            sys = (
-                enforced_rules_header(answer_lang)
-                + language_instruction(answer_lang)
-                + "\n\n"
-                + "Cheque final antes de responder:\n"
-                + "- Garanta que toda a resposta está no idioma exigido.\n"
-                + "- Se alguma frase estiver em outro idioma, reescreva tudo no idioma exigido.\n\n"
-                + conversational_instruction(answer_lang)
-                + "\n\n"
-                + _style_instruction(settings.get("answer_style", "concise"))
-                + "\n\n"
-                + (settings["system_prompt"].strip() or "")
-            )
-            ctx = "\n\n".join(sources)
-            user_msg = (
-                _mode_hint(prompt)
-                + ("RECENT CHAT (for resolving references only; ignore if unrelated):\n" + recent_history_block + "\n\n" if recent_history_block else "")
-                + f"QUESTION:\n{prompt}\n\n"
-                + "CONTEXT (reference only; do not mirror its formatting):\n"
-                + f"{ctx}\n\n"
-                + "Use the context above as evidence for any factual claims. "
-                + "If the context is insufficient, say what is missing and ask 1 clarifying question."
-            )
-
-            models = settings.get("claude_models") or [
-                DEFAULTS["claude_model_primary"],
-                *DEFAULTS["claude_model_fallbacks"],
-            ]
-
-            answer = ""
-            last_err = None
-            with st.spinner("Writing answer…"):
-                for model in models:
-                    try:
-                        resp = claude.messages.create(
-                            model=model,
-                            max_tokens=int(settings["claude_max_tokens"]),
-                            temperature=float(settings["claude_temperature"]),
-                            system=sys,
-                            messages=[{"role": "user", "content": user_msg}],
-                        )
-                        answer = resp.content[0].text if resp.content else ""
-                        if answer:
-                            break
-                    except Exception as e:
-                        last_err = e
-
-            if not answer:
-                raise RuntimeError(f"Claude call failed for models={models}. Last error: {last_err}")
-
-            # If the model drifted into English for PT/ES, do a single rewrite pass.
-            if is_language_mismatch(answer_lang, answer):
-                rewrite_lang = "PT-BR" if answer_lang == "pt" else "ES"
-                rewrite_user = (
-                    f"Rewrite the following answer entirely in {rewrite_lang}. "
-                    "Do not add new facts. Do not mention protocols or internal rules.\n\n"
-                    f"ANSWER TO REWRITE:\n{answer}"
+    # Final text (the PT/ES rewrite pass may have replaced what was streamed)
+    ui["answer"].markdown(result.answer)
+
+    if result.status == "ok" and settings.get("include_citations", True):
+        packed = result.packed
+        with ui["assistant"].expander("Sources used"):
+            st.markdown(f"#### {bi('book')} Sources", unsafe_allow_html=True)
+            if is_admin:
+                st.caption(
+                    f"Context: ~{packed.tokens_used} tokens in {len(result.sources)} source(s) "
+                    f"({packed.trimmed} trimmed, {packed.skipped} skipped)"
                 )
-                try:
-                    resp2 = claude.messages.create(
-                        model=models[0],
-                        max_tokens=int(settings["claude_max_tokens"]),
-                        temperature=0.0,
-                        system=sys,
-                        messages=[{"role": "user", "content": rewrite_user}],
-                    )
-                    rewritten = resp2.content[0].text if resp2.content else ""
-                    if rewritten:
-                        answer = rewritten
-                except Exception:
-                    # If rewrite fails, keep original answer (do not break chat)
-                    pass
-
-            st.markdown(answer)
-            save_message(cid, "assistant", answer)
-
-            if settings.get("include_citations", True):
-                with st.expander("Sources used"):
-                    st.markdown(f"#### {bi('book')} Sources", unsafe_allow_html=True)
-                    for s in sources:
-                        st.markdown(s)
\ No newline at end of file
+            for s in result.sources:
+                st.markdown(s)
@@ -1,8 +1,13 @@
 import json
+from datetime import datetime, timezone
+
 import streamlit as st
 from supabase_auth.errors import AuthApiError
 
 from core.sidebar_ui import ensure_bootstrap_icons, render_sidebar
+from core.llm import clear_prompt_cache
+from core.model_settings import MAX_CONTEXT_TOKENS, MIN_CONTEXT_TOKENS, invalidate_model_settings
+from core.rerank import available_rerankers
 from core.supabase_client import ensure_profile, restore_supabase_session, svc
 from core.ui import apply_ui
 
@@ -127,13 +132,53 @@ with tabs[1]:
         0.01,
         help="If set too high, retrieval can return nothing.",
     )
-    max_context_chars = st.number_input(
-        "Max context size (characters)",
-        min_value=4000,
-        max_value=60000,
-        value=int(get("max_context_chars", 18000)),
-        step=500,
-        help="Caps the amount of retrieved text injected into the prompt.",
+    max_context_tokens = st.number_input(
+        "Max context size (tokens)",
+        min_value=MIN_CONTEXT_TOKENS,
+        max_value=MAX_CONTEXT_TOKENS,
+        # Clamped like parse_model_settings: an out-of-range stored value would make number_input raise.
+        value=max(
+            MIN_CONTEXT_TOKENS,
+            min(MAX_CONTEXT_TOKENS, int(get("max_context_tokens", int(get("max_context_chars", 18000)) // 4))),
+        ),
+        step=250,
+        help="Caps the amount of retrieved text injected into the prompt (estimated tokens).",
+    )
+
+    st.markdown(f"### {bi('sort-down')} Reranking", unsafe_allow_html=True)
+    rerank_options = available_rerankers()
+    rerank_current = str(get("rerank_method", "none"))
+    rerank_method = st.selectbox(
+        "Rerank method",
+        options=rerank_options,
+        index=rerank_options.index(rerank_current) if rerank_current in rerank_options else 0,
+        help="lexical = BM25 over the candidates (no extra dependencies); cross_encoder needs sentence-transformers.",
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        rerank_candidates = st.slider(
+            "Candidate pool",
+            3,
+            100,
+            int(get("rerank_candidates", 24)),
+            help="Hits fetched before reranking down to Top K.",
+        )
+    with col2:
+        rerank_budget_ms = st.number_input(
+            "Rerank budget (ms)",
+            min_value=10,
+            max_value=5000,
+            value=int(get("rerank_budget_ms", 150)),
+            step=10,
+        )
+    mmr_lambda = st.slider(
+        "Diversity (MMR λ)",
+        0.0,
+        1.0,
+        float(get("mmr_lambda", 0.75)),
+        0.05,
+        help="1.0 = pure relevance; lower values favour sections that add new information. "
+        "Near-duplicate sections are always dropped.",
     )
 
 # ---- Prompt & UX ----
@@ -183,14 +228,23 @@ if save:
         "system_prompt": system_prompt,
         "answer_style": str(answer_style),
         "include_citations": bool(include_citations),
-        "max_context_chars": int(max_context_chars),
-        "updated_at": "now()",
+        "max_context_tokens": int(max_context_tokens),
+        # kept in sync for older Chat versions that still read the character cap
+        "max_context_chars": int(max_context_tokens) * 4,
+        "rerank_method": str(rerank_method),
+        "rerank_candidates": int(rerank_candidates),
+        "rerank_budget_ms": int(rerank_budget_ms),
+        "mmr_lambda": float(mmr_lambda),
+        # concrete timestamp (PostgREST doesn't evaluate "now()"); Chat uses it as the settings version
+        "updated_at": datetime.now(timezone.utc).isoformat(),
         # Backward compatible fields (if your Chat still reads these)
         "claude_model": primary.strip(),
     }
 
     try:
         svc.table("model_settings").update(payload).eq("id", settings["id"]).execute()
+        invalidate_model_settings()
+        clear_prompt_cache()
         st.success("Saved model settings.")
         st.rerun()
     except Exception as e:
@@ -208,6 +262,11 @@ with st.expander("SQL migration (add missing columns)", expanded=False):
   add column if not exists include_citations boolean,
   add column if not exists system_prompt text,
   add column if not exists answer_style text,
-  add column if not exists max_context_chars integer;""",
+  add column if not exists max_context_chars integer,
+  add column if not exists max_context_tokens integer,
+  add column if not exists rerank_method text,
+  add column if not exists rerank_candidates integer,
+  add column if not exists rerank_budget_ms integer,
+  add column if not exists mmr_lambda double precision;""",
         language="sql",
     )
\ No newline at end of file
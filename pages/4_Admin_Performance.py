@@ -0,0 +1,262 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from core.sidebar_ui import ensure_bootstrap_icons, render_sidebar
+from core.supabase_client import count_documents_by_status, list_perf_rollups, restore_supabase_session
+from core.tracing import recent_traces
+from core.ui import apply_ui
+
+st.set_page_config(page_title="Admin — Performance", page_icon="./static/logo-dmas.svg", layout="wide")
+ensure_bootstrap_icons()
+render_sidebar()
+
+# Bootstrap Icons (visual-only)
+st.markdown(
+    '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css">',
+    unsafe_allow_html=True,
+)
+
+apply_ui()
+
+
+def bi(name: str, size: str = "1em") -> str:
+    return f'<i class="bi bi-{name}" style="font-size:{size}; vertical-align:-0.125em;"></i>'
+
+
+# ------------------------- Auth -------------------------
+restore_supabase_session()
+
+user = st.session_state.get("user")
+if not user:
+    st.info("Please log in.")
+    st.switch_page("pages/0_Login.py")
+    st.stop()
+
+if st.session_state.get("role") != "admin":
+    st.error("Admin access required.")
+    st.stop()
+
+st.markdown(f"# {bi('speedometer2')} Admin — Performance", unsafe_allow_html=True)
+st.caption(
+    "Hourly rollups from perf_rollups (refreshed by refresh_perf_rollups); raw events are never scanned here."
+)
+
+
+# ------------------------- Data -------------------------
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _rollups(since_iso: str) -> pd.DataFrame:
+    try:
+        rows = list_perf_rollups(since_iso)
+    except Exception:
+        rows = []
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df["bucket_start"] = pd.to_datetime(df["bucket_start"], utc=True)
+    df["extra"] = df["extra"].apply(lambda x: x if isinstance(x, dict) else {})
+    return df
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _status_counts() -> dict:
+    try:
+        return count_documents_by_status()
+    except Exception:
+        return {}
+
+
+def _weighted(df: pd.DataFrame, col: str) -> float:
+    w = df["n"].astype(float)
+    v = df[col].astype(float)
+    mask = v.notna() & (w > 0)
+    if not mask.any():
+        return float("nan")
+    return float((v[mask] * w[mask]).sum() / w[mask].sum())
+
+
+def _extra_sum(df: pd.DataFrame, key: str) -> float:
+    return float(sum(float(e.get(key) or 0) for e in df["extra"]))
+
+
+windows = {"Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30}
+window = st.selectbox("Window", list(windows), index=0)
+# Round to the minute so the cache key is stable across reruns.
+since = (datetime.now(timezone.utc) - timedelta(days=windows[window])).replace(second=0, microsecond=0)
+df = _rollups(since.isoformat())
+
+# ------------------------- Queue -------------------------
+
+st.markdown(f"### {bi('inboxes')} Ingestion queue", unsafe_allow_html=True)
+counts = _status_counts()
+cols = st.columns(4)
+for col, status in zip(cols, ["uploaded", "processing", "ready", "failed"]):
+    col.metric(status.capitalize(), counts.get(status, "—"))
+
+if df.empty:
+    st.info("No rollups yet. Run the SQL below and schedule refresh_perf_rollups().")
+else:
+    # ------------------------- Chat latency -------------------------
+    st.markdown(f"### {bi('stopwatch')} Chat latency", unsafe_allow_html=True)
+    total = df[df["metric"] == "chat.total"]
+    if not total.empty:
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Requests", int(total["n"].sum()))
+        # Rollups keep hourly percentiles only, so the window figure is their request-weighted mean.
+        for col, p in zip((c2, c3, c4), ("p50", "p95", "p99")):
+            col.metric(
+                f"Mean hourly {p} (ms)",
+                f"{_weighted(total, p):.0f}",
+                help=f"Request-weighted mean of the hourly {p} values, not the {p} of the whole window.",
+            )
+        st.line_chart(total.set_index("bucket_start")[["p50", "p95", "p99"]])
+
+    spans = df[df["metric"].str.startswith("span:")]
+    if not spans.empty:
+        st.caption("Per stage (request-weighted mean of hourly percentiles)")
+        stage_rows = []
+        for metric, g in spans.groupby("metric"):
+            stage_rows.append({
+                "stage": metric[len("span:"):],
+                "calls": int(g["n"].sum()),
+                "p50_ms": round(_weighted(g, "p50"), 1),
+                "p95_ms": round(_weighted(g, "p95"), 1),
+                "p99_ms": round(_weighted(g, "p99"), 1),
+            })
+        st.dataframe(
+            pd.DataFrame(stage_rows).sort_values("p95_ms", ascending=False),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    # ------------------------- Tokens & cache -------------------------
+    tokens = df[df["metric"] == "chat.tokens"]
+    if not tokens.empty:
+        st.markdown(f"### {bi('coin')} Tokens & prompt cache", unsafe_allow_html=True)
+        answers = float(tokens["n"].sum())
+        uncached = _extra_sum(tokens, "input_tokens")
+        read = _extra_sum(tokens, "cache_read_input_tokens")
+        written = _extra_sum(tokens, "cache_creation_input_tokens")
+        prompt_total = uncached + read + written
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Input tokens / answer", f"{prompt_total / answers:.0f}" if answers else "—")
+        c2.metric("Output tokens / answer", f"{_extra_sum(tokens, 'output_tokens') / answers:.0f}" if answers else "—")
+        c3.metric("Context tokens / answer", f"{_extra_sum(tokens, 'context_tokens') / answers:.0f}" if answers else "—")
+        c4.metric("Cache hit rate", f"{100.0 * read / prompt_total:.1f}%" if prompt_total else "—")
+
+    # ------------------------- Worker -------------------------
+    worker = df[df["metric"] == "worker"]
+    if not worker.empty:
+        st.markdown(f"### {bi('gear-wide-connected')} Worker throughput", unsafe_allow_html=True)
+        hours = max(1.0, (datetime.now(timezone.utc) - since).total_seconds() / 3600.0)
+        seconds = _extra_sum(worker, "seconds")
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Documents processed", int(worker["n"].sum()))
+        c2.metric("Docs / hour", f"{worker['n'].sum() / hours:.2f}")
+        c3.metric("Sections / sec (while busy)", f"{_extra_sum(worker, 'sections') / seconds:.1f}" if seconds else "—")
+        per_hour = worker.set_index("bucket_start")["n"].rename("documents")
+        st.bar_chart(per_hour)
+
+# ------------------------- Live (this process) -------------------------
+
+st.markdown(f"### {bi('activity')} Live — this server process", unsafe_allow_html=True)
+traces = recent_traces(500)
+if not traces:
+    st.caption("No chat requests traced in this process yet.")
+else:
+    live: dict = {"request": [t["total_ms"] for t in traces if t.get("status") == "ok"]}
+    for t in traces:
+        for s in t.get("spans") or []:
+            live.setdefault(s["name"], []).append(s["ms"])
+    live_rows = [
+        {
+            "stage": name,
+            "calls": len(v),
+            "p50_ms": round(float(np.percentile(v, 50)), 1),
+            "p95_ms": round(float(np.percentile(v, 95)), 1),
+            "p99_ms": round(float(np.percentile(v, 99)), 1),
+        }
+        for name, v in live.items()
+        if v
+    ]
+    st.caption(f"Last {len(traces)} traces held in memory (ring buffer).")
+    st.dataframe(pd.DataFrame(live_rows), use_container_width=True, hide_index=True)
+
+with st.expander("SQL: perf_rollups table + refresh function", expanded=False):
+    st.code(
+        """create table if not exists public.perf_rollups (
+  bucket_start timestamptz not null,
+  metric text not null,  -- 'chat.total' | 'span:<stage>' | 'chat.tokens' | 'worker'
+  n integer not null,
+  p50 double precision,
+  p95 double precision,
+  p99 double precision,
+  extra jsonb not null default '{}'::jsonb,
+  primary key (bucket_start, metric)
+);
+
+create index if not exists events_action_created_at_idx on public.events (action, created_at);
+
+-- Re-aggregates the hours since p_since (idempotent upsert).
+create or replace function public.refresh_perf_rollups(
+  p_since timestamptz default date_trunc('hour', now()) - interval '1 hour'
+) returns void
+language sql
+as $$
+  insert into public.perf_rollups (bucket_start, metric, n, p50, p95, p99)
+  select date_trunc('hour', e.created_at), 'chat.total', count(*),
+         percentile_cont(0.50) within group (order by (e.details->>'total_ms')::float8),
+         percentile_cont(0.95) within group (order by (e.details->>'total_ms')::float8),
+         percentile_cont(0.99) within group (order by (e.details->>'total_ms')::float8)
+    from public.events e
+   where e.action = 'trace' and e.created_at >= p_since
+     and e.details->>'name' = 'chat.request' and e.details->>'status' = 'ok'
+   group by 1
+  on conflict (bucket_start, metric) do update
+    set n = excluded.n, p50 = excluded.p50, p95 = excluded.p95, p99 = excluded.p99;
+
+  insert into public.perf_rollups (bucket_start, metric, n, p50, p95, p99)
+  select date_trunc('hour', e.created_at), 'span:' || (s->>'name'), count(*),
+         percentile_cont(0.50) within group (order by (s->>'ms')::float8),
+         percentile_cont(0.95) within group (order by (s->>'ms')::float8),
+         percentile_cont(0.99) within group (order by (s->>'ms')::float8)
+    from public.events e, jsonb_array_elements(e.details->'spans') s
+   where e.action = 'trace' and e.created_at >= p_since
+   group by 1, 2
+  on conflict (bucket_start, metric) do update
+    set n = excluded.n, p50 = excluded.p50, p95 = excluded.p95, p99 = excluded.p99;
+
+  insert into public.perf_rollups (bucket_start, metric, n, extra)
+  select date_trunc('hour', e.created_at), 'chat.tokens', count(*),
+         jsonb_build_object(
+           'input_tokens', sum(coalesce((e.details->>'input_tokens')::bigint, 0)),
+           'output_tokens', sum(coalesce((e.details->>'output_tokens')::bigint, 0)),
+           'cache_read_input_tokens', sum(coalesce((e.details->>'cache_read_input_tokens')::bigint, 0)),
+           'cache_creation_input_tokens', sum(coalesce((e.details->>'cache_creation_input_tokens')::bigint, 0)),
+           'context_tokens', sum(coalesce((e.details->>'context_tokens')::bigint, 0))
+         )
+    from public.events e
+   where e.action = 'chat_answer' and e.created_at >= p_since
+   group by 1
+  on conflict (bucket_start, metric) do update set n = excluded.n, extra = excluded.extra;
+
+  insert into public.perf_rollups (bucket_start, metric, n, extra)
+  select date_trunc('hour', e.created_at), 'worker', count(*),
+         jsonb_build_object(
+           'sections', sum(coalesce((e.details->>'sections')::bigint, 0)),
+           'embedded', sum(coalesce((e.details->>'embedded')::bigint, 0)),
+           'seconds', sum(coalesce((e.details->>'seconds')::float8, 0))
+         )
+    from public.events e
+   where e.action = 'worker_processing_done' and e.created_at >= p_since
+   group by 1
+  on conflict (bucket_start, metric) do update set n = excluded.n, extra = excluded.extra;
+$$;
+
+-- Schedule it (pg_cron), e.g. every 5 minutes:
+-- select cron.schedule('perf-rollups', '*/5 * * * *', 'select public.refresh_perf_rollups()');""",
+        language="sql",
+    )
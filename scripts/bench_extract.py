@@ -0,0 +1,230 @@
+"""Micro-benchmarks for the PDF text clean-up stages in core/pdf_extract.py.
+
+Runs on synthetic page text (no PDF parsing), so the numbers isolate the
+pure-Python heuristics. Before timing, the fused normalizer is checked
+byte-for-byte against the previous implementation over the synthetic pages,
+the markdown corpus in data/docs and any PDFs passed with --pdf; the run
+aborts on the first mismatch. Usage (from the repo root):
+
+    python -m scripts.bench_extract --pages 1000 --repeat 5 [--pdf some.pdf ...]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+from typing import Callable, List, Optional, Tuple
+
+from core.paths import docs_dir, get_data_dir
+from core.pdf_extract import _normalize_preserve_lines, _strip_repeated_headers_footers, extract_text_by_page
+
+_WORDS = (
+    "democracia liderazgo político red incubadora programa equipo plan gestión recursos "
+    "impacto participação cidadã organização comunidade território formação"
+).split()
+
+
+def synthetic_pages(n_pages: int, seed: int = 0) -> List[str]:
+    """Pages with a fixed running header, numbered footers, headings, bullets and hyphenation."""
+    rnd = random.Random(seed)
+    pages: List[str] = []
+    for i in range(1, n_pages + 1):
+        lines = ["Democracia+ Handbook", "Confidential draft  "]
+        if rnd.random() < 0.3:
+            lines.append(f"{rnd.randint(1, 9)}.{rnd.randint(1, 9)} Section title {i}")
+        for _ in range(rnd.randint(20, 40)):
+            words = [rnd.choice(_WORDS) for _ in range(rnd.randint(8, 16))]
+            line = " ".join(words)
+            if rnd.random() < 0.1:
+                line += " demo-"
+            elif rnd.random() < 0.1:
+                line = "• " + line
+            lines.append(line + rnd.choice([".", ",", "", "  "]))
+            if rnd.random() < 0.15:
+                lines.append("")
+        lines.append("Democracia+ · 2024")
+        lines.append(f"Page {i} of {n_pages}")
+        pages.append("\n".join(lines))
+    return pages
+
+
+def _legacy_strip_repeated_headers_footers(raw_pages: List[str], n_lines: int = 2) -> List[str]:
+    """The pre-fingerprint implementation, kept here as the benchmark baseline."""
+    def top_block(lines: List[str], take_first: bool) -> Optional[str]:
+        cleaned = [l.strip() for l in lines if l.strip()]
+        if not cleaned:
+            return None
+        block_lines = cleaned[:n_lines] if take_first else cleaned[-n_lines:]
+        block = " | ".join(block_lines).strip()
+        if len(block) < 6:
+            return None
+        return block
+
+    first_blocks: List[str] = []
+    last_blocks: List[str] = []
+    for p in raw_pages:
+        lines = p.splitlines()
+        fb = top_block(lines, take_first=True)
+        lb = top_block(lines, take_first=False)
+        if fb:
+            first_blocks.append(fb)
+        if lb:
+            last_blocks.append(lb)
+
+    def most_common(blocks: List[str]) -> Tuple[Optional[str], int]:
+        if not blocks:
+            return None, 0
+        freq: dict[str, int] = {}
+        for b in blocks:
+            freq[b] = freq.get(b, 0) + 1
+        best = max(freq.items(), key=lambda kv: kv[1])
+        return best[0], best[1]
+
+    first, fcount = most_common(first_blocks)
+    last, lcount = most_common(last_blocks)
+    n_pages = max(1, len(raw_pages))
+    remove_first = first if first and (fcount / n_pages) >= 0.4 else None
+    remove_last = last if last and (lcount / n_pages) >= 0.4 else None
+
+    cleaned_pages: List[str] = []
+    for p in raw_pages:
+        lines = [l.rstrip() for l in p.splitlines()]
+        fb = top_block(lines, take_first=True)
+        lb = top_block(lines, take_first=False)
+        out_lines = lines[:]
+        if remove_first and fb == remove_first:
+            removed = 0
+            new_out = []
+            for line in out_lines:
+                if removed < n_lines and line.strip():
+                    removed += 1
+                    continue
+                new_out.append(line)
+            out_lines = new_out
+        if remove_last and lb == remove_last:
+            removed = 0
+            new_out = []
+            for line in reversed(out_lines):
+                if removed < n_lines and line.strip():
+                    removed += 1
+                    continue
+                new_out.append(line)
+            out_lines = list(reversed(new_out))
+        cleaned_pages.append("\n".join(out_lines))
+    return cleaned_pages
+
+
+def _legacy_normalize_preserve_lines(t: str) -> str:
+    """The pre-fusion normalizer (seven passes), kept as the golden reference."""
+    t = t.replace("\x00", "")
+    t = unicodedata.normalize("NFKC", t)
+    t = re.sub(r"(\w)-\n(\w)", r"\1\2", t)
+    t = t.replace("\r\n", "\n").replace("\r", "\n")
+    t = "\n".join([line.strip() for line in t.split("\n")])
+    t = re.sub(r"[ \t\u00a0]+", " ", t)
+    t = re.sub(r"\n{3,}", "\n\n", t)
+    return t.strip()
+
+
+def golden_samples(pages: List[str], pdf_paths: List[str]) -> List[Tuple[str, str]]:
+    samples = [(f"synthetic p{i}", p) for i, p in enumerate(pages, start=1)]
+    for path in sorted(glob.glob(os.path.join(docs_dir(get_data_dir()), "*.md"))):
+        with open(path, "r", encoding="utf-8") as f:
+            samples.append((os.path.basename(path), f.read()))
+    for path in pdf_paths:
+        raw_pages, _report = extract_text_by_page(path)
+        for i, p in enumerate(_strip_repeated_headers_footers(raw_pages), start=1):
+            samples.append((f"{os.path.basename(path)} p{i}", p))
+    return samples
+
+
+def verify_normalizer(samples: List[Tuple[str, str]]) -> None:
+    for label, text in samples:
+        expected = _legacy_normalize_preserve_lines(text)
+        got = _normalize_preserve_lines(text)
+        if got != expected:
+            print(f"normalizer mismatch on {label}:\n  expected={expected[:200]!r}\n  got={got[:200]!r}")
+            sys.exit(1)
+    print(f"normalizer output identical to reference on {len(samples)} samples")
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def report(label: str, baseline: float, current: float, n_pages: int) -> None:
+    print(f"{label} ({n_pages} pages)")
+    print(f"  baseline : {baseline * 1000:9.2f} ms  ({n_pages / baseline:10.0f} pages/s)")
+    print(f"  current  : {current * 1000:9.2f} ms  ({n_pages / current:10.0f} pages/s)")
+    print(f"  speedup  : {baseline / current:9.2f}x")
+
+
+def table_pages(pages: List[str], seed: int = 0) -> List[str]:
+    """The synthetic pages without their footer, each ending in a different two-row numeric table."""
+    rnd = random.Random(seed)
+    out: List[str] = []
+    for p in pages:
+        body = p.splitlines()[:-2]
+        body.append(f"Region North {rnd.randint(100, 999)} {rnd.randint(100, 999)}")
+        body.append(f"Region South {rnd.randint(100, 999)} {rnd.randint(100, 999)}")
+        out.append("\n".join(body))
+    return out
+
+
+def bench_headers_footers(pages: List[str], repeat: int) -> None:
+    legacy = _legacy_strip_repeated_headers_footers(pages)
+    current = _strip_repeated_headers_footers(pages)
+    footers_left = sum(1 for p in legacy if p.rstrip().endswith(f"of {len(pages)}"))
+    print(f"numbered footers left behind: baseline={footers_left} current="
+          f"{sum(1 for p in current if p.rstrip().endswith(f'of {len(pages)}'))}")
+    # Numeric rows that only share a layout must survive: only page numbers are folded.
+    tables = table_pages(pages)
+    tables_kept = sum(1 for p in _strip_repeated_headers_footers(tables) if "Region South" in p)
+    print(f"table rows kept: current={tables_kept}/{len(tables)}")
+    report(
+        "_strip_repeated_headers_footers",
+        best_of(lambda: _legacy_strip_repeated_headers_footers(pages), repeat),
+        best_of(lambda: _strip_repeated_headers_footers(pages), repeat),
+        len(pages),
+    )
+
+
+def bench_normalizer(samples: List[Tuple[str, str]], repeat: int) -> None:
+    texts = [t for _, t in samples]
+    report(
+        "_normalize_preserve_lines",
+        best_of(lambda: [_legacy_normalize_preserve_lines(t) for t in texts], repeat),
+        best_of(lambda: [_normalize_preserve_lines(t) for t in texts], repeat),
+        len(texts),
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pages", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--pdf", nargs="*", default=[], help="Extra PDFs for the normalizer golden check")
+    args = ap.parse_args()
+
+    pages = synthetic_pages(args.pages, seed=args.seed)
+    print(f"synthetic document: {len(pages)} pages, {sum(len(p) for p in pages):,} chars")
+    samples = golden_samples(pages, args.pdf)
+    verify_normalizer(samples)
+
+    bench_headers_footers(pages, args.repeat)
+    bench_normalizer(samples, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Ingestion throughput benchmark: generated PDFs through the worker's extract → chunk → insert path.
+
+For each document size a deterministic PDF is generated (cached in --work-dir) and every stage
+is timed on its own:
+
+    extract_text_by_page           pypdf page text
+    strip_headers_footers          _strip_repeated_headers_footers
+    normalize                      _normalize_preserve_lines, per page
+    build_sections_from_pdf        end to end, including its own extraction
+    chunk_sections                 worker chunk settings (CHUNK_* env vars)
+    payload                        worker payload rows incl. overlap token sets
+    sqlite_insert                  _section_row + _insert_section_rows batching into a local
+                                   SQLite `sections` table (SECTIONS_BATCH_* env vars)
+
+Each size runs in a fresh interpreter so peak RSS (getrusage ru_maxrss) belongs to that size
+alone. --baseline compares against an earlier --json file and exits non-zero when a stage is
+slower than the tolerance allows. Usage (from the repo root):
+
+    python -m scripts.bench_ingest --pages 10 100 1000 --repeat 3 --json bench_ingest.json
+    python -m scripts.bench_ingest --baseline bench_ingest.json --tolerance 0.25
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from scripts.bench_extract import synthetic_pages
+
+STAGES = [
+    "extract_text_by_page",
+    "strip_headers_footers",
+    "normalize",
+    "build_sections_from_pdf",
+    "chunk_sections",
+    "payload",
+    "sqlite_insert",
+]
+
+# Same defaults as worker.py
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", "48"))
+
+
+# ---------------- PDF generation ----------------
+
+def _pdf_string(line: str) -> bytes:
+    line = line.replace("•", "-").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + line.encode("cp1252", errors="replace") + b")"
+
+
+def write_pdf(path: str, pages: List[str]) -> None:
+    """Minimal uncompressed PDF: one Helvetica text object per page, one line per Tj."""
+    objs: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once the kids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids: List[int] = []
+    for text in pages:
+        ops = [b"BT /F1 10 Tf 12 TL 50 800 Td"]
+        ops.extend(_pdf_string(line) + b" Tj T*" for line in text.split("\n"))
+        ops.append(b"ET")
+        stream = b"\n".join(ops)
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objs.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objs),)
+        )
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets: List[int] = []
+    for i, obj in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(out))
+
+
+def generated_pdf(work_dir: str, n_pages: int, seed: int) -> str:
+    path = os.path.join(work_dir, f"bench_{n_pages}p_s{seed}.pdf")
+    if not os.path.exists(path):
+        write_pdf(path, synthetic_pages(n_pages, seed=seed))
+    return path
+
+
+# ---------------- SQLite stand-in ----------------
+
+# Column names as in public.sections; the vector travels as pgvector text, like over REST.
+_SCHEMA = """
+create table if not exists sections (
+  id integer primary key,
+  document_id text not null,
+  path text,
+  page_start integer,
+  page_end integer,
+  content text not null,
+  embedding text,
+  content_hash text,
+  tokens text,
+  pending_batch text
+)
+"""
+
+
+def _offline_supabase_env() -> None:
+    # core.supabase_client builds its clients at import; nothing is sent in this benchmark.
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_ANON_KEY", "offline.offline.offline")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "offline.offline.offline")
+
+
+def sqlite_insert(db_path: str, payload: List[Dict[str, Any]]) -> int:
+    """
+    The worker's write path into a local `sections` table: _section_row, pgvector encoding and
+    _plan_section_batches/_insert_section_rows with a SQLite transaction per batch instead of a
+    PostgREST request. Returns the number of batches.
+    """
+    from core import supabase_client as sb
+
+    # The stand-in table has every optional column; don't probe PostgREST for them.
+    sb._sections_has_column = lambda column: True
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    lock = threading.Lock()
+    batches = [0]
+
+    def post(batch: List[Dict[str, Any]]) -> None:
+        cols = sorted({c for r in batch for c in r})
+        sql = f"insert into sections ({', '.join(cols)}) values ({', '.join('?' * len(cols))})"
+        values = [
+            tuple(json.dumps(r.get(c), ensure_ascii=False) if c == "tokens" else r.get(c) for c in cols)
+            for r in batch
+        ]
+        with lock, conn:
+            conn.executemany(sql, values)
+            batches[0] += 1
+
+    try:
+        conn.execute("drop table if exists sections")
+        conn.execute(_SCHEMA)
+        doc_id = str(uuid.uuid4())
+        sb._insert_section_rows([sb._section_row(doc_id, s) for s in payload], post=post)
+    finally:
+        conn.close()
+    return batches[0]
+
+
+# ---------------- One size ----------------
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best = float("inf")
+    result: Any = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def bench_size(pdf_path: str, n_pages: int, repeat: int, dims: int, work_dir: str) -> Dict[str, Any]:
+    _offline_supabase_env()
+    import core.supabase_client  # noqa: F401  (imported here so sqlite_insert's timing excludes it)
+    from core.chunking import chunk_sections
+    from core.llm import overlap_tokens
+    from core.pdf_extract import (
+        _normalize_preserve_lines,
+        _strip_repeated_headers_footers,
+        build_sections_from_pdf,
+        extract_text_by_page,
+    )
+
+    seconds: Dict[str, float] = {}
+    seconds["extract_text_by_page"], (raw_pages, _report) = _timed(lambda: extract_text_by_page(pdf_path), repeat)
+    seconds["strip_headers_footers"], stripped = _timed(lambda: _strip_repeated_headers_footers(raw_pages), repeat)
+    seconds["normalize"], _ = _timed(lambda: [_normalize_preserve_lines(p) for p in stripped], repeat)
+    filename = os.path.basename(pdf_path)
+    seconds["build_sections_from_pdf"], sections = _timed(lambda: build_sections_from_pdf(pdf_path, filename), repeat)
+    seconds["chunk_sections"], chunks = _timed(
+        lambda: list(
+            chunk_sections(
+                sections,
+                max_tokens=CHUNK_MAX_TOKENS,
+                overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                min_tokens=CHUNK_MIN_TOKENS,
+            )
+        ),
+        repeat,
+    )
+    seconds["payload"], rows = _timed(
+        lambda: [
+            {
+                "path": c.path,
+                "page_start": c.page_start,
+                "page_end": c.page_end,
+                "content": c.text.strip(),
+                "content_hash": hashlib.sha256(c.text.strip().encode("utf-8")).hexdigest(),
+                "tokens": sorted(overlap_tokens(c.text)),
+            }
+            for c in chunks
+            if c.text.strip()
+        ],
+        repeat,
+    )
+    # Fake embeddings, attached outside the timings (the real ones come from OpenAI)
+    vecs = np.random.default_rng(0).standard_normal((len(rows), dims), dtype=np.float32)
+    for r, v in zip(rows, vecs):
+        r["embedding"] = v.tolist()
+    db = os.path.join(work_dir, f"bench_{n_pages}p.sqlite")
+    seconds["sqlite_insert"], batches = _timed(lambda: sqlite_insert(db, rows), repeat)
+
+    return {
+        "pages": n_pages,
+        "extracted_pages": sum(1 for p in raw_pages if p.strip()),
+        "sections": len(sections),
+        "chunks": len(rows),
+        "insert_batches": batches,
+        "seconds": seconds,
+        "pages_per_sec": n_pages / (
+            seconds["build_sections_from_pdf"] + seconds["chunk_sections"] + seconds["payload"] + seconds["sqlite_insert"]
+        ),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+# ---------------- Driver ----------------
+
+def print_result(r: Dict[str, Any]) -> None:
+    print(
+        f"\n{r['pages']} pages → {r['sections']} sections, {r['chunks']} chunks in {r['insert_batches']} "
+        f"insert batches ({r['extracted_pages']} pages with text)"
+    )
+    for stage in STAGES:
+        s = r["seconds"][stage]
+        print(f"  {stage:<26}{s * 1000:10.2f} ms  {r['pages'] / s if s else float('inf'):10.0f} pages/s")
+    print(f"  {'ingest (sections→rows)':<26}{r['pages_per_sec']:10.1f} pages/s")
+    print(f"  {'peak RSS':<26}{r['peak_rss_mb']:10.1f} MB")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float, min_ms: float) -> bool:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["pages"]: r for r in json.load(f)["results"]}
+    ok = True
+    print(f"\nvs {baseline_path} (tolerance {tolerance:.0%})")
+    for r in results:
+        base = baseline.get(r["pages"])
+        if not base:
+            continue
+        for stage in STAGES:
+            old, new = base["seconds"].get(stage), r["seconds"][stage]
+            if not old:
+                continue
+            change = new / old - 1.0
+            # Sub-millisecond stages jitter by more than any sensible tolerance
+            flag = "REGRESSION" if change > tolerance and (new - old) * 1000 > min_ms else ""
+            ok = ok and not flag
+            print(f"  {r['pages']:>5}p {stage:<26}{old * 1000:9.2f} → {new * 1000:9.2f} ms  {change:+7.1%} {flag}")
+    return ok
+
+
+def run_isolated(args: argparse.Namespace, n_pages: int) -> Dict[str, Any]:
+    cmd = [
+        sys.executable, "-m", "scripts.bench_ingest", "--single", str(n_pages),
+        "--repeat", str(args.repeat), "--seed", str(args.seed), "--dims", str(args.dims),
+        "--work-dir", args.work_dir,
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        sys.exit(f"bench for {n_pages} pages failed (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--dims", type=int, default=1536, help="Fake embedding width for the inserts")
+    ap.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "dplus_bench_ingest"))
+    ap.add_argument("--json", help="Write results here")
+    ap.add_argument("--baseline", help="Earlier --json output to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown per stage (0.25 = 25%%)")
+    ap.add_argument("--min-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this")
+    ap.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    if args.single:
+        pdf = generated_pdf(args.work_dir, args.single, args.seed)
+        print(json.dumps(bench_size(pdf, args.single, args.repeat, args.dims, args.work_dir)))
+        return
+
+    results: List[Dict[str, Any]] = []
+    for n in args.pages:
+        # Generate in the parent so the PDF writer doesn't count towards the child's RSS
+        pdf = generated_pdf(args.work_dir, n, args.seed)
+        print(f"{os.path.basename(pdf)}: {os.path.getsize(pdf) / 1e6:.1f} MB", flush=True)
+        r = run_isolated(args, n)
+        print_result(r)
+        results.append(r)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"seed": args.seed, "repeat": args.repeat, "results": results}, f, indent=2)
+    baseline_ok: Optional[bool] = None
+    if args.baseline:
+        baseline_ok = compare(results, args.baseline, args.tolerance, args.min_ms)
+    if baseline_ok is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
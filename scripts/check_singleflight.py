@@ -0,0 +1,127 @@
+"""Concurrency checks for core/singleflight.py.
+
+Runs a leader and followers on one key with a slow fn and checks that:
+
+    - fn runs once and every caller gets its result (followers with shared=True)
+    - followers see every event the leader published, including ones from before they joined
+    - an exception raised by fn reaches every caller
+    - an exception from the leader's own emit, including a BaseException subclass like
+      Streamlit's RerunException/StopException, reaches the leader only: fn keeps running and
+      followers still get the full stream and the result
+
+Exits non-zero on the first failure. Usage (from the repo root):
+
+    python -m scripts.check_singleflight
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from core.singleflight import SingleFlight
+
+EVENTS = 5
+STEP_SECONDS = 0.03
+
+
+class FakeRerun(BaseException):
+    """Stands in for streamlit's ScriptControlException subclasses."""
+
+
+def _fail(msg: str) -> None:
+    sys.exit(f"FAIL: {msg}")
+
+
+def _run(
+    leader_emit: Callable[[str, Any], None], fn_error: Optional[BaseException] = None, followers: int = 3
+) -> Dict[str, Any]:
+    flights: SingleFlight = SingleFlight()
+    runs: List[int] = []
+    out: Dict[str, Any] = {}
+
+    def fn(publish: Callable[[str, Any], None]) -> str:
+        runs.append(1)
+        for i in range(EVENTS):
+            publish("delta", i)
+            time.sleep(STEP_SECONDS)
+        if fn_error is not None:
+            raise fn_error
+        return "answer"
+
+    def caller(name: str, emit: Callable[[str, Any], None]) -> None:
+        try:
+            out[name] = flights.do("key", fn, emit)
+        except BaseException as e:
+            out[name] = e
+
+    leader = threading.Thread(target=caller, args=("leader", leader_emit))
+    leader.start()
+    time.sleep(STEP_SECONDS * 1.5)  # join after the first events were published
+    seen: Dict[str, List[Any]] = {}
+    threads = []
+    for n in range(followers):
+        name = f"follower{n}"
+        seen[name] = []
+        threads.append(threading.Thread(target=caller, args=(name, lambda k, d, s=seen[name]: s.append(d))))
+    for t in threads:
+        t.start()
+    for t in [leader, *threads]:
+        t.join(timeout=10)
+    out["runs"] = len(runs)
+    out["seen"] = seen
+    out["in_flight"] = flights.in_flight()
+    return out
+
+
+def _check_followers(out: Dict[str, Any], label: str) -> None:
+    for name, events in out["seen"].items():
+        if out[name] != ("answer", True):
+            _fail(f"{label}: {name} got {out[name]!r}, expected ('answer', True)")
+        if events != list(range(EVENTS)):
+            _fail(f"{label}: {name} saw events {events}, expected {list(range(EVENTS))}")
+
+
+def check_shared() -> None:
+    out = _run(lambda k, d: None)
+    if out["runs"] != 1:
+        _fail(f"shared: fn ran {out['runs']} times")
+    if out["leader"] != ("answer", False):
+        _fail(f"shared: leader got {out['leader']!r}")
+    _check_followers(out, "shared")
+    if out["in_flight"]:
+        _fail("shared: key still registered after the call finished")
+
+
+def check_fn_error() -> None:
+    out = _run(lambda k, d: None, fn_error=ValueError("boom"))
+    for name in ["leader", *out["seen"]]:
+        if not isinstance(out[name], ValueError):
+            _fail(f"fn error: {name} got {out[name]!r}, expected the ValueError")
+
+
+def check_leader_emit_error(exc_type: type) -> None:
+    def emit(kind: str, data: Any) -> None:
+        if data == 1:
+            raise exc_type()
+
+    out = _run(emit)
+    label = f"leader emit raising {exc_type.__name__}"
+    if out["runs"] != 1:
+        _fail(f"{label}: fn ran {out['runs']} times")
+    if not isinstance(out["leader"], exc_type):
+        _fail(f"{label}: leader got {out['leader']!r}, expected {exc_type.__name__}")
+    _check_followers(out, label)
+
+
+def main() -> None:
+    check_shared()
+    check_fn_error()
+    check_leader_emit_error(RuntimeError)
+    check_leader_emit_error(FakeRerun)
+    print("ok: shared result and events, fn errors, leader emit errors (Exception and BaseException)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Round-trip checks for core/vector_codec.py (pgvector text encoding and decoding).
+
+Exact expected encodings for a few fixed vectors, then random 1536-d vectors encoded at
+PGVECTOR_PRECISION and decoded again: every component must survive within the precision and
+cosine similarity must be unchanged to 1e-9. Exits non-zero on the first failure and prints
+the payload size against JSON float lists. Usage (from the repo root):
+
+    python -m scripts.check_vector_codec [--vectors 200] [--dims 1536]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, List, Tuple
+
+import numpy as np
+
+from core.vector_codec import PGVECTOR_PRECISION, decode_embedding, from_pgvector_text, to_pgvector_text
+
+# (input, expected to_pgvector_text output)
+ENCODE_CASES: List[Tuple[Any, Any]] = [
+    (None, None),
+    ([], "[]"),
+    ([1, -0.5, 0.0], "[1,-0.5,0]"),
+    ([0.1234567891, 1e-7], "[0.123457,1e-07]"),
+    (np.asarray([0.25, -2.0], dtype=np.float32), "[0.25,-2]"),
+    ("[0.1,0.2]", "[0.1,0.2]"),  # already encoded: passed through
+]
+
+# (input, expected from_pgvector_text output)
+DECODE_CASES: List[Tuple[Any, Any]] = [
+    (None, None),
+    ("[]", []),
+    (" [ ] ", []),
+    ("[1,-0.5,1e-07]", [1.0, -0.5, 1e-07]),
+    ([1, 2.5], [1.0, 2.5]),  # JSON list from PostgREST
+]
+
+
+def _fail(msg: str) -> None:
+    sys.exit(f"FAIL: {msg}")
+
+
+def check_fixed() -> None:
+    for value, want in ENCODE_CASES:
+        got = to_pgvector_text(value)
+        if got != want:
+            _fail(f"to_pgvector_text({value!r}) = {got!r}, expected {want!r}")
+    for value, want in DECODE_CASES:
+        got = from_pgvector_text(value)
+        if got != want:
+            _fail(f"from_pgvector_text({value!r}) = {got!r}, expected {want!r}")
+
+    # decode_embedding: str, list and None inputs
+    for value in ("[0.5,-1]", [0.5, -1]):
+        got = decode_embedding(value)
+        if not (isinstance(got, np.ndarray) and got.dtype == np.float32 and got.tolist() == [0.5, -1.0]):
+            _fail(f"decode_embedding({value!r}) = {got!r}")
+    for value in (None, "[]", []):
+        if decode_embedding(value) is not None:
+            _fail(f"decode_embedding({value!r}) should be None")
+
+
+def check_round_trip(n_vectors: int, dims: int, seed: int = 0) -> Tuple[int, int]:
+    """Returns (pgvector text bytes, JSON bytes) over all vectors."""
+    rng = np.random.default_rng(seed)
+    rtol = 0.5 * 10.0 ** (1 - PGVECTOR_PRECISION)
+    text_bytes = json_bytes = 0
+    for i in range(n_vectors):
+        v = rng.standard_normal(dims).astype(np.float32)
+        v /= np.linalg.norm(v)
+        if i % 2:
+            v = v.tolist()  # both ndarray and list inputs
+        text = to_pgvector_text(v)
+        back = np.asarray(from_pgvector_text(text), dtype=np.float64)
+        ref = np.asarray(v, dtype=np.float64)
+        if back.shape != ref.shape:
+            _fail(f"vector {i}: decoded shape {back.shape}, expected {ref.shape}")
+        if not np.allclose(back, ref, rtol=rtol, atol=1e-12):
+            worst = float(np.max(np.abs(back - ref) / np.maximum(np.abs(ref), 1e-12)))
+            _fail(f"vector {i}: relative error {worst:.2e} over {rtol:.1e}")
+        cos = float(np.dot(back, ref) / (np.linalg.norm(back) * np.linalg.norm(ref)))
+        if abs(cos - 1.0) > 1e-9:
+            _fail(f"vector {i}: cosine to the original is {cos!r}")
+        emb = decode_embedding(text)
+        if emb is None or not np.array_equal(emb, back.astype(np.float32)):
+            _fail(f"vector {i}: decode_embedding disagrees with from_pgvector_text")
+        text_bytes += len(text)
+        json_bytes += len(json.dumps([float(x) for x in ref]))
+    return text_bytes, json_bytes
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--vectors", type=int, default=200)
+    ap.add_argument("--dims", type=int, default=1536)
+    args = ap.parse_args()
+
+    check_fixed()
+    text_bytes, json_bytes = check_round_trip(args.vectors, args.dims)
+    print(
+        f"ok: {len(ENCODE_CASES) + len(DECODE_CASES)} fixed cases, {args.vectors} x {args.dims}-d round trips; "
+        f"pgvector text {text_bytes / args.vectors / args.dims:.1f} B/float vs JSON "
+        f"{json_bytes / args.vectors / args.dims:.1f} B/float ({json_bytes / max(text_bytes, 1):.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""Offline quality/latency evaluation of the local retrieval backends.
+
+Loads the structured index under $DPLUS_DATA_DIR (load_structured_index), runs a labeled
+query set and reports recall@k, MRR, nDCG and p50/p95/p99 search latency per backend:
+
+    cosine        core.retrieval.cosine_top_k over the float32 matrix
+    hybrid        core.retrieval.hybrid_retrieve_sections (cosine + BM25, RRF)
+    float16       half-precision matrix, scored in float16
+    int8          per-row symmetric int8 codes, integer dot products
+    int8+rescore  int8 shortlist (--rescore x k rows) re-scored in float32
+
+Query embeddings come from an "embedding" list on each query line, a .npy matrix (row i ==
+line i) passed with --query-embeddings, or --embed, which embeds the questions with OpenAI for
+this run. --write-query-embeddings saves them as a .npy once so later runs are offline.
+
+evals/queries.jsonl is a labeled set for the documents in data/structured (their section
+embeddings are text-embedding-3-large). Its query embeddings aren't committed; embed them once:
+
+    python -m scripts.eval_retrieval --queries evals/queries.jsonl --embedding-model text-embedding-3-large \\
+        --write-query-embeddings evals/queries__text-embedding-3-large.npy
+    python -m scripts.eval_retrieval --queries evals/queries.jsonl --embedding-model text-embedding-3-large \\
+        --query-embeddings evals/queries__text-embedding-3-large.npy --k 1 5 10
+
+Query file (JSONL), one object per line; at least one of the expected_* keys is required:
+
+    {"question": "...", "expected_section_ids": ["<doc_id>::s0003"]}
+    {"question": "...", "expected_pages": [12, 13], "doc_id": "<doc_id>"}
+
+A page target is hit by any section whose page range contains it (restricted to doc_id
+when given).
+
+--doc-ids scopes every backend to those documents, like the chat page's "Search in" filter:
+cosine and hybrid go through the retrieve_sections/hybrid_retrieve_sections doc_ids path with
+load_doc_partitions, the quantized indexes are built over the scoped rows only. Queries whose
+labels point only at other documents are skipped.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+Target = Tuple[str, Any]
+
+
+# ---------------- Queries ----------------
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    queries: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            q = json.loads(line)
+            if not q.get("question"):
+                sys.exit(f"{path}:{n}: missing 'question'")
+            if not (q.get("expected_section_ids") or q.get("expected_pages")):
+                sys.exit(f"{path}:{n}: needs expected_section_ids or expected_pages")
+            queries.append(q)
+    return queries
+
+
+def query_vectors(queries: List[Dict[str, Any]], path: Optional[str], dim: int) -> np.ndarray:
+    if path:
+        Q = np.load(path)
+        if Q.shape[0] != len(queries):
+            sys.exit(f"{path}: {Q.shape[0]} rows for {len(queries)} queries")
+    else:
+        missing = [i for i, q in enumerate(queries) if not q.get("embedding")]
+        if missing:
+            sys.exit(
+                f"{len(missing)} queries have no 'embedding'; pass --embed or --query-embeddings "
+                "(create it with --write-query-embeddings)"
+            )
+        Q = np.asarray([q["embedding"] for q in queries], dtype=np.float32)
+    if Q.ndim != 2 or Q.shape[1] != dim:
+        sys.exit(f"query embeddings have shape {Q.shape}; the index has dimension {dim}")
+    return Q.astype(np.float32)
+
+
+def write_query_embeddings(queries: List[Dict[str, Any]], model: str, out: str) -> None:
+    """The only online step: embed the questions once and save them as a fixture."""
+    from core.index_store import _embed_texts
+
+    Q = _embed_texts(model, [q["question"] for q in queries])
+    np.save(out, Q.astype(np.float32))
+    print(f"wrote {Q.shape[0]} x {Q.shape[1]} query embeddings ({model}) to {out}")
+
+
+# ---------------- Relevance ----------------
+
+def _doc_of(section: Dict[str, Any]) -> str:
+    return str(section.get("section_id") or "").split("::", 1)[0]
+
+
+def section_targets(section: Dict[str, Any], q: Dict[str, Any]) -> Set[Target]:
+    """Which of the query's expected targets this section hits."""
+    hit: Set[Target] = set()
+    sid = section.get("section_id")
+    if sid in set(q.get("expected_section_ids") or []):
+        hit.add(("id", sid))
+    pages = q.get("expected_pages") or []
+    if pages and (not q.get("doc_id") or _doc_of(section) == q["doc_id"]):
+        lo, hi = int(section.get("page_start") or 0), int(section.get("page_end") or 0)
+        hit.update(("page", int(p)) for p in pages if lo <= int(p) <= hi)
+    return hit
+
+
+def query_targets(q: Dict[str, Any]) -> Set[Target]:
+    return {("id", s) for s in q.get("expected_section_ids") or []} | {
+        ("page", int(p)) for p in q.get("expected_pages") or []
+    }
+
+
+def score_ranking(
+    rows: Sequence[int],
+    sections: List[Dict[str, Any]],
+    q: Dict[str, Any],
+    ks: Sequence[int],
+) -> Dict[str, float]:
+    """recall@k per k, plus MRR and nDCG over the deepest k (binary gains, new targets only)."""
+    targets = query_targets(q)
+    covered: Set[Target] = set()
+    first_hit = 0
+    dcg = 0.0
+    recall: Dict[int, float] = {}
+    k_max = max(ks)
+    for rank, r in enumerate(rows[:k_max], start=1):
+        new = section_targets(sections[r], q) - covered
+        if new:
+            covered |= new
+            dcg += 1.0 / math.log2(rank + 1)
+            first_hit = first_hit or rank
+        if rank in ks:
+            recall[rank] = len(covered) / len(targets)
+    for k in ks:
+        recall.setdefault(k, len(covered) / len(targets))
+    idcg = sum(1.0 / math.log2(i + 1) for i in range(1, min(k_max, len(targets)) + 1))
+    out = {f"recall@{k}": recall[k] for k in ks}
+    out["mrr"] = 1.0 / first_hit if first_hit else 0.0
+    out[f"ndcg@{k_max}"] = dcg / idcg if idcg else 0.0
+    return out
+
+
+# ---------------- Backends ----------------
+
+def _unit_rows(E: np.ndarray) -> np.ndarray:
+    E = np.nan_to_num(np.asarray(E, dtype=np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+    return E / np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-8)
+
+
+def _top(scores: np.ndarray, k: int) -> List[int]:
+    k = min(int(k), scores.shape[0])
+    idx = np.argpartition(-scores, kth=k - 1)[:k]
+    return [int(i) for i in idx[np.argsort(-scores[idx])]]
+
+
+class Float16Index:
+    def __init__(self, embeddings: np.ndarray) -> None:
+        self.E = _unit_rows(embeddings).astype(np.float16)
+
+    def search(self, q: np.ndarray, k: int) -> List[int]:
+        return _top((self.E @ q.astype(np.float16)).astype(np.float32), k)
+
+
+class Int8Index:
+    """Per-row symmetric int8 codes over unit rows; scores are int32 dot products x scales."""
+
+    def __init__(self, embeddings: np.ndarray, rescore: int = 0) -> None:
+        U = _unit_rows(embeddings)
+        self.scale = np.maximum(np.abs(U).max(axis=1), 1e-8) / 127.0
+        self.codes = np.round(U / self.scale[:, None]).astype(np.int8)
+        # float32 rows are only kept for the re-scoring variant
+        self.U = U if rescore else None
+        self.rescore = int(rescore)
+
+    def search(self, q: np.ndarray, k: int) -> List[int]:
+        qu = q / max(float(np.linalg.norm(q)), 1e-8)
+        q_scale = max(float(np.abs(qu).max()), 1e-8) / 127.0
+        q8 = np.round(qu / q_scale).astype(np.int32)
+        scores = (self.codes @ q8).astype(np.float32) * self.scale
+        if self.U is None:
+            return _top(scores, k)
+        short = _top(scores, k * self.rescore)
+        exact = self.U[short] @ qu
+        return [short[i] for i in _top(exact, k)]
+
+
+def _dense(index: Any, rows: Optional[np.ndarray] = None) -> Callable[[str, np.ndarray, int], List[int]]:
+    if rows is None:
+        return lambda text, q, k: index.search(q, k)
+    # index was built over embeddings[rows]; map its row numbers back to the full index
+    return lambda text, q, k: [int(rows[i]) for i in index.search(q, k)]
+
+
+def query_in_scope(q: Dict[str, Any], doc_ids: Set[str]) -> bool:
+    """False only when every label of q names a document outside doc_ids."""
+    docs = {str(sid).split("::", 1)[0] for sid in q.get("expected_section_ids") or []}
+    if q.get("expected_pages"):
+        if not q.get("doc_id"):
+            return True
+        docs.add(str(q["doc_id"]))
+    return bool(docs & doc_ids)
+
+
+def build_backends(
+    sections: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    names: Sequence[str],
+    rescore: int,
+    candidates: int,
+    doc_ids: Optional[List[str]] = None,
+    partitions: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+) -> Dict[str, Callable[[str, np.ndarray, int], List[int]]]:
+    from core.bm25 import BM25Index
+    from core.retrieval import cosine_top_k, hybrid_retrieve_sections, retrieve_sections, scope_ranges
+
+    row_of = {id(s): i for i, s in enumerate(sections)}
+    rows: Optional[np.ndarray] = None
+    dense_embeddings = embeddings
+    if doc_ids is not None:
+        rows = np.concatenate(
+            [np.arange(a, b) for a, b in scope_ranges(partitions or {}, doc_ids)] or [np.zeros(0, dtype=np.int64)]
+        )
+        dense_embeddings = embeddings[rows]
+
+    backends: Dict[str, Callable[[str, np.ndarray, int], List[int]]] = {}
+    for name in names:
+        if name == "cosine" and doc_ids is None:
+            backends[name] = lambda text, q, k: [i for i, _ in cosine_top_k(embeddings, q, k)]
+        elif name == "cosine":
+            backends[name] = lambda text, q, k: [
+                row_of[id(s)]
+                for s, _ in retrieve_sections(
+                    sections, embeddings, text, "", k, query_vec=q, doc_ids=doc_ids, partitions=partitions
+                )
+            ]
+        elif name == "hybrid":
+            # Same documents as load_bm25_index, built here to stay outside Streamlit's cache
+            bm25 = BM25Index(f"{s.get('path') or ''}\n{s.get('text') or ''}" for s in sections)
+            backends[name] = lambda text, q, k, bm25=bm25: [
+                row_of[id(s)]
+                for s, _ in hybrid_retrieve_sections(
+                    sections, embeddings, bm25, text, "", k, candidates=candidates, query_vec=q,
+                    doc_ids=doc_ids, partitions=partitions,
+                )
+            ]
+        elif name == "float16":
+            backends[name] = _dense(Float16Index(dense_embeddings), rows)
+        elif name == "int8":
+            backends[name] = _dense(Int8Index(dense_embeddings), rows)
+        elif name == "int8+rescore":
+            backends[name] = _dense(Int8Index(dense_embeddings, rescore), rows)
+        else:
+            sys.exit(f"unknown backend {name!r}")
+    return backends
+
+
+# ---------------- Run ----------------
+
+def evaluate(
+    search: Callable[[str, np.ndarray, int], List[int]],
+    sections: List[Dict[str, Any]],
+    queries: List[Dict[str, Any]],
+    Q: np.ndarray,
+    ks: Sequence[int],
+    warmup: int,
+) -> Dict[str, float]:
+    k_max = max(ks)
+    for i in range(min(warmup, len(queries))):
+        search(queries[i]["question"], Q[i], k_max)
+
+    totals: Dict[str, float] = {}
+    latencies: List[float] = []
+    for q, qv in zip(queries, Q):
+        t0 = time.perf_counter()
+        rows = search(q["question"], qv, k_max)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        for name, v in score_ranking(rows, sections, q, ks).items():
+            totals[name] = totals.get(name, 0.0) + v
+
+    out = {name: v / len(queries) for name, v in totals.items()}
+    for p in (50, 95, 99):
+        out[f"p{p}_ms"] = float(np.percentile(latencies, p))
+    return out
+
+
+def print_table(results: Dict[str, Dict[str, float]]) -> None:
+    cols = list(next(iter(results.values())).keys())
+    print(f"{'backend':<14}" + "".join(f"{c:>11}" for c in cols))
+    for name, row in results.items():
+        cells = "".join(f"{row[c]:>11.2f}" if c.endswith("_ms") else f"{row[c]:>11.3f}" for c in cols)
+        print(f"{name:<14}{cells}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--queries", required=True, help="Labeled queries (JSONL)")
+    ap.add_argument("--query-embeddings", help=".npy fixture aligned with --queries")
+    ap.add_argument("--write-query-embeddings", metavar="OUT", help="Embed the questions (online) and exit")
+    ap.add_argument("--embed", action="store_true", help="Embed the questions (online) for this run")
+    ap.add_argument("--embedding-model", default=os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small"))
+    ap.add_argument("--data-dir", help="Overrides DPLUS_DATA_DIR")
+    ap.add_argument("--doc-ids", nargs="+", metavar="DOC_ID", help="Scope retrieval to these documents")
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    ap.add_argument(
+        "--backends",
+        nargs="+",
+        default=["cosine", "hybrid", "float16", "int8", "int8+rescore"],
+    )
+    ap.add_argument("--rescore", type=int, default=4, help="int8+rescore shortlist = rescore x k")
+    ap.add_argument("--candidates", type=int, default=50, help="Hybrid candidates per ranking")
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--json", help="Also write the results to this file")
+    args = ap.parse_args()
+
+    if args.data_dir:
+        os.environ["DPLUS_DATA_DIR"] = args.data_dir
+    queries = load_queries(args.queries)
+    if args.write_query_embeddings:
+        write_query_embeddings(queries, args.embedding_model, args.write_query_embeddings)
+        return
+
+    from core.index_store import load_structured_index
+
+    sections, embeddings = load_structured_index(args.embedding_model)
+    if not sections:
+        sys.exit(f"no structured index for {args.embedding_model} under {os.environ.get('DPLUS_DATA_DIR', 'data')}")
+    if args.embed:
+        from core.index_store import _embed_texts
+
+        for q, v in zip(queries, _embed_texts(args.embedding_model, [q["question"] for q in queries])):
+            q["embedding"] = v.tolist()
+    Q = query_vectors(queries, None if args.embed else args.query_embeddings, int(embeddings.shape[1]))
+
+    partitions = None
+    if args.doc_ids:
+        from core.index_store import load_doc_partitions
+
+        partitions = load_doc_partitions(args.embedding_model)
+        missing = [d for d in args.doc_ids if d not in partitions]
+        if missing:
+            print(f"warning: {len(missing)} --doc-ids are not in the index: {', '.join(missing)}")
+        kept = [i for i, q in enumerate(queries) if query_in_scope(q, set(args.doc_ids))]
+        if not kept:
+            sys.exit("no query is labeled with a document in --doc-ids")
+        print(f"scope: {len(args.doc_ids)} documents; {len(kept)} of {len(queries)} queries in scope")
+        queries, Q = [queries[i] for i in kept], Q[kept]
+
+    known = {s.get("section_id") for s in sections}
+    unknown = sum(1 for q in queries for sid in q.get("expected_section_ids") or [] if sid not in known)
+    if unknown:
+        print(f"warning: {unknown} expected section ids are not in the index")
+
+    ks = sorted(set(int(k) for k in args.k if k > 0))
+    print(f"index: {len(sections)} sections x {embeddings.shape[1]} dims; {len(queries)} queries")
+    backends = build_backends(
+        sections, embeddings, args.backends, args.rescore, args.candidates, args.doc_ids, partitions
+    )
+    results = {
+        name: evaluate(search, sections, queries, Q, ks, args.warmup) for name, search in backends.items()
+    }
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"embedding_model": args.embedding_model, "sections": len(sections), "queries": len(queries),
+                 "doc_ids": args.doc_ids, "results": results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""Load generator for the chat pipeline (core.chat_pipeline.run_chat) against local stubs.
+
+Two parts:
+
+    stubs   one HTTP server standing in for OpenAI embeddings (/v1/embeddings), Anthropic
+            Messages (/v1/messages, plain or streamed) and Supabase PostgREST (/rest/v1/...),
+            each with configurable latency
+    run     points the app's clients at the stubs and drives run_chat from N threads per
+            concurrency level, reporting throughput and latency percentiles
+
+A Streamlit replica runs every session's script as a thread in one process, so a level of
+N threads here approximates N users waiting on one replica at the same time. The stubs run in
+their own process (started automatically unless --stub-url is given), so they don't compete
+for the driver's GIL. Threads draw from a handful of prompts, so with the pipeline's coalescing
+on most requests would share another's answer; runs therefore set CHAT_COALESCE=0 and every
+request does its own work, which is what the sizing line needs. --coalesce measures the shared
+case instead (the sizing line is then labeled as such and is not a capacity figure).
+Usage (from the repo root):
+
+    python -m scripts.loadgen run --concurrency 1 2 4 8 16 32 --duration 20 --stream \\
+        --ttft-ms 600 --token-ms 15 --answer-tokens 250 --json loadgen.json
+    python -m scripts.loadgen stubs --port 8765        # stubs only, e.g. on another host
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+import numpy as np
+
+_VOCAB = (
+    "democracia liderazgo político red incubadora programa equipo plan gestión recursos impacto "
+    "participação cidadã organização comunidade território formação lideranças critérios rede "
+    "campaign volunteers strategy community network political leadership programs"
+).split()
+
+PROMPTS = [
+    "¿Cómo funciona el programa de la incubadora de liderazgo político?",
+    "Como a rede organiza a formação de lideranças no território?",
+    "What is the campaign strategy for volunteers in the community?",
+    "Give me a summary of the plan de gestión de recursos del equipo",
+    "Quais são os critérios de impacto da incubadora?",
+    "How does the network support political leadership programs?",
+]
+
+
+# ---------------- Stubs ----------------
+
+class StubConfig:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.embed_ms = args.embed_ms
+        self.db_ms = args.db_ms
+        self.rpc_ms = args.rpc_ms
+        self.ttft_ms = args.ttft_ms
+        self.token_ms = args.token_ms
+        self.answer_tokens = args.answer_tokens
+        self.jitter = args.jitter
+        self.dims = args.dims
+        rng = np.random.default_rng(0)
+        rnd = random.Random(0)
+        # A fixed pool of sections; RPCs return random subsets of it
+        self.sections: List[Dict[str, Any]] = []
+        for i in range(64):
+            v = rng.standard_normal(self.dims).astype(np.float32)
+            v /= np.linalg.norm(v)
+            words = [rnd.choice(_VOCAB) for _ in range(rnd.randint(80, 220))]
+            self.sections.append({
+                "id": str(uuid.UUID(int=i + 1)),
+                "document_id": str(uuid.UUID(int=1000 + i // 8)),
+                "path": f"handbook.pdf > Section {i}",
+                "page_start": i + 1,
+                "page_end": i + 1,
+                "content": " ".join(words) + ".",
+                "tokens": sorted(set(words)),
+                "embedding": "[" + ",".join(f"{x:.6g}" for x in v) + "]",
+                "similarity": 0.0,
+            })
+
+    def sleep(self, ms: float) -> None:
+        if ms > 0:
+            j = self.jitter
+            time.sleep(ms * random.uniform(1.0 - j, 1.0 + j) / 1000.0)
+
+
+def _handler(cfg: StubConfig) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _body(self) -> Any:
+            n = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(n) if n else b""
+            try:
+                return json.loads(raw) if raw else None
+            except ValueError:
+                return None
+
+        def _json(self, obj: Any, status: int = 200) -> None:
+            data = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                return self._json({"ok": True})
+            cfg.sleep(cfg.db_ms)
+            # Empty tables: default model settings, no rate-limit rows, untitled conversations
+            self._json([])
+
+        def do_HEAD(self) -> None:
+            cfg.sleep(cfg.db_ms)
+            self.send_response(200)
+            self.send_header("Content-Range", "0-0/0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_PATCH(self) -> None:
+            self._body()
+            cfg.sleep(cfg.db_ms)
+            self._json([])
+
+        def do_POST(self) -> None:
+            body = self._body()
+            path = urlsplit(self.path).path
+            if path == "/v1/embeddings":
+                return self._embeddings(body or {})
+            if path == "/v1/messages":
+                return self._messages(body or {})
+            if path.startswith("/rest/v1/rpc/match_sections"):
+                return self._match(body or {})
+            cfg.sleep(cfg.db_ms)
+            rows = body if isinstance(body, list) else [body or {}]
+            self._json(rows, status=201)
+
+        # --- OpenAI ---
+        def _embeddings(self, body: Dict[str, Any]) -> None:
+            cfg.sleep(cfg.embed_ms)
+            inputs = body.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            rng = np.random.default_rng(abs(hash(str(inputs))) % (2 ** 32))
+            data = [
+                {"object": "embedding", "index": i, "embedding": rng.standard_normal(cfg.dims).round(6).tolist()}
+                for i in range(len(inputs))
+            ]
+            n = sum(len(str(x)) // 4 for x in inputs)
+            self._json({
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": n, "total_tokens": n},
+            })
+
+        # --- Supabase RPC ---
+        def _match(self, body: Dict[str, Any]) -> None:
+            cfg.sleep(cfg.rpc_ms)
+            k = int(body.get("match_count") or 8)
+            picked = random.sample(cfg.sections, min(k, len(cfg.sections)))
+            hits = [dict(h, similarity=round(0.9 - 0.02 * i, 4), rank=0.1) for i, h in enumerate(picked)]
+            self._json(hits)
+
+        # --- Anthropic ---
+        def _messages(self, body: Dict[str, Any]) -> None:
+            words = [random.choice(_VOCAB) for _ in range(cfg.answer_tokens)]
+            input_tokens = len(json.dumps(body)) // 4
+            model = body.get("model") or "stub"
+            if not body.get("stream"):
+                cfg.sleep(cfg.ttft_ms + cfg.token_ms * cfg.answer_tokens)
+                return self._json({
+                    "id": f"msg_{uuid.uuid4().hex[:12]}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [{"type": "text", "text": " ".join(words)}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": len(words)},
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def event(kind: str, data: Dict[str, Any]) -> None:
+                payload = f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+                self.wfile.flush()
+
+            cfg.sleep(cfg.ttft_ms)
+            event("message_start", {"type": "message_start", "message": {
+                "id": f"msg_{uuid.uuid4().hex[:12]}", "type": "message", "role": "assistant", "model": model,
+                "content": [], "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+            }})
+            event("content_block_start", {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}})
+            for i, w in enumerate(words):
+                if i:
+                    cfg.sleep(cfg.token_ms)
+                event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": (" " if i else "") + w}})
+            event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            event("message_delta", {"type": "message_delta",
+                                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                    "usage": {"output_tokens": len(words)}})
+            event("message_stop", {"type": "message_stop"})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve_stubs(args: argparse.Namespace) -> None:
+    server = ThreadingHTTPServer((args.host, args.port), _handler(StubConfig(args)))
+    server.daemon_threads = True
+    print(f"stubs listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+def _stub_flags(args: argparse.Namespace) -> List[str]:
+    return [
+        "--embed-ms", str(args.embed_ms), "--db-ms", str(args.db_ms), "--rpc-ms", str(args.rpc_ms),
+        "--ttft-ms", str(args.ttft_ms), "--token-ms", str(args.token_ms),
+        "--answer-tokens", str(args.answer_tokens), "--jitter", str(args.jitter), "--dims", str(args.dims),
+    ]
+
+
+def start_stub_process(args: argparse.Namespace) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "scripts.loadgen", "stubs", "--host", "127.0.0.1", "--port", str(args.stub_port)]
+    proc = subprocess.Popen(cmd + _stub_flags(args))
+    url = f"http://127.0.0.1:{args.stub_port}"
+    for _ in range(100):
+        try:
+            with urlopen(f"{url}/health", timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    sys.exit(f"stub server did not come up on {url}")
+
+
+# ---------------- Driver ----------------
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    return float(np.percentile(values, p)) if values else None
+
+
+def run_level(
+    clients: Any,
+    settings: Dict[str, Any],
+    concurrency: int,
+    duration: float,
+    stream: bool,
+) -> Dict[str, Any]:
+    from core.chat_pipeline import ChatRequest, run_chat
+
+    lock = threading.Lock()
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    statuses: Dict[str, int] = {}
+    deadline = time.monotonic() + duration
+
+    def worker(n: int) -> None:
+        rnd = random.Random(n)
+        # One user per thread, like one browser session per Streamlit script thread
+        user_id = str(uuid.uuid4())
+        conversation_id = str(uuid.uuid4())
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            first: List[float] = []
+
+            def emit(kind: str, data: Any) -> None:
+                if kind == "delta" and not first:
+                    first.append(time.perf_counter())
+
+            try:
+                status = run_chat(
+                    clients,
+                    ChatRequest(user_id=user_id, conversation_id=conversation_id, prompt=rnd.choice(PROMPTS)),
+                    settings,
+                    stream=stream,
+                    emit=emit,
+                ).status
+            except Exception as e:
+                status = f"error: {type(e).__name__}"
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == "ok":
+                    latencies.append(elapsed)
+                    if first:
+                        ttfts.append((first[0] - t0) * 1000.0)
+
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t_start
+
+    return {
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "ok": len(latencies),
+        "statuses": statuses,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": _pct(latencies, 50),
+        "p95_ms": _pct(latencies, 95),
+        "p99_ms": _pct(latencies, 99),
+        "ttft_p50_ms": _pct(ttfts, 50),
+        "ttft_p95_ms": _pct(ttfts, 95),
+    }
+
+
+def print_curve(rows: List[Dict[str, Any]]) -> None:
+    def fmt(v: Optional[float]) -> str:
+        return f"{v:9.0f}" if v is not None else f"{'—':>9}"
+
+    print(f"{'conc':>5}{'reqs':>7}{'ok':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft50':>9}{'ttft95':>9}  errors")
+    peak = max((r["rps"] for r in rows), default=0.0) or 1.0
+    for r in rows:
+        errors = {k: v for k, v in r["statuses"].items() if k != "ok"}
+        bar = "#" * int(round(20 * r["rps"] / peak))
+        print(
+            f"{r['concurrency']:>5}{r['requests']:>7}{r['ok']:>7}{r['rps']:>8.2f}"
+            f"{fmt(r['p50_ms'])}{fmt(r['p95_ms'])}{fmt(r['p99_ms'])}{fmt(r['ttft_p50_ms'])}{fmt(r['ttft_p95_ms'])}"
+            f"  {errors or ''} {bar}"
+        )
+
+
+def sizing(rows: List[Dict[str, Any]], slo_ms: float, target_rps: Optional[float], coalesce: bool = False) -> None:
+    within = [r for r in rows if r["p95_ms"] is not None and r["p95_ms"] <= slo_ms and r["ok"] == r["requests"]]
+    if not within:
+        print(f"\nno level kept p95 <= {slo_ms:.0f} ms without errors")
+        return
+    best = max(within, key=lambda r: r["rps"])
+    # With coalescing on, identical prompts from the small pool share one answer: an upper bound.
+    label = f" (coalesced over {len(PROMPTS)} prompts, not a capacity figure)" if coalesce else ""
+    print(
+        f"\nper replica within p95 <= {slo_ms:.0f} ms{label}: {best['rps']:.2f} req/s "
+        f"at {best['concurrency']} concurrent users"
+    )
+    if target_rps and not coalesce:
+        print(f"replicas for {target_rps:.1f} req/s: {int(np.ceil(target_rps / best['rps']))}")
+
+
+def run(args: argparse.Namespace) -> None:
+    proc = None
+    stub_url = args.stub_url
+    if not stub_url:
+        proc = start_stub_process(args)
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+    try:
+        # Must be set before core.supabase_client is imported: it builds its client at import time.
+        fake_key = "stub.stub.stub"
+        os.environ["SUPABASE_URL"] = stub_url
+        os.environ["SUPABASE_ANON_KEY"] = fake_key
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = fake_key
+        os.environ["CHAT_COALESCE"] = "1" if args.coalesce else "0"
+        os.environ.setdefault("EVENTS_SPILL_PATH", os.path.join(tempfile.gettempdir(), "loadgen_events_spill.jsonl"))
+        os.environ.pop("OTEL_EXPORTER_OTLP_ENDPOINT", None)
+
+        from anthropic import Anthropic
+        from openai import OpenAI
+
+        from core.chat_pipeline import ChatClients
+        from core.model_settings import get_model_settings
+
+        clients = ChatClients(
+            oai=OpenAI(api_key="stub", base_url=f"{stub_url}/v1", max_retries=0),
+            claude=Anthropic(api_key="stub", base_url=stub_url, max_retries=0),
+        )
+        settings = dict(get_model_settings())
+        settings.update(rerank_method=args.rerank)
+
+        print(f"stubs at {stub_url}; {'streaming' if args.stream else 'non-streaming'} answers; "
+              f"coalescing {'on' if args.coalesce else 'off'}; {args.duration:.0f}s per level", flush=True)
+        run_level(clients, settings, 1, args.warmup, args.stream)
+        rows: List[Dict[str, Any]] = []
+        for c in args.concurrency:
+            rows.append(run_level(clients, settings, c, args.duration, args.stream))
+            print(f"  {c:>3} concurrent: {rows[-1]['rps']:.2f} req/s", flush=True)
+        print()
+        print_curve(rows)
+        sizing(rows, args.slo_ms, args.target_rps, args.coalesce)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"stub": _stub_flags(args), "stream": args.stream, "coalesce": args.coalesce, "levels": rows},
+                    f,
+                    indent=2,
+                )
+    finally:
+        if proc is not None:
+            proc.terminate()
+
+
+def _add_stub_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--embed-ms", type=float, default=120.0)
+    ap.add_argument("--db-ms", type=float, default=15.0, help="PostgREST table requests")
+    ap.add_argument("--rpc-ms", type=float, default=60.0, help="match_sections / match_sections_lexical")
+    ap.add_argument("--ttft-ms", type=float, default=700.0, help="Claude time to first token")
+    ap.add_argument("--token-ms", type=float, default=12.0, help="Claude time per streamed token")
+    ap.add_argument("--answer-tokens", type=int, default=250)
+    ap.add_argument("--jitter", type=float, default=0.2, help="Uniform ± fraction applied to every delay")
+    ap.add_argument("--dims", type=int, default=1536)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("stubs", help="Serve the stub APIs")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    _add_stub_args(s)
+
+    r = sub.add_parser("run", help="Drive run_chat at increasing concurrency")
+    r.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    r.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    r.add_argument("--warmup", type=float, default=3.0)
+    r.add_argument("--stream", action="store_true", help="Stream answers (time to first token is reported)")
+    r.add_argument("--rerank", default="none", help="rerank_method for the run")
+    r.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Let identical concurrent questions share an answer (the prompt pool is small, so most do)",
+    )
+    r.add_argument("--stub-url", help="Use already running stubs instead of starting them")
+    r.add_argument("--stub-port", type=int, default=8765)
+    r.add_argument("--slo-ms", type=float, default=10000.0, help="p95 latency target for the sizing line")
+    r.add_argument("--target-rps", type=float, help="Expected peak answers/sec, for a replica count")
+    r.add_argument("--json", help="Write the curve here")
+    _add_stub_args(r)
+
+    args = ap.parse_args()
+    if args.cmd == "stubs":
+        serve_stubs(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
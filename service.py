@@ -0,0 +1,253 @@
+"""Headless chat API: the Streamlit chat answer path (core.chat_pipeline) over HTTP.
+
+    POST /v1/chat     Authorization: Bearer <Supabase access token>
+                      {"prompt": "...", "conversation_id": "...", "lang": "pt", "stream": true,
+                       "document_ids": ["..."]}
+    GET  /health
+
+With "stream": true (default) the response is text/event-stream, one SSE event per pipeline
+event (accepted, generating, delta, reset, done; error if the pipeline raised). Otherwise the
+final ChatResult is returned as JSON (400 rejected, 429 rate limited). Omit conversation_id to
+start a new conversation; its id comes back in every response. "lang" is the language of the
+previous answer (the `lang` of the last done event), which keeps PT/ES sticky without any
+per-replica session state. "document_ids" restricts retrieval to those documents. Malformed
+fields (non-UUID ids, a non-boolean "stream") are rejected with 400; a Supabase error while
+loading the conversation is a 502.
+
+The pipeline is blocking (supabase-py, SDK clients), so each request runs in a thread pool
+(CHAT_SERVICE_WORKERS) and its events are handed to the event loop. Run with:
+
+    python service.py                       # or: uvicorn service:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+# Load .env locally (Render already injects env vars, so this is safe)
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from core.chat_pipeline import MAX_PROMPT_LENGTH, ChatClients, ChatRequest, ChatResult, run_chat
+from core.model_settings import get_model_settings
+from core.supabase_client import auth_user_from_access_token, ensure_profile, svc
+
+CHAT_SERVICE_WORKERS = int(os.environ.get("CHAT_SERVICE_WORKERS", "32"))
+CHAT_SERVICE_CORS_ORIGINS = [o.strip() for o in os.environ.get("CHAT_SERVICE_CORS_ORIGINS", "").split(",") if o.strip()]
+# A verified access token is trusted for this long before asking Supabase Auth again.
+AUTH_CACHE_SECONDS = 60
+# SSE comment sent while the pipeline is quiet (retrieval, time to first token) so proxies keep the stream open.
+SSE_KEEPALIVE_SECONDS = 15.0
+HISTORY_MESSAGES = 20
+
+clients = ChatClients.from_env()
+_pool = ThreadPoolExecutor(max_workers=CHAT_SERVICE_WORKERS, thread_name_prefix="chat")
+_auth_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _run_blocking(fn: Any, *args: Any) -> "asyncio.Future[Any]":
+    # A fresh context per call: the tracer keeps the active trace in contextvars.
+    ctx = contextvars.Context()
+    return asyncio.get_running_loop().run_in_executor(_pool, lambda: ctx.run(fn, *args))
+
+
+# ---------------- Auth ----------------
+
+def _verify_token(token: str) -> Dict[str, Any]:
+    user = auth_user_from_access_token(token)
+    ensure_profile(user["id"], user.get("email") or "")
+    return user
+
+
+async def authenticate(request: Request) -> Optional[Dict[str, Any]]:
+    header = request.headers.get("authorization") or ""
+    if not header.lower().startswith("bearer "):
+        return None
+    token = header[7:].strip()
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    cached = _auth_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    try:
+        user = await _run_blocking(_verify_token, token)
+    except Exception:
+        return None
+    if len(_auth_cache) > 10000:
+        for k in [k for k, (exp, _) in _auth_cache.items() if exp <= now]:
+            _auth_cache.pop(k, None)
+    _auth_cache[key] = (now + AUTH_CACHE_SECONDS, user)
+    return user
+
+
+# ---------------- Conversations ----------------
+
+def _prepare(user_id: str, body: Dict[str, Any]) -> Optional[ChatRequest]:
+    """Resolve (or create) the conversation and load its recent messages. None if not the user's."""
+    cid = body.get("conversation_id")
+    if cid:
+        owned = (
+            svc.table("conversations").select("id").eq("id", cid).eq("user_id", user_id).limit(1).execute().data
+        )
+        if not owned:
+            return None
+        rows = (
+            svc.table("messages")
+            .select("role,content")
+            .eq("conversation_id", cid)
+            .order("created_at", desc=True)
+            .limit(HISTORY_MESSAGES)
+            .execute()
+            .data
+            or []
+        )
+        history = rows[::-1]
+    else:
+        r = svc.table("conversations").insert({"user_id": user_id, "title": "Chat"}).execute()
+        cid = r.data[0]["id"]
+        history = []
+    return ChatRequest(
+        user_id=user_id,
+        conversation_id=cid,
+        prompt=body["prompt"],
+        history=history,
+        prev_lang=body.get("lang") if body.get("lang") in ("en", "pt", "es") else None,
+        filter_document_ids=body.get("document_ids") or None,
+    )
+
+
+# ---------------- Streaming ----------------
+
+def _sse(kind: str, data: Any) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _event_stream(chat: ChatRequest) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+
+    def emit(kind: str, data: Any) -> None:
+        if isinstance(data, ChatResult):
+            data = data.to_dict()
+        loop.call_soon_threadsafe(queue.put_nowait, (kind, data))
+
+    def work() -> None:
+        try:
+            run_chat(clients, chat, get_model_settings(), stream=True, emit=emit)
+        except Exception as e:
+            emit("error", {"error": f"{type(e).__name__}: {e}"})
+
+    _run_blocking(work)
+    yield _sse("conversation", {"conversation_id": chat.conversation_id})
+    while True:
+        try:
+            kind, data = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        yield _sse(kind, data)
+        if kind in ("done", "error"):
+            return
+
+
+# ---------------- Routes ----------------
+
+def _is_uuid(value: Any) -> bool:
+    # Checked here: a malformed id would otherwise fail the uuid[] cast inside the RPC.
+    if not isinstance(value, str):
+        return False
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+async def chat(request: Request) -> Response:
+    user = await authenticate(request)
+    if not user:
+        return JSONResponse({"error": "invalid or missing bearer token"}, status_code=401)
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "body must be JSON"}, status_code=400)
+    prompt = (body.get("prompt") or "").strip() if isinstance(body, dict) else ""
+    if not prompt:
+        return JSONResponse({"error": "prompt is required"}, status_code=400)
+    if len(prompt) > MAX_PROMPT_LENGTH:
+        return JSONResponse(
+            {"error": f"Message too long. Please limit your message to {MAX_PROMPT_LENGTH} characters."},
+            status_code=400,
+        )
+    doc_ids = body.get("document_ids")
+    if doc_ids is not None and not (isinstance(doc_ids, list) and all(_is_uuid(d) for d in doc_ids)):
+        return JSONResponse({"error": "document_ids must be a list of document UUIDs"}, status_code=400)
+    cid = body.get("conversation_id")
+    if cid not in (None, "") and not _is_uuid(cid):
+        return JSONResponse({"error": "conversation_id must be a conversation UUID"}, status_code=400)
+    stream = body.get("stream", True)
+    if not isinstance(stream, bool):
+        return JSONResponse({"error": "stream must be true or false"}, status_code=400)
+    body["prompt"] = prompt
+
+    try:
+        chat_request = await _run_blocking(_prepare, user["id"], body)
+    except Exception as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=502)
+    if chat_request is None:
+        return JSONResponse({"error": "conversation not found"}, status_code=404)
+
+    if stream:
+        return StreamingResponse(
+            _event_stream(chat_request),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        result = await _run_blocking(run_chat, clients, chat_request, get_model_settings())
+    except Exception as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=502)
+    payload = {"conversation_id": chat_request.conversation_id, **result.to_dict()}
+    if result.status == "rate_limited":
+        return JSONResponse(payload, status_code=429, headers={"Retry-After": str(result.retry_after or 1)})
+    return JSONResponse(payload, status_code=400 if result.status == "rejected" else 200)
+
+
+async def health(request: Request) -> Response:
+    return JSONResponse({"ok": True})
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/chat", chat, methods=["POST"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=CHAT_SERVICE_CORS_ORIGINS,
+            allow_methods=["POST", "GET"],
+            allow_headers=["Authorization", "Content-Type"],
+        )
+    ],
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", "8080")))
@@ -1,22 +1,35 @@
 import os
 import time
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from openai import OpenAI
 
 from core.supabase_client import (
     storage_download,
     update_document_status,
-    insert_sections_with_embeddings,
+    list_section_hashes,
+    write_document_sections,
     create_event,
     svc,
 )
-from core.pdf_extract import build_sections_from_pdf
+from core.chunking import chunk_sections
+from core.llm import overlap_tokens
+from core.pdf_extract import Section, iter_sections_from_pdf
+from core.text_extract import iter_sections_from_markdown, iter_sections_from_text, iter_text_lines
 from core.env_validator import get_required_env, get_optional_env
+from core.utils import sha256_bytes
 
 OPENAI_API_KEY = get_required_env("OPENAI_API_KEY", "OpenAI API key for embeddings")
 EMBED_MODEL = get_optional_env("EMBEDDING_MODEL", "text-embedding-3-small")  # 1536 dims
 
+# Sections are embedded in batches as the extractor yields them.
+EMBED_BATCH_SIZE = 64
+
+# Token budget per stored section (see core/chunking.py)
+CHUNK_MAX_TOKENS = int(get_optional_env("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(get_optional_env("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_MIN_TOKENS = int(get_optional_env("CHUNK_MIN_TOKENS", "48"))
+
 client = OpenAI(api_key=OPENAI_API_KEY)
 
 
@@ -47,49 +60,131 @@ def ext_from_doc(doc: dict) -> str:
     return (ext or "").lower()
 
 
-def build_sections_payload_from_bytes(file_bytes: bytes, doc: dict) -> List[dict]:
+def iter_sections_payload_from_bytes(file_bytes: bytes, doc: dict) -> Iterator[dict]:
     filename = doc.get("filename") or "document"
     ext = ext_from_doc(doc)
 
-    if ext in [".md", ".txt"]:
-        text = file_bytes.decode("utf-8", errors="replace").strip()
-        if not text:
-            raise RuntimeError("Empty text file.")
-        return [{
-            "path": filename,
-            "page_start": 1,
-            "page_end": 1,
-            "content": text[:8000],
-        }]
-
-    # Default: treat as PDF
-    tmp_path = f"/tmp/{doc['id']}.pdf"
-    with open(tmp_path, "wb") as f:
-        f.write(file_bytes)
-
-    sections = build_sections_from_pdf(tmp_path, filename)
-    if not sections:
-        raise RuntimeError("No text extracted from PDF. It may be scanned/protected.")
-
-    payload: List[dict] = []
-    for s in sections:
+    sections: Iterator[Section]
+    if ext == ".md":
+        sections = iter_sections_from_markdown(iter_text_lines(file_bytes), filename)
+    elif ext == ".txt":
+        sections = iter_sections_from_text(iter_text_lines(file_bytes), filename)
+    else:
+        # Default: treat as PDF
+        tmp_path = f"/tmp/{doc['id']}.pdf"
+        with open(tmp_path, "wb") as f:
+            f.write(file_bytes)
+        sections = iter_sections_from_pdf(tmp_path, filename)
+
+    emitted = 0
+    for s in chunk_sections(
+        sections,
+        max_tokens=CHUNK_MAX_TOKENS,
+        overlap_tokens=CHUNK_OVERLAP_TOKENS,
+        min_tokens=CHUNK_MIN_TOKENS,
+    ):
         txt = (s.text or "").strip()
         if not txt:
             continue
-        if len(txt) > 8000:
-            txt = txt[:8000]
-        payload.append({
+        emitted += 1
+        yield {
             "path": s.path,
             "page_start": s.page_start,
             "page_end": s.page_end,
             "content": txt,
-        })
+            # ingest-time token set for the chat page's overlap filter
+            "tokens": sorted(overlap_tokens(txt)),
+        }
+
+    if not emitted:
+        if ext in [".md", ".txt"]:
+            raise RuntimeError("Empty text file.")
+        raise RuntimeError("No text extracted from PDF. It may be scanned/protected.")
+
 
-    if not payload:
-        raise RuntimeError("All extracted sections were empty after cleaning.")
+def build_sections_payload_from_bytes(file_bytes: bytes, doc: dict) -> List[dict]:
+    return list(iter_sections_payload_from_bytes(file_bytes, doc))
+
+
+def embed_sections_payload(sections: Iterator[dict]) -> List[dict]:
+    """Embed sections in batches while the extractor is still producing later ones."""
+    payload: List[dict] = []
+    batch: List[dict] = []
+
+    def flush() -> None:
+        vectors = embed_texts([s["content"] for s in batch])
+        for s, v in zip(batch, vectors):
+            s["embedding"] = v
+        payload.extend(batch)
+        batch.clear()
+
+    for s in sections:
+        batch.append(s)
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
     return payload
 
 
+def section_hash(section: dict) -> str:
+    """Stable per-section content hash. Includes the embedding model so a model switch re-embeds."""
+    key = "\x1f".join([
+        EMBED_MODEL,
+        section.get("path") or "",
+        str(section.get("page_start")),
+        str(section.get("page_end")),
+        section["content"],
+    ])
+    return sha256_bytes(key.encode("utf-8"))
+
+
+def sync_sections(doc_id: str, sections: Iterator[dict]) -> Dict[str, int]:
+    """
+    Bring a document's rows in `sections` in line with freshly extracted sections.
+
+    Sections whose hash already exists are left alone; only new ones are embedded and inserted,
+    and rows that no longer match anything are dropped in the same swap. Without the content_hash
+    column this falls back to delete-all + re-insert.
+    """
+    existing = list_section_hashes(doc_id)
+    if existing is None:
+        payload = embed_sections_payload(sections)
+        write_document_sections(doc_id, payload, delete_all=True)
+        return {"sections": len(payload), "embedded": len(payload), "kept": 0, "deleted": 0}
+
+    by_hash: Dict[str, List[str]] = {}
+    stale: List[str] = []
+    for row in existing:
+        if row.get("content_hash"):
+            by_hash.setdefault(row["content_hash"], []).append(row["id"])
+        else:
+            stale.append(row["id"])  # rows from before hashing was introduced
+
+    stats = {"sections": 0, "embedded": 0, "kept": 0, "deleted": 0}
+
+    def changed() -> Iterator[dict]:
+        for s in sections:
+            stats["sections"] += 1
+            h = section_hash(s)
+            ids = by_hash.get(h)
+            if ids:
+                ids.pop()
+                stats["kept"] += 1
+                continue
+            s["content_hash"] = h
+            yield s
+
+    new_payload = embed_sections_payload(changed())
+    stats["embedded"] = len(new_payload)
+
+    # New rows and deletions land together (see write_document_sections).
+    stale.extend(i for ids in by_hash.values() for i in ids)
+    write_document_sections(doc_id, new_payload, delete_ids=stale)
+    stats["deleted"] = len(stale)
+    return stats
+
+
 def main() -> None:
     print("Worker started. Polling for documents…")
     while True:
@@ -107,22 +202,20 @@ def main() -> None:
         try:
             update_document_status(doc_id, "processing")
             create_event(user_id, "worker_processing_start", doc_id, {"filename": filename})
+            started = time.monotonic()
 
             file_bytes = storage_download(bucket, path)
 
-            sections_payload = build_sections_payload_from_bytes(file_bytes, doc)
-
-            texts = [s["content"] for s in sections_payload]
-            vectors = embed_texts(texts)
-            for i, v in enumerate(vectors):
-                sections_payload[i]["embedding"] = v
-
-            svc.table("sections").delete().eq("document_id", doc_id).execute()
-            insert_sections_with_embeddings(doc_id, sections_payload)
+            stats = sync_sections(doc_id, iter_sections_payload_from_bytes(file_bytes, doc))
 
             update_document_status(doc_id, "ready")
-            create_event(user_id, "worker_processing_done", doc_id, {"sections": len(sections_payload), "filename": filename})
-            print(f"Processed {filename} ({doc_id}) sections={len(sections_payload)}")
+            # seconds feeds the worker throughput rollup (Admin → Performance)
+            elapsed = round(time.monotonic() - started, 2)
+            create_event(user_id, "worker_processing_done", doc_id, {**stats, "seconds": elapsed, "filename": filename})
+            print(
+                f"Processed {filename} ({doc_id}) sections={stats['sections']} "
+                f"embedded={stats['embedded']} kept={stats['kept']}"
+            )
 
         except Exception as e:
             update_document_status(doc_id, "failed", error=str(e))